@@ -14,6 +14,66 @@ def create_app(config_name='default'):
     # 初始化扩展
     db.init_app(app)
     
+    # 初始化环境数据写缓冲
+    from app.services.ingest_buffer import ingest_buffer
+    ingest_buffer.init_app(app)
+    
+    # 初始化最新读数缓存
+    from app.services.latest_cache import latest_cache
+    latest_cache.init_app(app)
+    
+    # 初始化列表总数缓存
+    from app.services.list_totals import list_totals
+    list_totals.init_app(app)
+    
+    # 初始化实时事件分发中心
+    from app.services.event_hub import event_hub
+    event_hub.init_app(app)
+    
+    # 初始化长连接名额（实时推送、设备指令长轮询）
+    from app.utils.long_requests import long_requests
+    long_requests.init_app(app)
+    
+    # 初始化配置缓存（阈值、联动配置、设备配置）
+    from app.services.config_cache import config_cache
+    config_cache.init_app(app)
+    
+    # 初始化环境告警引擎（阈值缓存、告警状态）
+    from app.services.alert_engine import alert_engine
+    alert_engine.init_app(app)
+    
+    # 初始化投喂记录上传去重集合
+    from app.services.feeding_ingest import recent_event_ids
+    recent_event_ids.init_app(app)
+    
+    # 初始化投喂算法因子缓存
+    from app.services.feeding_algorithm import feeding_algorithm
+    feeding_algorithm.init_app(app)
+    
+    # 注册请求提交计数（响应头 X-DB-Commits）
+    from app.utils.unit_of_work import init_unit_of_work
+    init_unit_of_work(app)
+    
+    # 初始化统计计数器（注册会话事件、启动定期校准）
+    from app.services.stat_counters import stat_counters
+    stat_counters.init_app(app)
+    
+    # 启动设备心跳超时清扫任务
+    from app.services.liveness import device_liveness
+    device_liveness.init_app(app)
+    
+    # 初始化设备指令队列（提交后唤醒长轮询、启动过期清扫任务）
+    from app.services.command_queue import command_queue
+    command_queue.init_app(app)
+    
+    # 启动分区维护与数据保留任务
+    from app.services.partitions import partition_manager
+    partition_manager.init_app(app)
+    
+    # 启动投喂计划调度器
+    from app.services.feeding_scheduler import feeding_scheduler
+    feeding_scheduler.init_app(app)
+    
     # 配置CORS，支持跨域携带cookie
     CORS(app, 
          origins=app.config['CORS_ORIGINS'],
@@ -29,6 +89,7 @@ def create_app(config_name='default'):
     from app.routes.alerts import alerts_bp
     from app.routes.logs import logs_bp
     from app.routes.statistics import statistics_bp
+    from app.routes.stream import stream_bp
     
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(environment_bp, url_prefix='/api/environment')
@@ -37,6 +98,7 @@ def create_app(config_name='default'):
     app.register_blueprint(alerts_bp, url_prefix='/api/alerts')
     app.register_blueprint(logs_bp, url_prefix='/api/logs')
     app.register_blueprint(statistics_bp, url_prefix='/api/statistics')
+    app.register_blueprint(stream_bp, url_prefix='/api/stream')
     
     # 注册错误处理
     register_error_handlers(app)
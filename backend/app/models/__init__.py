@@ -1,22 +1,38 @@
 from app.models.user import User
-from app.models.environment import EnvironmentData, EnvironmentThreshold
-from app.models.device import Device, DeviceConfig, DeviceLinkageConfig
+from app.models.environment import (
+    EnvironmentData, EnvironmentThreshold,
+    EnvironmentRollupMinute, EnvironmentRollupHour, EnvironmentRollupDay
+)
+from app.models.device import Device, DeviceConfig, DeviceLinkageConfig, DeviceCommand
 from app.models.feeding import FeedingPlan, FeedingHistory
 from app.models.alert import Alert, AlertNotificationSetting
 from app.models.log import Log
 from app.models.pond import Pond
+from app.models.lease import ServiceLease
+from app.models.stat_counter import StatCounter
+from app.models.config_version import ConfigVersion
+from app.models.stream_event import StreamEvent, StreamListener
 
 __all__ = [
     'User',
     'EnvironmentData',
     'EnvironmentThreshold', 
+    'EnvironmentRollupMinute',
+    'EnvironmentRollupHour',
+    'EnvironmentRollupDay',
     'Device',
     'DeviceConfig',
     'DeviceLinkageConfig',
+    'DeviceCommand',
     'FeedingPlan',
     'FeedingHistory',
     'Alert',
     'AlertNotificationSetting',
     'Log',
-    'Pond'
+    'Pond',
+    'ServiceLease',
+    'StatCounter',
+    'ConfigVersion',
+    'StreamEvent',
+    'StreamListener'
 ]
@@ -5,6 +5,12 @@ from datetime import datetime
 class Alert(db.Model):
     """告警表"""
     __tablename__ = 'alerts'
+    __table_args__ = (
+        # 告警引擎按来源和指标查找未处理的告警
+        db.Index('idx_alerts_source_metric', 'device_id', 'pond_id', 'metric', 'resolved'),
+        # 同一来源和指标同时最多一条未处理的引擎告警（多进程并发评估时由数据库保证）
+        db.UniqueConstraint('open_key', name='uq_alerts_open_key'),
+    )
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     title = db.Column(db.String(100), nullable=False)
@@ -15,6 +21,10 @@ class Alert(db.Model):
     resolved = db.Column(db.Boolean, nullable=False, default=False, index=True)
     resolved_at = db.Column(db.DateTime, nullable=True)
     resolved_by = db.Column(db.String(50), nullable=True)
+    device_id = db.Column(db.String(50), nullable=True)  # 触发告警的设备（告警引擎产生的告警）
+    pond_id = db.Column(db.Integer, nullable=True)  # 触发告警的鱼塘
+    metric = db.Column(db.String(30), nullable=True)  # 越限指标: temperature, dissolved_oxygen, ph
+    open_key = db.Column(db.String(120), nullable=True)  # 未处理的引擎告警的来源键，告警处理后置空
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
     
     def to_dict(self):
@@ -28,9 +38,24 @@ class Alert(db.Model):
             'description': self.description,
             'resolved': self.resolved,
             'resolved_at': self.resolved_at.isoformat() if self.resolved_at else None,
-            'resolved_by': self.resolved_by
+            'resolved_by': self.resolved_by,
+            'device_id': self.device_id,
+            'pond_id': self.pond_id,
+            'metric': self.metric
         }
     
+    @staticmethod
+    def make_open_key(device_id, pond_id, metric):
+        """告警来源键: 设备:鱼塘:指标"""
+        return f'{device_id or ""}:{"" if pond_id is None else pond_id}:{metric}'
+    
+    def resolve(self, resolved_by, resolved_at=None):
+        """标记为已处理，并释放来源键，同一来源之后可以再次产生告警"""
+        self.resolved = True
+        self.resolved_at = resolved_at or datetime.now()
+        self.resolved_by = resolved_by
+        self.open_key = None
+    
     def __repr__(self):
         return f'<Alert {self.id}>'
 
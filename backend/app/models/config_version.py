@@ -0,0 +1,22 @@
+from app import db
+from datetime import datetime
+
+
+class ConfigVersion(db.Model):
+    """配置版本表（配置修改时递增，各进程轮询版本号使本地配置缓存失效）"""
+    __tablename__ = 'config_versions'
+    
+    name = db.Column(db.String(50), primary_key=True)  # 配置命名空间，如 thresholds
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
+    
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'name': self.name,
+            'version': self.version,
+            'updatedAt': self.updated_at.isoformat() if self.updated_at else None
+        }
+    
+    def __repr__(self):
+        return f'<ConfigVersion {self.name}={self.version}>'
@@ -6,6 +6,10 @@ import json
 class Device(db.Model):
     """设备表"""
     __tablename__ = 'devices'
+    __table_args__ = (
+        # 心跳超时清扫: WHERE status = 'online' AND last_seen < 截止时间
+        db.Index('idx_devices_status_last_seen', 'status', 'last_seen'),
+    )
     
     id = db.Column(db.String(50), primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -13,6 +17,7 @@ class Device(db.Model):
     status = db.Column(db.String(20), nullable=False, default='offline', index=True)
     active = db.Column(db.Boolean, nullable=False, default=True)
     location = db.Column(db.String(100), nullable=False, index=True)
+    last_seen = db.Column(db.DateTime, nullable=True)  # 最近心跳时间（按超时时间的三分之一续写，未接入心跳为空）
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
     
@@ -20,6 +25,7 @@ class Device(db.Model):
     configs = db.relationship('DeviceConfig', backref='device', lazy='dynamic', cascade='all, delete-orphan')
     feeding_plans = db.relationship('FeedingPlan', backref='device', lazy='dynamic', cascade='all, delete-orphan')
     feeding_histories = db.relationship('FeedingHistory', backref='device', lazy='dynamic', cascade='all, delete-orphan')
+    commands = db.relationship('DeviceCommand', backref='device', lazy='dynamic', cascade='all, delete-orphan')
     
     def to_dict(self):
         """转换为字典"""
@@ -30,6 +36,7 @@ class Device(db.Model):
             'status': self.status,
             'active': self.active,
             'location': self.location,
+            'last_seen': self.last_seen.isoformat() if self.last_seen else None,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'last_updated': self.updated_at.isoformat() if self.updated_at else None
         }
@@ -45,9 +52,12 @@ class DeviceConfig(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     device_id = db.Column(db.String(50), db.ForeignKey('devices.id', ondelete='CASCADE'), nullable=False)
     config = db.Column(db.JSON, nullable=False, default=dict)
+    revision = db.Column(db.Integer, nullable=False, default=1)  # 修改次数，每次更新加1（用于 ETag）
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
     
+    __mapper_args__ = {'version_id_col': revision}
+    
     def to_dict(self):
         """转换为字典"""
         return {
@@ -72,8 +82,11 @@ class DeviceLinkageConfig(db.Model):
     temp_threshold = db.Column(db.Float, nullable=False, default=25.0)
     oxygen_threshold = db.Column(db.Float, nullable=False, default=6.0)
     ph_threshold = db.Column(db.Float, nullable=False, default=7.5)
+    revision = db.Column(db.Integer, nullable=False, default=1)  # 修改次数，每次更新加1（用于 ETag）
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
     
+    __mapper_args__ = {'version_id_col': revision}
+    
     def to_dict(self):
         """转换为字典"""
         return {
@@ -88,3 +101,59 @@ class DeviceLinkageConfig(db.Model):
     
     def __repr__(self):
         return f'<DeviceLinkageConfig {self.id}>'
+
+
+class DeviceCommand(db.Model):
+    """设备指令队列表"""
+    __tablename__ = 'device_commands'
+    __table_args__ = (
+        # 设备拉取指令: WHERE device_id = ? AND status IN (...) ORDER BY id
+        db.Index('idx_device_commands_device_status', 'device_id', 'status', 'id'),
+        # 过期清扫: WHERE status IN (...) AND expires_at <= 当前时间
+        db.Index('idx_device_commands_status_expires', 'status', 'expires_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    device_id = db.Column(db.String(50), db.ForeignKey('devices.id', ondelete='CASCADE'), nullable=False)
+    command = db.Column(db.String(50), nullable=False)  # feed
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sent, done, failed, expired
+    attempts = db.Column(db.Integer, nullable=False, default=0)  # 已下发次数
+    history_id = db.Column(db.Integer, db.ForeignKey('feeding_history.id', ondelete='SET NULL'))  # 对应的投喂记录
+    result = db.Column(db.String(255))  # 设备回执说明
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    sent_at = db.Column(db.DateTime)  # 最近一次下发时间
+    expires_at = db.Column(db.DateTime, nullable=False)
+    completed_at = db.Column(db.DateTime)
+    
+    history = db.relationship('FeedingHistory')
+    
+    def to_message(self):
+        """下发给设备的指令内容"""
+        return {
+            'id': self.id,
+            'command': self.command,
+            'payload': self.payload,
+            'attempt': self.attempts,
+            'expiresAt': self.expires_at.isoformat() if self.expires_at else None
+        }
+    
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'id': self.id,
+            'device_id': self.device_id,
+            'command': self.command,
+            'payload': self.payload,
+            'status': self.status,
+            'attempts': self.attempts,
+            'history_id': self.history_id,
+            'result': self.result,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
+    
+    def __repr__(self):
+        return f'<DeviceCommand {self.id}>'
@@ -5,8 +5,15 @@ from datetime import datetime
 class EnvironmentData(db.Model):
     """环境数据表"""
     __tablename__ = 'environment_data'
+    __table_args__ = (
+        # 按传感器/鱼塘的时间范围查询走复合索引
+        db.Index('idx_environment_data_device_timestamp', 'device_id', 'timestamp'),
+        db.Index('idx_environment_data_pond_timestamp', 'pond_id', 'timestamp'),
+    )
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    device_id = db.Column(db.String(50), nullable=True)  # 上报设备
+    pond_id = db.Column(db.Integer, nullable=True)  # 所属鱼塘
     timestamp = db.Column(db.DateTime, nullable=False, default=datetime.now, index=True)
     temperature = db.Column(db.Float, nullable=False)
     dissolved_oxygen = db.Column(db.Float, nullable=False)
@@ -18,6 +25,8 @@ class EnvironmentData(db.Model):
         """转换为字典"""
         return {
             'id': self.id,
+            'deviceId': self.device_id,
+            'pondId': self.pond_id,
             'timestamp': self.timestamp.isoformat() if self.timestamp else None,
             'temperature': self.temperature,
             'dissolvedOxygen': self.dissolved_oxygen,
@@ -29,6 +38,58 @@ class EnvironmentData(db.Model):
         return f'<EnvironmentData {self.id}>'
 
 
+class EnvironmentRollupMixin:
+    """环境数据聚合表公共字段（按时间桶汇总 avg/min/max/count）"""
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    device_id = db.Column(db.String(50), nullable=False, default='')  # 空字符串表示未标记设备
+    pond_id = db.Column(db.Integer, nullable=False, default=0)  # 0表示未标记鱼塘
+    bucket_start = db.Column(db.DateTime, nullable=False, index=True)
+    sample_count = db.Column(db.Integer, nullable=False, default=0)
+    temperature_sum = db.Column(db.Float, nullable=False, default=0)
+    temperature_min = db.Column(db.Float, nullable=False)
+    temperature_max = db.Column(db.Float, nullable=False)
+    dissolved_oxygen_sum = db.Column(db.Float, nullable=False, default=0)
+    dissolved_oxygen_min = db.Column(db.Float, nullable=False)
+    dissolved_oxygen_max = db.Column(db.Float, nullable=False)
+    ph_sum = db.Column(db.Float, nullable=False, default=0)
+    ph_min = db.Column(db.Float, nullable=False)
+    ph_max = db.Column(db.Float, nullable=False)
+    water_flow_sum = db.Column(db.Float, nullable=False, default=0)
+    water_flow_min = db.Column(db.Float, nullable=False)
+    water_flow_max = db.Column(db.Float, nullable=False)
+    
+    def __repr__(self):
+        return f'<{self.__class__.__name__} {self.bucket_start}>'
+
+
+class EnvironmentRollupMinute(EnvironmentRollupMixin, db.Model):
+    """环境数据分钟聚合表"""
+    __tablename__ = 'environment_rollup_minute'
+    __table_args__ = (
+        db.UniqueConstraint('device_id', 'pond_id', 'bucket_start', name='uq_environment_rollup_minute_key'),
+        db.Index('idx_environment_rollup_minute_pond', 'pond_id', 'bucket_start'),
+    )
+
+
+class EnvironmentRollupHour(EnvironmentRollupMixin, db.Model):
+    """环境数据小时聚合表"""
+    __tablename__ = 'environment_rollup_hour'
+    __table_args__ = (
+        db.UniqueConstraint('device_id', 'pond_id', 'bucket_start', name='uq_environment_rollup_hour_key'),
+        db.Index('idx_environment_rollup_hour_pond', 'pond_id', 'bucket_start'),
+    )
+
+
+class EnvironmentRollupDay(EnvironmentRollupMixin, db.Model):
+    """环境数据日聚合表"""
+    __tablename__ = 'environment_rollup_day'
+    __table_args__ = (
+        db.UniqueConstraint('device_id', 'pond_id', 'bucket_start', name='uq_environment_rollup_day_key'),
+        db.Index('idx_environment_rollup_day_pond', 'pond_id', 'bucket_start'),
+    )
+
+
 class EnvironmentThreshold(db.Model):
     """环境告警阈值表"""
     __tablename__ = 'environment_thresholds'
@@ -40,8 +101,11 @@ class EnvironmentThreshold(db.Model):
     dissolved_oxygen_max = db.Column(db.Float, nullable=False, default=8.0)
     ph_min = db.Column(db.Float, nullable=False, default=7.0)
     ph_max = db.Column(db.Float, nullable=False, default=8.0)
+    revision = db.Column(db.Integer, nullable=False, default=1)  # 修改次数，每次更新加1（用于 ETag）
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
     
+    __mapper_args__ = {'version_id_col': revision}
+    
     def to_dict(self):
         """转换为字典"""
         return {
@@ -12,6 +12,7 @@ class FeedingPlan(db.Model):
     time = db.Column(db.Time, nullable=False)
     amount = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(20), nullable=False, default='active', index=True)
+    last_fired_at = db.Column(db.DateTime)  # 最近一次由调度器执行的计划时间
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
     
@@ -24,6 +25,7 @@ class FeedingPlan(db.Model):
             'time': self.time.strftime('%H:%M') if self.time else None,
             'amount': self.amount,
             'status': self.status,
+            'last_fired_at': self.last_fired_at.isoformat() if self.last_fired_at else None,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
     
@@ -34,14 +36,20 @@ class FeedingPlan(db.Model):
 class FeedingHistory(db.Model):
     """投喂历史表"""
     __tablename__ = 'feeding_history'
+    __table_args__ = (
+        # 设备批量上传投喂记录的幂等键，重传的记录按该唯一键冲突丢弃
+        db.UniqueConstraint('device_id', 'event_id', name='uq_feeding_history_device_event'),
+    )
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     device_id = db.Column(db.String(50), db.ForeignKey('devices.id', ondelete='CASCADE'), nullable=False)
     amount = db.Column(db.Float, nullable=False)
-    time = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    time = db.Column(db.DateTime, nullable=False, default=datetime.now, index=True)
     timestamp = db.Column(db.DateTime, nullable=False, default=datetime.now, index=True)  # 用于统计
     type = db.Column(db.String(20), nullable=False)  # auto, manual
     operator = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='done')  # pending（指令待设备确认）, done, failed, expired
+    event_id = db.Column(db.String(64))  # 设备上传记录的事件ID（服务端创建的记录为空）
     fish_type = db.Column(db.String(50))  # 鱼种
     fish_count = db.Column(db.Integer)  # 鱼群数量
     average_weight = db.Column(db.Float)  # 平均体重（克）
@@ -57,6 +65,8 @@ class FeedingHistory(db.Model):
             'timestamp': self.timestamp.isoformat() if self.timestamp else None,
             'type': self.type,
             'operator': self.operator,
+            'status': self.status,
+            'event_id': self.event_id,
             'fishType': self.fish_type,
             'fishCount': self.fish_count,
             'averageWeight': self.average_weight
@@ -0,0 +1,24 @@
+from app import db
+from datetime import datetime
+
+
+class ServiceLease(db.Model):
+    """后台服务租约表（多进程部署时保证同一后台任务只有一个执行者）"""
+    __tablename__ = 'service_leases'
+    
+    name = db.Column(db.String(50), primary_key=True)  # 租约名称，如 feeding_scheduler
+    owner = db.Column(db.String(100), nullable=False)  # 持有者标识（主机名:进程号:随机串）
+    expires_at = db.Column(db.DateTime, nullable=False)  # 租约到期时间
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
+    
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'name': self.name,
+            'owner': self.owner,
+            'expiresAt': self.expires_at.isoformat() if self.expires_at else None,
+            'updatedAt': self.updated_at.isoformat() if self.updated_at else None
+        }
+    
+    def __repr__(self):
+        return f'<ServiceLease {self.name}>'
@@ -0,0 +1,22 @@
+from app import db
+from datetime import datetime
+
+
+class StatCounter(db.Model):
+    """统计计数器表（由写入方在同一事务中增量维护，定期与实际行数校准）"""
+    __tablename__ = 'stat_counters'
+    
+    name = db.Column(db.String(100), primary_key=True)  # 计数器名称，如 devices.status.online
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
+    
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'name': self.name,
+            'value': self.value,
+            'updatedAt': self.updated_at.isoformat() if self.updated_at else None
+        }
+    
+    def __repr__(self):
+        return f'<StatCounter {self.name}={self.value}>'
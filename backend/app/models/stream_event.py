@@ -0,0 +1,38 @@
+from app import db
+from datetime import datetime
+
+
+class StreamEvent(db.Model):
+    """实时事件中转表（多进程部署时把本进程发布的事件转发给其他进程的订阅者，短期保留）"""
+    __tablename__ = 'stream_events'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    origin = db.Column(db.String(100), nullable=False)  # 发布进程标识，本进程发布的事件不再转发
+    type = db.Column(db.String(20), nullable=False)  # environment / alert
+    device_id = db.Column(db.String(50))
+    pond_id = db.Column(db.Integer)
+    payload = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now, index=True)
+
+    def to_event(self):
+        """转换为分发中心的事件结构"""
+        return {
+            'type': self.type,
+            'device_id': self.device_id,
+            'pond_id': self.pond_id,
+            'data': self.payload
+        }
+
+    def __repr__(self):
+        return f'<StreamEvent {self.id} {self.type}>'
+
+
+class StreamListener(db.Model):
+    """实时事件监听进程表（有订阅者的进程定期续期，发布方据此判断是否需要转发）"""
+    __tablename__ = 'stream_listeners'
+
+    owner = db.Column(db.String(100), primary_key=True)  # 进程标识（主机名:进程号:随机串）
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<StreamListener {self.owner}>'
@@ -1,8 +1,14 @@
 from flask import Blueprint, request, jsonify
 from app import db
 from app.models.alert import Alert, AlertNotificationSetting
-from app.models.log import Log
-from app.utils.decorators import login_required, get_current_username, get_current_user_id, get_client_ip
+from app.services.alert_engine import alert_engine
+from app.services.aggregation import bucket_count, count_by_conditions
+from app.services.event_hub import publish_alerts
+from app.services.trend import MAX_BUCKETS, parse_bucket_width
+from app.utils.decorators import login_required, get_current_username, get_current_user_id
+from app.utils.unit_of_work import unit_of_work, audit_log
+from app.utils.pagination import clamp_limit, keyset_paginate
+from app.utils.validators import ValidationError
 from datetime import datetime
 from sqlalchemy import func
 
@@ -17,6 +23,8 @@ def get_alerts():
     resolved = request.args.get('resolved')
     start_time = request.args.get('start_time')
     end_time = request.args.get('end_time')
+    limit = clamp_limit(request.args.get('limit', type=int), 200)
+    cursor = request.args.get('cursor')
     
     query = Alert.query
     
@@ -41,11 +49,15 @@ def get_alerts():
         except ValueError:
             pass
     
-    alerts = query.order_by(Alert.time.desc()).limit(200).all()
+    try:
+        alerts, next_cursor = keyset_paginate(query, (Alert.time, Alert.id), limit, cursor)
+    except ValidationError as e:
+        return jsonify({'success': False, 'message': e.message}), 400
     
     return jsonify({
         'success': True,
-        'data': [alert.to_dict() for alert in alerts]
+        'data': [alert.to_dict() for alert in alerts],
+        'next_cursor': next_cursor
     })
 
 
@@ -78,23 +90,12 @@ def resolve_alert(alert_id):
     
     try:
         username = get_current_username() or 'system'
-        alert.resolved = True
-        alert.resolved_at = datetime.now()
-        alert.resolved_by = username
+        alert.resolve(username)
         
-        db.session.commit()
+        with unit_of_work():
+            audit_log('告警管理', '处理告警', f'处理告警: {alert.title} (ID: {alert_id})', operator=username)
         
-        # 记录日志
-        log = Log(
-            level='INFO',
-            module='告警管理',
-            operator=username,
-            action='处理告警',
-            details=f'处理告警: {alert.title} (ID: {alert_id})',
-            ip=get_client_ip()
-        )
-        db.session.add(log)
-        db.session.commit()
+        publish_alerts([alert], 'resolved')
         
         return jsonify({'success': True, 'message': '告警已标记为已处理'})
     except Exception as e:
@@ -105,20 +106,57 @@ def resolve_alert(alert_id):
 @alerts_bp.route('/statistics', methods=['GET'])
 @login_required
 def get_alert_statistics():
-    """获取告警统计数据"""
-    total = Alert.query.count()
-    warning_count = Alert.query.filter(Alert.level == 'warning').count()
-    error_count = Alert.query.filter(Alert.level == 'error').count()
-    resolved_count = Alert.query.filter(Alert.resolved == True).count()
+    """获取告警统计数据（可按时间桶返回趋势）"""
+    start_time = request.args.get('start_time')
+    end_time = request.args.get('end_time')
+    bucket = request.args.get('bucket')
+    
+    where = []
+    start_dt = end_dt = None
+    if start_time:
+        try:
+            start_dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
+            where.append(Alert.time >= start_dt)
+        except ValueError:
+            start_dt = None
+    
+    if end_time:
+        try:
+            end_dt = datetime.fromisoformat(end_time.replace('Z', '+00:00'))
+            where.append(Alert.time <= end_dt)
+        except ValueError:
+            end_dt = None
+    
+    width = None
+    if bucket:
+        width = parse_bucket_width(bucket)
+        if width is None:
+            return jsonify({'success': False, 'message': '桶宽格式无效，示例: 30m, 6h, 2d, 1w'}), 400
+        end_dt = end_dt or datetime.now()
+        if start_dt is None:
+            # 未指定开始时间时按桶数往前推
+            count = request.args.get('buckets', 12, type=int)
+            if not count or count <= 0 or count > MAX_BUCKETS:
+                return jsonify({'success': False, 'message': f'桶数必须在1-{MAX_BUCKETS}之间'}), 400
+            start_dt = end_dt - width * count
+        elif bucket_count(start_dt, end_dt, width) > MAX_BUCKETS:
+            return jsonify({'success': False, 'message': f'时间范围内的桶数不能超过{MAX_BUCKETS}'}), 400
+    
+    # 各项计数在一次扫描中完成
+    counts, trend = count_by_conditions({
+        'warning': Alert.level == 'warning',
+        'error': Alert.level == 'error',
+        'resolved': Alert.resolved == True,
+        'unresolved': Alert.resolved == False
+    }, where, from_=Alert, time_column=Alert.time, start=start_dt, end=end_dt, width=width)
+    
+    data = dict(counts)
+    if trend is not None:
+        data['trend'] = trend
     
     return jsonify({
         'success': True,
-        'data': {
-            'total': total,
-            'warning': warning_count,
-            'error': error_count,
-            'resolved': resolved_count
-        }
+        'data': data
     })
 
 
@@ -136,6 +174,16 @@ def get_unresolved_count():
     })
 
 
+@alerts_bp.route('/engine', methods=['GET'])
+@login_required
+def get_alert_engine_stats():
+    """获取告警引擎运行指标"""
+    return jsonify({
+        'success': True,
+        'data': alert_engine.stats()
+    })
+
+
 @alerts_bp.route('/notifications', methods=['GET'])
 @login_required
 def get_notification_settings():
@@ -183,7 +231,9 @@ def update_notification_settings():
         setting.push = bool(data['push'])
     
     try:
-        db.session.commit()
+        with unit_of_work():
+            audit_log('告警管理', '更新告警通知设置',
+                      f'邮件: {setting.email}, 短信: {setting.sms}, 推送: {setting.push}')
         return jsonify({'success': True, 'message': '告警通知设置更新成功'})
     except Exception as e:
         db.session.rollback()
@@ -1,8 +1,8 @@
 from flask import Blueprint, request, jsonify, session
 from app import db
 from app.models.user import User
-from app.models.log import Log
-from app.utils.decorators import login_required, get_current_user_id, get_client_ip
+from app.utils.decorators import login_required, get_current_user_id
+from app.utils.unit_of_work import unit_of_work, audit_log
 from app.utils.validators import (
     validate_required, validate_email, validate_username, 
     validate_password, sanitize_string
@@ -49,16 +49,8 @@ def login():
     
     # 记录登录日志
     try:
-        log = Log(
-            level='INFO',
-            module='认证',
-            operator=user.username,
-            action='用户登录',
-            details=f'用户 {user.username} 登录成功',
-            ip=get_client_ip()
-        )
-        db.session.add(log)
-        db.session.commit()
+        with unit_of_work():
+            audit_log('认证', '用户登录', f'用户 {user.username} 登录成功', operator=user.username)
     except Exception:
         pass  # 日志记录失败不影响登录
     
@@ -114,19 +106,8 @@ def register():
         user = User(username=username, email=email)
         user.set_password(password)
         db.session.add(user)
-        db.session.commit()
-        
-        # 记录注册日志
-        log = Log(
-            level='INFO',
-            module='认证',
-            operator=username,
-            action='用户注册',
-            details=f'新用户 {username} 注册成功',
-            ip=get_client_ip()
-        )
-        db.session.add(log)
-        db.session.commit()
+        with unit_of_work():
+            audit_log('认证', '用户注册', f'新用户 {username} 注册成功', operator=username)
         
         return jsonify({'success': True, 'message': '注册成功'})
     
@@ -159,16 +140,8 @@ def logout():
     
     # 记录登出日志
     try:
-        log = Log(
-            level='INFO',
-            module='认证',
-            operator=username,
-            action='用户登出',
-            details=f'用户 {username} 退出登录',
-            ip=get_client_ip()
-        )
-        db.session.add(log)
-        db.session.commit()
+        with unit_of_work():
+            audit_log('认证', '用户登出', f'用户 {username} 退出登录', operator=username)
     except Exception:
         pass
     
@@ -1,10 +1,16 @@
 from flask import Blueprint, request, jsonify, session
 from app import db
 from app.models.device import Device, DeviceConfig, DeviceLinkageConfig
-from app.models.log import Log
-from app.utils.decorators import login_required, get_current_username, get_client_ip
+from app.utils.decorators import login_required
 from app.utils.validators import validate_required, sanitize_string, validate_in_list
+from app.utils.unit_of_work import unit_of_work, audit_log
+from app.utils.http_cache import make_etag, conditional_response
+from app.services.liveness import device_liveness
+from app.services.command_queue import command_queue, ACK_STATUSES, MAX_ACK_BATCH
+from app.services import config_cache as cached_config
+from app.services.config_cache import config_cache, DEVICE_CONFIG, LINKAGE
 from datetime import datetime
+from sqlalchemy.orm.exc import StaleDataError
 
 devices_bp = Blueprint('devices', __name__)
 
@@ -32,6 +38,129 @@ def get_devices():
     })
 
 
+@devices_bp.route('/heartbeat', methods=['POST'])
+def receive_heartbeats():
+    """
+    接收设备心跳（支持批量）
+    
+    请求体为 {"device_id": "..."} 或 {"devices": ["...", ...]}（网关汇总多台设备的心跳）。
+    心跳只更新内存中的存活表，设备上线、续写最近心跳时间时才访问数据库。
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'success': False, 'message': '请求数据为空'}), 400
+    
+    device_ids = data.get('devices')
+    if device_ids is None and data.get('device_id'):
+        device_ids = [data['device_id']]
+    if not isinstance(device_ids, list) or not device_ids:
+        return jsonify({'success': False, 'message': '缺少device_id或devices参数'}), 400
+    if len(device_ids) > device_liveness.max_batch:
+        return jsonify({'success': False, 'message': f'单次最多上报{device_liveness.max_batch}台设备'}), 400
+    if not all(isinstance(device_id, str) and device_id for device_id in device_ids):
+        return jsonify({'success': False, 'message': '设备ID必须是非空字符串'}), 400
+    
+    try:
+        result = device_liveness.heartbeat(device_ids)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'心跳处理失败: {str(e)}'}), 500
+    
+    return jsonify({
+        'success': True,
+        'data': {
+            'accepted': len(device_ids) - len(result['unknown']),
+            'online': result['online'],
+            'unknown': result['unknown']
+        }
+    })
+
+
+@devices_bp.route('/liveness', methods=['GET'])
+@login_required
+def get_liveness_stats():
+    """获取设备心跳与超时清扫运行指标"""
+    return jsonify({
+        'success': True,
+        'data': device_liveness.stats()
+    })
+
+
+@devices_bp.route('/commands/metrics', methods=['GET'])
+@login_required
+def get_command_queue_stats():
+    """获取设备指令队列运行指标"""
+    return jsonify({
+        'success': True,
+        'data': command_queue.stats()
+    })
+
+
+@devices_bp.route('/<device_id>/commands', methods=['GET'])
+def poll_device_commands(device_id):
+    """
+    设备拉取待执行指令（长轮询，不需要登录）
+    
+    没有指令时请求最多挂起 wait 秒（默认 COMMAND_LONG_POLL_TIMEOUT），有新指令入队立即返回；
+    wait=0 时立即返回。服务器无法挂起请求时返回 retryAfter，设备等待该秒数后再拉取。
+    """
+    wait = request.args.get('wait', type=float)
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        limit = max(1, min(limit, command_queue.fetch_limit))
+    
+    try:
+        commands, retry_after = command_queue.poll(device_id, wait=wait, limit=limit)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'拉取指令失败: {str(e)}'}), 500
+    
+    return jsonify({
+        'success': True,
+        'data': {'commands': commands, 'retryAfter': retry_after}
+    })
+
+
+@devices_bp.route('/<device_id>/commands/ack', methods=['POST'])
+def ack_device_commands(device_id):
+    """
+    设备批量回执指令执行结果（不需要登录）
+    
+    请求体为 {"acks": [{"id": 指令ID, "status": "done" | "failed", "result": "说明"}, ...]}。
+    """
+    data = request.get_json(silent=True)
+    acks = data.get('acks') if isinstance(data, dict) else None
+    if not isinstance(acks, list) or not acks:
+        return jsonify({'success': False, 'message': '缺少acks参数'}), 400
+    if len(acks) > MAX_ACK_BATCH:
+        return jsonify({'success': False, 'message': f'单次最多回执{MAX_ACK_BATCH}条指令'}), 400
+    
+    parsed = []
+    for index, item in enumerate(acks):
+        if not isinstance(item, dict) or not isinstance(item.get('id'), int) or isinstance(item.get('id'), bool):
+            return jsonify({'success': False, 'message': f'第{index + 1}条回执缺少有效的指令ID'}), 400
+        valid, msg = validate_in_list(item.get('status'), list(ACK_STATUSES), 'status')
+        if not valid:
+            return jsonify({'success': False, 'message': f'第{index + 1}条回执: {msg}'}), 400
+        result = item.get('result')
+        parsed.append({
+            'id': item['id'],
+            'status': item['status'],
+            'result': sanitize_string(result) if result is not None else None
+        })
+    
+    try:
+        result = command_queue.ack(device_id, parsed)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'回执处理失败: {str(e)}'}), 500
+    
+    return jsonify({
+        'success': True,
+        'data': result
+    })
+
+
 @devices_bp.route('/<device_id>', methods=['GET'])
 @login_required
 def get_device(device_id):
@@ -68,19 +197,8 @@ def update_device_status(device_id):
     device.status = new_status
     
     try:
-        db.session.commit()
-        
-        # 记录日志
-        log = Log(
-            level='INFO',
-            module='设备管理',
-            operator=get_current_username() or 'system',
-            action='更新设备状态',
-            details=f'设备 {device.name}({device_id}) 状态从 {old_status} 更新为 {new_status}',
-            ip=get_client_ip()
-        )
-        db.session.add(log)
-        db.session.commit()
+        with unit_of_work():
+            audit_log('设备管理', '更新设备状态', f'设备 {device.name}({device_id}) 状态从 {old_status} 更新为 {new_status}')
         
         return jsonify({'success': True, 'message': '设备状态更新成功'})
     except Exception as e:
@@ -91,24 +209,18 @@ def update_device_status(device_id):
 @devices_bp.route('/<device_id>/config', methods=['GET'])
 @login_required
 def get_device_config(device_id):
-    """获取设备配置"""
-    device = Device.query.get(device_id)
+    """获取设备配置（支持 If-None-Match 条件请求）"""
+    entry = cached_config.device_config_entry(device_id)
     
-    if not device:
+    # 已有配置的设备必然存在，只有未配置时才需要确认设备
+    if entry is None and not Device.query.get(device_id):
         return jsonify({'success': False, 'message': '设备不存在'}), 404
     
-    config = DeviceConfig.query.filter_by(device_id=device_id).first()
-    
-    if not config:
-        return jsonify({
-            'success': True,
-            'data': {'config': {}}
-        })
-    
-    return jsonify({
-        'success': True,
-        'data': {'config': config.config}
-    })
+    entry = entry or cached_config.make_entry({})
+    return conditional_response(
+        make_etag('device-config', device_id, entry.digest),
+        lambda: jsonify({'success': True, 'data': {'config': entry.data}})
+    )
 
 
 @devices_bp.route('/<device_id>/config', methods=['PUT'])
@@ -133,21 +245,15 @@ def save_device_config(device_id):
         config.config = data
     
     try:
-        db.session.commit()
-        
-        # 记录日志
-        log = Log(
-            level='INFO',
-            module='设备管理',
-            operator=get_current_username() or 'system',
-            action='更新设备配置',
-            details=f'设备 {device.name}({device_id}) 配置已更新',
-            ip=get_client_ip()
-        )
-        db.session.add(log)
-        db.session.commit()
+        with unit_of_work():
+            config_cache.bump(DEVICE_CONFIG)
+            audit_log('设备管理', '更新设备配置', f'设备 {device.name}({device_id}) 配置已更新')
         
         return jsonify({'success': True, 'message': '设备配置保存成功'})
+    except StaleDataError:
+        # 读取配置后其他请求已保存过（乐观锁），不覆盖对方的修改
+        db.session.rollback()
+        return jsonify({'success': False, 'message': '配置已被其他用户修改，请刷新后重试'}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': f'保存失败: {str(e)}'}), 500
@@ -156,28 +262,25 @@ def save_device_config(device_id):
 @devices_bp.route('/linkage', methods=['GET'])
 @login_required
 def get_linkage_config():
-    """获取设备联动配置"""
-    config = DeviceLinkageConfig.query.first()
+    """获取设备联动配置（支持 If-None-Match 条件请求）"""
+    entry = cached_config.linkage_entry()
     
-    if not config:
+    if entry is None:
         # 返回默认配置
-        return jsonify({
-            'success': True,
-            'data': {
-                'triggerType': 'time',
-                'interval': 60,
-                'relatedDevices': [],
-                'autoAdjust': False,
-                'tempThreshold': 25.0,
-                'oxygenThreshold': 6.0,
-                'phThreshold': 7.5
-            }
+        entry = cached_config.make_entry({
+            'triggerType': 'time',
+            'interval': 60,
+            'relatedDevices': [],
+            'autoAdjust': False,
+            'tempThreshold': 25.0,
+            'oxygenThreshold': 6.0,
+            'phThreshold': 7.5
         })
     
-    return jsonify({
-        'success': True,
-        'data': config.to_dict()
-    })
+    return conditional_response(
+        make_etag('linkage', entry.digest),
+        lambda: jsonify({'success': True, 'data': entry.data})
+    )
 
 
 @devices_bp.route('/linkage', methods=['PUT'])
@@ -212,21 +315,14 @@ def save_linkage_config():
         config.ph_threshold = float(data['phThreshold'])
     
     try:
-        db.session.commit()
-        
-        # 记录日志
-        log = Log(
-            level='INFO',
-            module='设备管理',
-            operator=get_current_username() or 'system',
-            action='更新设备联动配置',
-            details='设备联动配置已更新',
-            ip=get_client_ip()
-        )
-        db.session.add(log)
-        db.session.commit()
+        with unit_of_work():
+            config_cache.bump(LINKAGE)
+            audit_log('设备管理', '更新设备联动配置', '设备联动配置已更新')
         
         return jsonify({'success': True, 'message': '设备联动配置保存成功'})
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': '配置已被其他用户修改，请刷新后重试'}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': f'保存失败: {str(e)}'}), 500
@@ -1,9 +1,26 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from app import db
 from app.models.environment import EnvironmentData, EnvironmentThreshold
+from app.services import config_cache as cached_config
+from app.services.config_cache import config_cache, THRESHOLDS
+from app.services.environment_ingest import (
+    parse_reading, parse_readings, insert_readings, SINGLE_OPTIONAL_FIELDS
+)
+from app.services.ingest_buffer import ingest_buffer
+from app.services.latest_cache import latest_cache
+from app.services.list_totals import list_totals
+from app.services.stat_counters import stat_counters
+from app.services import environment_rollup
+from app.services.environment_rollup import INTERVALS, summarize
+from app.services.export import EXPORT_FORMATS, export_response, parse_export_options
 from app.utils.decorators import login_required
+from app.utils.pagination import clamp_limit, keyset_paginate
+from app.utils.validators import ValidationError
+from app.utils.unit_of_work import unit_of_work, audit_log
+from app.utils.http_cache import make_etag, conditional_response
 from datetime import datetime, timedelta
-from sqlalchemy import func
+from sqlalchemy import select
+from sqlalchemy.orm.exc import StaleDataError
 import random
 
 environment_bp = Blueprint('environment', __name__)
@@ -11,50 +28,117 @@ environment_bp = Blueprint('environment', __name__)
 
 @environment_bp.route('/data', methods=['POST'])
 def receive_environment_data():
-    """接收设备上报的环境数据（不需要登录）"""
+    """接收设备上报的环境数据（不需要登录），缺少的读数按0处理"""
+    data = request.get_json(silent=True)
+    
+    if not data:
+        return jsonify({
+            'success': False,
+            'message': '请求数据为空'
+        }), 400
+    
     try:
-        data = request.get_json()
-        
-        if not data:
+        row = parse_reading(data, optional=SINGLE_OPTIONAL_FIELDS)
+    except ValidationError as e:
+        return jsonify({
+            'success': False,
+            'message': e.message
+        }), 400
+    
+    # 启用写缓冲时只入队，由后台线程批量落库
+    if ingest_buffer.enabled:
+        if not ingest_buffer.submit(row):
             return jsonify({
                 'success': False,
-                'message': '请求数据为空'
-            }), 400
+                'message': '服务繁忙，请稍后重试'
+            }), 429
         
-        # 创建环境数据记录
-        env_record = EnvironmentData(
-            temperature=data.get('temperature', 0),
-            dissolved_oxygen=data.get('dissolved_oxygen', 0),
-            ph=data.get('ph', 0),
-            water_flow=data.get('water_flow', 0)
-        )
-        
-        db.session.add(env_record)
-        db.session.commit()
+        return jsonify({
+            'success': True,
+            'message': '数据已接收'
+        }), 202
+    
+    try:
+        insert_readings([row])
         
         return jsonify({
             'success': True,
             'message': '数据上报成功'
         })
     except Exception as e:
-        db.session.rollback()
         return jsonify({
             'success': False,
             'message': f'数据上报失败: {str(e)}'
         }), 500
 
 
+@environment_bp.route('/data/batch', methods=['POST'])
+def receive_environment_data_batch():
+    """批量接收设备上报的环境数据（不需要登录）"""
+    data = request.get_json(silent=True)
+    
+    # 支持直接上报数组或 {"readings": [...]} 两种格式
+    readings = data.get('readings') if isinstance(data, dict) else data
+    
+    if not isinstance(readings, list) or not readings:
+        return jsonify({
+            'success': False,
+            'message': '请求数据为空'
+        }), 400
+    
+    max_size = current_app.config['ENVIRONMENT_BATCH_MAX_SIZE']
+    if len(readings) > max_size:
+        return jsonify({
+            'success': False,
+            'message': f'单次最多上报{max_size}条数据'
+        }), 413
+    
+    # 批次级的设备/鱼塘ID作为每条读数的默认值
+    defaults = {}
+    if isinstance(data, dict):
+        defaults = {key: data[key] for key in ('device_id', 'pond_id') if key in data}
+    
+    rows, errors = parse_readings(readings, defaults)
+    
+    try:
+        accepted = insert_readings(rows)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'数据上报失败: {str(e)}'
+        }), 500
+    
+    result = {
+        'accepted': accepted,
+        'rejected': len(errors),
+        'errors': errors
+    }
+    
+    if accepted == 0:
+        return jsonify({
+            'success': False,
+            'message': '所有数据均校验失败',
+            'data': result
+        }), 400
+    
+    return jsonify({
+        'success': True,
+        'message': '批量数据上报成功',
+        'data': result
+    })
+
+
 def generate_realtime_data():
     """生成模拟的实时环境数据"""
     # 获取最新的真实数据，如果没有则生成模拟数据
-    latest = EnvironmentData.query.order_by(EnvironmentData.timestamp.desc()).first()
+    latest = latest_cache.get()
     
     if latest:
         # 基于最新数据加上小幅波动
-        temperature = latest.temperature + random.uniform(-0.5, 0.5)
-        dissolved_oxygen = latest.dissolved_oxygen + random.uniform(-0.2, 0.2)
-        ph = latest.ph + random.uniform(-0.1, 0.1)
-        water_flow = latest.water_flow + random.uniform(-0.05, 0.05)
+        temperature = latest['temperature'] + random.uniform(-0.5, 0.5)
+        dissolved_oxygen = latest['dissolved_oxygen'] + random.uniform(-0.2, 0.2)
+        ph = latest['ph'] + random.uniform(-0.1, 0.1)
+        water_flow = latest['water_flow'] + random.uniform(-0.05, 0.05)
     else:
         # 生成初始模拟数据
         temperature = random.uniform(20, 26)
@@ -80,16 +164,18 @@ def generate_realtime_data():
 @login_required
 def get_realtime_data():
     """获取实时环境数据"""
+    device_id = request.args.get('device_id')
+    
     try:
-        # 直接返回数据库中最新的真实数据，不添加波动
-        latest = EnvironmentData.query.order_by(EnvironmentData.timestamp.desc()).first()
+        # 返回最新的真实数据（优先读缓存），不添加波动
+        latest = latest_cache.get(device_id)
         
         if latest:
             data = {
-                'temperature': round(latest.temperature, 1),
-                'dissolvedOxygen': round(latest.dissolved_oxygen, 1),
-                'ph': round(latest.ph, 2),
-                'waterFlow': round(latest.water_flow, 2)
+                'temperature': round(latest['temperature'], 1),
+                'dissolvedOxygen': round(latest['dissolved_oxygen'], 1),
+                'ph': round(latest['ph'], 2),
+                'waterFlow': round(latest['water_flow'], 2)
             }
         else:
             # 如果没有数据，返回默认值
@@ -112,10 +198,27 @@ def get_history_data():
     """获取环境数据历史记录"""
     start_time = request.args.get('start_time')
     end_time = request.args.get('end_time')
-    limit = request.args.get('limit', 100, type=int)
-    offset = request.args.get('offset', 0, type=int)
+    limit = clamp_limit(request.args.get('limit', type=int), 100)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    cursor = request.args.get('cursor')
+    include_total = request.args.get('include_total', 'true').lower() not in ('false', '0', 'no')
+    device_id = request.args.get('device_id')
+    pond_id = request.args.get('pond_id', type=int)
+    
+    interval = request.args.get('interval')
+    
+    # 指定 interval 时返回聚合表中的降采样数据
+    if interval:
+        return get_downsampled_history(start_time, end_time, interval, device_id, pond_id, limit, offset)
     
     query = EnvironmentData.query
+    start_dt = end_dt = None
+    
+    if device_id:
+        query = query.filter(EnvironmentData.device_id == device_id)
+    
+    if pond_id is not None:
+        query = query.filter(EnvironmentData.pond_id == pond_id)
     
     if start_time:
         try:
@@ -131,13 +234,140 @@ def get_history_data():
         except ValueError:
             pass
     
-    total = query.count()
-    records = query.order_by(EnvironmentData.timestamp.desc()).offset(offset).limit(limit).all()
+    try:
+        records, next_cursor = keyset_paginate(
+            query, (EnvironmentData.timestamp, EnvironmentData.id), limit, cursor, offset=offset
+        )
+    except ValidationError as e:
+        return jsonify({'success': False, 'message': e.message}), 400
+    
+    total, total_exact = list_totals.resolve(
+        ('environment.history', device_id, pond_id, start_dt, end_dt), query.count,
+        lambda: estimate_history_total(device_id, pond_id, start_dt, end_dt), include_total
+    )
     
     return jsonify({
         'success': True,
         'data': [record.to_dict() for record in records],
-        'total': total
+        'total': total,
+        'totalExact': total_exact,
+        'next_cursor': next_cursor
+    })
+
+
+def estimate_history_total(device_id, pond_id, start_dt, end_dt):
+    """估算历史记录条数：不带条件时读统计计数器，否则按聚合表累加"""
+    if not (device_id or pond_id is not None or start_dt or end_dt):
+        return stat_counters.snapshot().get('monitoring.total')
+    return environment_rollup.count_samples(start_dt, end_dt or datetime.now(), device_id, pond_id)
+
+
+@environment_bp.route('/export', methods=['GET'])
+@login_required
+def export_history_data():
+    """流式导出环境数据（CSV / NDJSON，可选 gzip），按时间正序"""
+    fmt, compress = parse_export_options(request.args)
+    if fmt is None:
+        return jsonify({'success': False, 'message': f'format必须是以下值之一: {", ".join(EXPORT_FORMATS)}'}), 400
+    
+    device_id = request.args.get('device_id')
+    pond_id = request.args.get('pond_id', type=int)
+    start_time = request.args.get('start_time')
+    end_time = request.args.get('end_time')
+    
+    columns = [
+        EnvironmentData.id, EnvironmentData.device_id, EnvironmentData.pond_id, EnvironmentData.timestamp,
+        EnvironmentData.temperature, EnvironmentData.dissolved_oxygen, EnvironmentData.ph, EnvironmentData.water_flow
+    ]
+    statement = select(*columns)
+    conditions = []
+    
+    if device_id:
+        statement = statement.where(EnvironmentData.device_id == device_id)
+        conditions.append(f'设备: {device_id}')
+    
+    if pond_id is not None:
+        statement = statement.where(EnvironmentData.pond_id == pond_id)
+        conditions.append(f'鱼塘: {pond_id}')
+    
+    if start_time:
+        try:
+            start_dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
+            statement = statement.where(EnvironmentData.timestamp >= start_dt)
+            conditions.append(f'开始: {start_dt.isoformat()}')
+        except ValueError:
+            pass
+    
+    if end_time:
+        try:
+            end_dt = datetime.fromisoformat(end_time.replace('Z', '+00:00'))
+            statement = statement.where(EnvironmentData.timestamp <= end_dt)
+            conditions.append(f'结束: {end_dt.isoformat()}')
+        except ValueError:
+            pass
+    
+    with unit_of_work():
+        audit_log('环境监测', '导出数据', f'导出环境数据 ({fmt}) ' + (', '.join(conditions) or '全部'))
+    
+    statement = statement.order_by(EnvironmentData.timestamp, EnvironmentData.id)
+    return export_response(statement, [column.key for column in columns], fmt,
+                           f'environment_{datetime.now():%Y%m%d%H%M%S}', compress)
+
+
+def fit_series_interval(start_dt, end_dt, interval):
+    """
+    按 ENVIRONMENT_SERIES_MAX_BUCKETS 限制桶数量，返回 (实际桶宽度, 错误响应)
+    
+    区间过长时改用更粗的桶宽度，按周分桶仍超出上限时返回400。
+    """
+    max_buckets = current_app.config['ENVIRONMENT_SERIES_MAX_BUCKETS']
+    fitted = environment_rollup.fit_interval(start_dt, end_dt, interval, max_buckets)
+    if fitted is None:
+        return None, (jsonify({
+            'success': False,
+            'message': f'时间范围过大，按周分桶超过{max_buckets}个'
+        }), 400)
+    return fitted, None
+
+
+def get_downsampled_history(start_time, end_time, interval, device_id, pond_id, limit, offset):
+    """从聚合表读取降采样历史数据"""
+    if interval not in INTERVALS:
+        return jsonify({
+            'success': False,
+            'message': f'interval必须是以下值之一: {", ".join(INTERVALS)}'
+        }), 400
+    
+    end_dt = datetime.now()
+    if end_time:
+        try:
+            end_dt = datetime.fromisoformat(end_time.replace('Z', '+00:00'))
+        except ValueError:
+            pass
+    
+    # 未指定开始时间时，按 limit 个桶向前回溯
+    start_dt = end_dt - INTERVALS[interval] * (offset + limit)
+    if start_time:
+        try:
+            start_dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
+        except ValueError:
+            pass
+    
+    interval, error = fit_series_interval(start_dt, end_dt, interval)
+    if error:
+        return error
+    
+    records = environment_rollup.series(
+        start_dt, end_dt, interval, device_id, pond_id,
+        descending=True, limit=limit, offset=offset
+    )
+    total = environment_rollup.count_buckets(start_dt, end_dt, interval, device_id, pond_id)
+    
+    return jsonify({
+        'success': True,
+        'data': records,
+        'total': total,
+        'interval': interval
     })
 
 
@@ -148,8 +378,8 @@ def get_statistics():
     start_time = request.args.get('start_time')
     end_time = request.args.get('end_time')
     interval = request.args.get('interval', 'day')
-    
-    query = EnvironmentData.query
+    device_id = request.args.get('device_id')
+    pond_id = request.args.get('pond_id', type=int)
     
     # 默认查询最近7天
     if not start_time:
@@ -168,35 +398,32 @@ def get_statistics():
         except ValueError:
             end_dt = datetime.now()
     
-    query = query.filter(
-        EnvironmentData.timestamp >= start_dt,
-        EnvironmentData.timestamp <= end_dt
-    )
+    if interval not in INTERVALS:
+        return jsonify({
+            'success': False,
+            'message': f'interval必须是以下值之一: {", ".join(INTERVALS)}'
+        }), 400
     
-    # 统计数据
-    stats = db.session.query(
-        func.avg(EnvironmentData.temperature).label('temp_avg'),
-        func.min(EnvironmentData.temperature).label('temp_min'),
-        func.max(EnvironmentData.temperature).label('temp_max'),
-        func.avg(EnvironmentData.dissolved_oxygen).label('do_avg'),
-        func.min(EnvironmentData.dissolved_oxygen).label('do_min'),
-        func.max(EnvironmentData.dissolved_oxygen).label('do_max'),
-        func.avg(EnvironmentData.ph).label('ph_avg'),
-        func.min(EnvironmentData.ph).label('ph_min'),
-        func.max(EnvironmentData.ph).label('ph_max')
-    ).filter(
-        EnvironmentData.timestamp >= start_dt,
-        EnvironmentData.timestamp <= end_dt
-    ).first()
+    interval, error = fit_series_interval(start_dt, end_dt, interval)
+    if error:
+        return error
+    
+    # 区间汇总：中间部分读聚合表，两端零头读原始表
+    stats = summarize(start_dt, end_dt, device_id, pond_id)
+    
+    # 按 interval 分桶的降采样曲线
+    buckets = environment_rollup.series(start_dt, end_dt, interval, device_id, pond_id)
     
     # 如果没有数据，返回默认值
-    if stats.temp_avg is None:
+    if stats is None:
         return jsonify({
             'success': True,
             'data': {
                 'temperature': {'avg': 0, 'min': 0, 'max': 0},
                 'dissolvedOxygen': {'avg': 0, 'min': 0, 'max': 0},
-                'ph': {'avg': 0, 'min': 0, 'max': 0}
+                'ph': {'avg': 0, 'min': 0, 'max': 0},
+                'interval': interval,
+                'series': []
             }
         })
     
@@ -204,20 +431,36 @@ def get_statistics():
         'success': True,
         'data': {
             'temperature': {
-                'avg': round(stats.temp_avg or 0, 2),
-                'min': round(stats.temp_min or 0, 2),
-                'max': round(stats.temp_max or 0, 2)
+                'avg': round(stats['temperature']['avg'], 2),
+                'min': round(stats['temperature']['min'], 2),
+                'max': round(stats['temperature']['max'], 2)
             },
             'dissolvedOxygen': {
-                'avg': round(stats.do_avg or 0, 2),
-                'min': round(stats.do_min or 0, 2),
-                'max': round(stats.do_max or 0, 2)
+                'avg': round(stats['dissolved_oxygen']['avg'], 2),
+                'min': round(stats['dissolved_oxygen']['min'], 2),
+                'max': round(stats['dissolved_oxygen']['max'], 2)
             },
             'ph': {
-                'avg': round(stats.ph_avg or 0, 2),
-                'min': round(stats.ph_min or 0, 2),
-                'max': round(stats.ph_max or 0, 2)
-            }
+                'avg': round(stats['ph']['avg'], 2),
+                'min': round(stats['ph']['min'], 2),
+                'max': round(stats['ph']['max'], 2)
+            },
+            'count': stats['count'],
+            'interval': interval,
+            'series': buckets
+        }
+    })
+
+
+@environment_bp.route('/metrics', methods=['GET'])
+@login_required
+def get_ingest_metrics():
+    """获取数据写入运行指标"""
+    return jsonify({
+        'success': True,
+        'data': {
+            'ingest': ingest_buffer.stats(),
+            'latestCache': latest_cache.stats()
         }
     })
 
@@ -225,8 +468,8 @@ def get_statistics():
 @environment_bp.route('/monitoring/count', methods=['GET'])
 @login_required
 def get_monitoring_count():
-    """获取环境监测总次数"""
-    count = EnvironmentData.query.count()
+    """获取环境监测总次数（读统计计数器）"""
+    count = stat_counters.snapshot().get('monitoring.total', 0)
     
     return jsonify({
         'success': True,
@@ -239,10 +482,10 @@ def get_monitoring_count():
 @environment_bp.route('/thresholds', methods=['GET'])
 @login_required
 def get_thresholds():
-    """获取环境告警阈值配置"""
-    threshold = EnvironmentThreshold.query.first()
+    """获取环境告警阈值配置（支持 If-None-Match 条件请求）"""
+    entry = cached_config.thresholds_entry()
     
-    if not threshold:
+    if entry is None:
         # 创建默认阈值
         threshold = EnvironmentThreshold(
             temperature_min=18.0,
@@ -253,12 +496,14 @@ def get_thresholds():
             ph_max=8.0
         )
         db.session.add(threshold)
+        config_cache.bump(THRESHOLDS)
         db.session.commit()
+        entry = cached_config.make_entry(threshold.to_dict())
     
-    return jsonify({
-        'success': True,
-        'data': threshold.to_dict()
-    })
+    return conditional_response(
+        make_etag('thresholds', entry.digest),
+        lambda: jsonify({'success': True, 'data': entry.data})
+    )
 
 
 @environment_bp.route('/thresholds', methods=['PUT'])
@@ -299,8 +544,13 @@ def update_thresholds():
             threshold.ph_max = float(ph['max'])
     
     try:
-        db.session.commit()
+        with unit_of_work():
+            config_cache.bump(THRESHOLDS)
+            audit_log('环境监测', '更新告警阈值', '环境告警阈值配置已更新')
         return jsonify({'success': True, 'message': '阈值配置更新成功'})
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': '配置已被其他用户修改，请刷新后重试'}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': f'更新失败: {str(e)}'}), 500
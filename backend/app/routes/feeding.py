@@ -1,16 +1,22 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from app import db
 from app.models.feeding import FeedingPlan, FeedingHistory
 from app.models.device import Device
-from app.models.environment import EnvironmentData
-from app.models.log import Log
-from app.utils.decorators import login_required, get_current_username, get_client_ip
+from app.utils.decorators import login_required, get_current_username
 from app.utils.validators import (
     validate_required, validate_positive_number, 
-    validate_time_format, validate_in_list, sanitize_string
+    validate_time_format, validate_in_list, sanitize_string, ValidationError
 )
-from app.services.feeding_algorithm import calculate_feeding
+from app.services.feeding_algorithm import calculate_feeding, calculate_feeding_batch, feeding_algorithm
+from app.services.latest_cache import latest_cache
+from app.services.feeding_scheduler import feeding_scheduler
+from app.services.command_queue import command_queue
+from app.services.feeding_ingest import parse_feeding_events, insert_feeding_events
+from app.services.export import EXPORT_FORMATS, export_response, parse_export_options
+from app.utils.unit_of_work import unit_of_work, audit_log
+from app.utils.pagination import clamp_limit, keyset_paginate
 from datetime import datetime, time as time_type
+from sqlalchemy import select
 
 feeding_bp = Blueprint('feeding', __name__)
 
@@ -87,20 +93,11 @@ def create_feeding_plan():
             amount=float(data['amount']),
             status=status
         )
-        db.session.add(plan)
-        db.session.commit()
-        
-        # 记录日志
-        log = Log(
-            level='INFO',
-            module='投喂管理',
-            operator=get_current_username() or 'system',
-            action='创建投喂计划',
-            details=f'创建投喂计划: {plan.name}, 设备: {device_id}, 时间: {time_str}, 投喂量: {plan.amount}kg',
-            ip=get_client_ip()
-        )
-        db.session.add(log)
-        db.session.commit()
+        with unit_of_work():
+            db.session.add(plan)
+            audit_log('投喂管理', '创建投喂计划',
+                      f'创建投喂计划: {plan.name}, 设备: {device_id}, 时间: {time_str}, 投喂量: {plan.amount}kg')
+        feeding_scheduler.schedule_plan(plan)
         
         return jsonify({'success': True, 'message': '投喂计划创建成功', 'data': plan.to_dict()})
     except Exception as e:
@@ -150,19 +147,9 @@ def update_feeding_plan(plan_id):
                 return jsonify({'success': False, 'message': msg}), 400
             plan.status = data['status']
         
-        db.session.commit()
-        
-        # 记录日志
-        log = Log(
-            level='INFO',
-            module='投喂管理',
-            operator=get_current_username() or 'system',
-            action='更新投喂计划',
-            details=f'更新投喂计划ID: {plan_id}',
-            ip=get_client_ip()
-        )
-        db.session.add(log)
-        db.session.commit()
+        with unit_of_work():
+            audit_log('投喂管理', '更新投喂计划', f'更新投喂计划ID: {plan_id}')
+        feeding_scheduler.schedule_plan(plan)
         
         return jsonify({'success': True, 'message': '投喂计划更新成功'})
     except Exception as e:
@@ -180,21 +167,10 @@ def delete_feeding_plan(plan_id):
         return jsonify({'success': False, 'message': '投喂计划不存在'}), 404
     
     try:
-        plan_name = plan.name
-        db.session.delete(plan)
-        db.session.commit()
-        
-        # 记录日志
-        log = Log(
-            level='INFO',
-            module='投喂管理',
-            operator=get_current_username() or 'system',
-            action='删除投喂计划',
-            details=f'删除投喂计划: {plan_name} (ID: {plan_id})',
-            ip=get_client_ip()
-        )
-        db.session.add(log)
-        db.session.commit()
+        with unit_of_work():
+            db.session.delete(plan)
+            audit_log('投喂管理', '删除投喂计划', f'删除投喂计划: {plan.name} (ID: {plan_id})')
+        feeding_scheduler.remove_plan(plan_id)
         
         return jsonify({'success': True, 'message': '投喂计划删除成功'})
     except Exception as e:
@@ -228,29 +204,25 @@ def execute_manual_feeding():
         return jsonify({'success': False, 'message': msg}), 400
     
     try:
-        # 记录投喂历史
+        # 记录投喂历史（设备回执后更新状态），投喂指令进入设备指令队列
+        amount = float(data['amount'])
         history = FeedingHistory(
             device_id=device_id,
-            amount=float(data['amount']),
+            amount=amount,
             type='manual',
-            operator=get_current_username() or 'system'
-        )
-        db.session.add(history)
-        db.session.commit()
-        
-        # 记录日志
-        log = Log(
-            level='INFO',
-            module='投喂管理',
             operator=get_current_username() or 'system',
-            action='执行手动投喂',
-            details=f'设备: {device.name}({device_id}), 投喂量: {data["amount"]}kg',
-            ip=get_client_ip()
+            status='pending'
         )
-        db.session.add(log)
-        db.session.commit()
+        db.session.add(history)
+        command = command_queue.enqueue(device_id, 'feed', {'amount': amount}, history=history)
+        with unit_of_work():
+            audit_log('投喂管理', '执行手动投喂', f'设备: {device.name}({device_id}), 投喂量: {data["amount"]}kg')
         
-        return jsonify({'success': True, 'message': '投喂指令已发送'})
+        return jsonify({
+            'success': True,
+            'message': '投喂指令已发送',
+            'data': {'commandId': command.id, 'historyId': history.id}
+        })
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': f'执行失败: {str(e)}'}), 500
@@ -270,15 +242,17 @@ def calculate_feeding_amount():
     if not average_weight or average_weight <= 0:
         return jsonify({'success': False, 'message': '平均体重必须大于0'}), 400
     
-    # 获取最新环境数据
-    latest_env = EnvironmentData.query.order_by(EnvironmentData.timestamp.desc()).first()
+    device_id = request.args.get('device_id')
+    
+    # 获取最新环境数据（优先读缓存）
+    latest_env = latest_cache.get(device_id)
     
     env_data = {}
     if latest_env:
         env_data = {
-            'temperature': latest_env.temperature,
-            'dissolvedOxygen': latest_env.dissolved_oxygen,
-            'ph': latest_env.ph
+            'temperature': latest_env['temperature'],
+            'dissolvedOxygen': latest_env['dissolved_oxygen'],
+            'ph': latest_env['ph']
         }
     
     # 计算建议投喂量
@@ -299,6 +273,102 @@ def calculate_feeding_amount():
     })
 
 
+@feeding_bp.route('/calculate/batch', methods=['POST'])
+@login_required
+def calculate_feeding_amount_batch():
+    """批量计算多个网箱的建议投喂量"""
+    data = request.get_json()
+    
+    if not data or not isinstance(data.get('cages'), list) or not data['cages']:
+        return jsonify({'success': False, 'message': '网箱列表不能为空'}), 400
+    
+    cages = data['cages']
+    max_size = current_app.config.get('FEEDING_BATCH_MAX_SIZE', 10000)
+    if len(cages) > max_size:
+        return jsonify({'success': False, 'message': f'单次最多计算{max_size}个网箱'}), 413
+    
+    # 未单独提供环境数据的网箱使用最新环境数据（优先读缓存）
+    latest_env = latest_cache.get(data.get('device_id'))
+    default_env = {
+        'temperature': latest_env['temperature'] if latest_env else 24.0,
+        'dissolvedOxygen': latest_env['dissolved_oxygen'] if latest_env else 6.0,
+        'ph': latest_env['ph'] if latest_env else 7.5
+    }
+    
+    columns = {
+        'fishCount': [], 'averageWeight': [], 'fishType': [],
+        'temperature': [], 'dissolvedOxygen': [], 'ph': []
+    }
+    for index, cage in enumerate(cages):
+        if not isinstance(cage, dict):
+            return jsonify({'success': False, 'message': f'第{index + 1}个网箱数据格式错误'}), 400
+        try:
+            fish_count = int(cage.get('fishCount') or 0)
+            average_weight = float(cage.get('averageWeight') or 0)
+            env_values = {key: float(cage[key]) if cage.get(key) is not None else value
+                          for key, value in default_env.items()}
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'message': f'第{index + 1}个网箱参数格式错误'}), 400
+        
+        if fish_count <= 0:
+            return jsonify({'success': False, 'message': f'第{index + 1}个网箱鱼类数量必须大于0'}), 400
+        if average_weight <= 0:
+            return jsonify({'success': False, 'message': f'第{index + 1}个网箱平均体重必须大于0'}), 400
+        
+        columns['fishCount'].append(fish_count)
+        columns['averageWeight'].append(average_weight)
+        columns['fishType'].append(str(cage.get('fishType') or 'default'))
+        for key, value in env_values.items():
+            columns[key].append(value)
+    
+    result = calculate_feeding_batch(
+        fish_counts=columns['fishCount'],
+        average_weights=columns['averageWeight'],
+        fish_types=columns['fishType'],
+        env_data={
+            'temperature': columns['temperature'],
+            'dissolvedOxygen': columns['dissolvedOxygen'],
+            'ph': columns['ph']
+        }
+    )
+    
+    return jsonify({
+        'success': True,
+        'data': [
+            {
+                'cageId': cage.get('cageId'),
+                'amount': amount,
+                'type': feeding_type,
+                'reason': reason
+            }
+            for cage, amount, feeding_type, reason
+            in zip(cages, result['amount'], result['type'], result['reason'])
+        ]
+    })
+
+
+@feeding_bp.route('/calculate/metrics', methods=['GET'])
+@login_required
+def get_calculation_metrics():
+    """获取投喂量计算的因子缓存指标"""
+    return jsonify({
+        'success': True,
+        'data': {
+            'factorCache': feeding_algorithm.factor_cache.stats()
+        }
+    })
+
+
+@feeding_bp.route('/scheduler', methods=['GET'])
+@login_required
+def get_scheduler_status():
+    """获取投喂计划调度器状态"""
+    return jsonify({
+        'success': True,
+        'data': feeding_scheduler.stats()
+    })
+
+
 @feeding_bp.route('/history', methods=['GET'])
 @login_required
 def get_feeding_history():
@@ -306,6 +376,8 @@ def get_feeding_history():
     device_id = request.args.get('device_id')
     start_time = request.args.get('start_time')
     end_time = request.args.get('end_time')
+    limit = clamp_limit(request.args.get('limit', type=int), 100)
+    cursor = request.args.get('cursor')
     
     query = FeedingHistory.query
     
@@ -326,14 +398,120 @@ def get_feeding_history():
         except ValueError:
             pass
     
-    histories = query.order_by(FeedingHistory.time.desc()).limit(100).all()
+    try:
+        histories, next_cursor = keyset_paginate(query, (FeedingHistory.time, FeedingHistory.id), limit, cursor)
+    except ValidationError as e:
+        return jsonify({'success': False, 'message': e.message}), 400
     
     return jsonify({
         'success': True,
-        'data': [history.to_dict() for history in histories]
+        'data': [history.to_dict() for history in histories],
+        'next_cursor': next_cursor
     })
 
 
+@feeding_bp.route('/history', methods=['POST'])
+def upload_feeding_history():
+    """
+    设备批量上传投喂记录（不需要登录）
+    
+    请求体为 {"device_id": "...", "events": [{"event_id": "...", "amount": ..., ...}, ...]}，
+    event_id 由设备生成，重传的记录按 (device_id, event_id) 丢弃，设备可以安全重试。
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'message': '请求数据为空'}), 400
+    
+    device_id = data.get('device_id')
+    events = data.get('events')
+    if not isinstance(device_id, str) or not device_id:
+        return jsonify({'success': False, 'message': '缺少device_id参数'}), 400
+    if not isinstance(events, list) or not events:
+        return jsonify({'success': False, 'message': '缺少events参数'}), 400
+    
+    max_size = current_app.config['FEEDING_HISTORY_BATCH_MAX_SIZE']
+    if len(events) > max_size:
+        return jsonify({'success': False, 'message': f'单次最多上传{max_size}条记录'}), 413
+    
+    if not Device.query.get(device_id):
+        return jsonify({'success': False, 'message': '设备不存在'}), 404
+    
+    rows, errors = parse_feeding_events(events)
+    
+    try:
+        accepted, duplicates = insert_feeding_events(device_id, rows)
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'投喂记录上传失败: {str(e)}'}), 500
+    
+    result = {
+        'accepted': accepted,
+        'duplicates': duplicates,
+        'rejected': len(errors),
+        'errors': errors
+    }
+    
+    if not rows:
+        return jsonify({
+            'success': False,
+            'message': '所有记录均校验失败',
+            'data': result
+        }), 400
+    
+    return jsonify({
+        'success': True,
+        'message': '投喂记录上传成功',
+        'data': result
+    })
+
+
+@feeding_bp.route('/export', methods=['GET'])
+@login_required
+def export_feeding_history():
+    """流式导出投喂历史（CSV / NDJSON，可选 gzip），按投喂时间正序"""
+    fmt, compress = parse_export_options(request.args)
+    if fmt is None:
+        return jsonify({'success': False, 'message': f'format必须是以下值之一: {", ".join(EXPORT_FORMATS)}'}), 400
+    
+    device_id = request.args.get('device_id')
+    start_time = request.args.get('start_time')
+    end_time = request.args.get('end_time')
+    
+    columns = [
+        FeedingHistory.id, FeedingHistory.device_id, FeedingHistory.amount, FeedingHistory.time,
+        FeedingHistory.type, FeedingHistory.operator, FeedingHistory.status, FeedingHistory.fish_type,
+        FeedingHistory.fish_count, FeedingHistory.average_weight
+    ]
+    statement = select(*columns)
+    conditions = []
+    
+    if device_id:
+        statement = statement.where(FeedingHistory.device_id == device_id)
+        conditions.append(f'设备: {device_id}')
+    
+    if start_time:
+        try:
+            start_dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
+            statement = statement.where(FeedingHistory.time >= start_dt)
+            conditions.append(f'开始: {start_dt.isoformat()}')
+        except ValueError:
+            pass
+    
+    if end_time:
+        try:
+            end_dt = datetime.fromisoformat(end_time.replace('Z', '+00:00'))
+            statement = statement.where(FeedingHistory.time <= end_dt)
+            conditions.append(f'结束: {end_dt.isoformat()}')
+        except ValueError:
+            pass
+    
+    with unit_of_work():
+        audit_log('投喂管理', '导出数据', f'导出投喂历史 ({fmt}) ' + (', '.join(conditions) or '全部'))
+    
+    statement = statement.order_by(FeedingHistory.time, FeedingHistory.id)
+    return export_response(statement, [column.key for column in columns], fmt,
+                           f'feeding_history_{datetime.now():%Y%m%d%H%M%S}', compress)
+
+
 @feeding_bp.route('/statistics', methods=['GET'])
 @login_required
 def get_feeding_statistics():
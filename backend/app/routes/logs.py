@@ -2,8 +2,16 @@ from flask import Blueprint, request, jsonify
 from app import db
 from app.models.log import Log
 from app.utils.decorators import login_required
+from app.utils.pagination import clamp_limit, keyset_paginate
+from app.utils.validators import ValidationError
 from datetime import datetime, timedelta
-from sqlalchemy import or_
+from app.services.list_totals import list_totals, estimate_table_rows
+from app.services.log_search import log_search
+from app.services.aggregation import bucket_count, count_by_conditions
+from app.services.trend import MAX_BUCKETS, parse_bucket_width
+from app.services.export import EXPORT_FORMATS, export_response, parse_export_options
+from app.utils.unit_of_work import unit_of_work, audit_log
+from sqlalchemy import select
 
 logs_bp = Blueprint('logs', __name__)
 
@@ -17,7 +25,10 @@ def get_logs():
     start_time = request.args.get('start_time')
     end_time = request.args.get('end_time')
     page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 50, type=int)
+    per_page = clamp_limit(request.args.get('per_page', type=int), 50)
+    cursor = request.args.get('cursor')
+    include_total = request.args.get('include_total', 'true').lower() not in ('false', '0', 'no')
+    start_dt = end_dt = None
     
     query = Log.query
     
@@ -41,16 +52,30 @@ def get_logs():
         except ValueError:
             pass
     
-    # 分页
-    logs = query.order_by(Log.timestamp.desc()).offset((page - 1) * per_page).limit(per_page).all()
-    total = query.count()
+    # 传入 cursor 时按游标翻页，否则按 page 定位
+    try:
+        logs, next_cursor = keyset_paginate(
+            query, (Log.timestamp, Log.id), per_page, cursor, offset=(max(page, 1) - 1) * per_page
+        )
+    except ValidationError as e:
+        return jsonify({'success': False, 'message': e.message}), 400
+    
+    # 不带过滤条件时按表统计信息估算，避免整表计数
+    estimate = None
+    if not (level or module or start_dt or end_dt):
+        estimate = lambda: estimate_table_rows(Log)
+    total, total_exact = list_totals.resolve(
+        ('logs', level, module, start_dt, end_dt), query.count, estimate, include_total
+    )
     
     return jsonify({
         'success': True,
         'data': [log.to_dict() for log in logs],
         'total': total,
+        'totalExact': total_exact,
         'page': page,
-        'per_page': per_page
+        'per_page': per_page,
+        'next_cursor': next_cursor
     })
 
 
@@ -72,58 +97,113 @@ def get_log_detail(log_id):
 @logs_bp.route('/search', methods=['GET'])
 @login_required
 def search_logs():
-    """搜索日志"""
+    """搜索日志（走全文索引，按相关度排序）"""
     keyword = request.args.get('keyword', '')
     start_time = request.args.get('start_time')
     end_time = request.args.get('end_time')
     page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 50, type=int)
-    
-    query = Log.query
+    per_page = clamp_limit(request.args.get('per_page', type=int), 50)
+    cursor = request.args.get('cursor')
+    sort = request.args.get('sort', 'relevance')
+    include_total = request.args.get('include_total', 'true').lower() not in ('false', '0', 'no')
     
-    if keyword:
-        search_pattern = f'%{keyword}%'
-        query = query.filter(
-            or_(
-                Log.action.like(search_pattern),
-                Log.details.like(search_pattern),
-                Log.operator.like(search_pattern),
-                Log.module.like(search_pattern)
-            )
-        )
+    if sort not in ('relevance', 'time'):
+        return jsonify({'success': False, 'message': 'sort 参数只能是 relevance 或 time'}), 400
     
+    start_dt = None
     if start_time:
         try:
             start_dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
-            query = query.filter(Log.timestamp >= start_dt)
         except ValueError:
             pass
     
+    end_dt = None
     if end_time:
         try:
             end_dt = datetime.fromisoformat(end_time.replace('Z', '+00:00'))
-            query = query.filter(Log.timestamp <= end_dt)
         except ValueError:
             pass
     
-    logs = query.order_by(Log.timestamp.desc()).offset((page - 1) * per_page).limit(per_page).all()
-    total = query.count()
+    try:
+        result = log_search.search(
+            keyword, start_dt, end_dt, page, per_page, sort, cursor=cursor, include_total=include_total
+        )
+    except ValidationError as e:
+        return jsonify({'success': False, 'message': e.message}), 400
+    
+    data = []
+    for log, score in result.items:
+        item = log.to_dict()
+        item['score'] = round(score, 6) if score is not None else None
+        data.append(item)
     
     return jsonify({
         'success': True,
-        'data': [log.to_dict() for log in logs],
-        'total': total
+        'data': data,
+        'total': result.total,
+        'totalExact': result.total_exact,
+        'searchMode': result.mode,
+        'next_cursor': result.next_cursor
     })
 
 
+@logs_bp.route('/export', methods=['GET'])
+@login_required
+def export_logs():
+    """流式导出系统日志（CSV / NDJSON，可选 gzip），按时间正序"""
+    fmt, compress = parse_export_options(request.args)
+    if fmt is None:
+        return jsonify({'success': False, 'message': f'format必须是以下值之一: {", ".join(EXPORT_FORMATS)}'}), 400
+    
+    level = request.args.get('level')
+    module = request.args.get('module')
+    start_time = request.args.get('start_time')
+    end_time = request.args.get('end_time')
+    
+    columns = [Log.id, Log.timestamp, Log.level, Log.module, Log.operator, Log.action, Log.details, Log.ip]
+    statement = select(*columns)
+    conditions = []
+    
+    if level:
+        statement = statement.where(Log.level == level)
+        conditions.append(f'级别: {level}')
+    
+    if module:
+        statement = statement.where(Log.module == module)
+        conditions.append(f'模块: {module}')
+    
+    if start_time:
+        try:
+            start_dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
+            statement = statement.where(Log.timestamp >= start_dt)
+            conditions.append(f'开始: {start_dt.isoformat()}')
+        except ValueError:
+            pass
+    
+    if end_time:
+        try:
+            end_dt = datetime.fromisoformat(end_time.replace('Z', '+00:00'))
+            statement = statement.where(Log.timestamp <= end_dt)
+            conditions.append(f'结束: {end_dt.isoformat()}')
+        except ValueError:
+            pass
+    
+    # 导出记录本身写在导出范围确定之后，不会出现在本次导出结果中
+    with unit_of_work():
+        audit_log('系统日志', '导出数据', f'导出系统日志 ({fmt}) ' + (', '.join(conditions) or '全部'))
+    
+    statement = statement.order_by(Log.timestamp, Log.id)
+    return export_response(statement, [column.key for column in columns], fmt,
+                           f'logs_{datetime.now():%Y%m%d%H%M%S}', compress)
+
+
 @logs_bp.route('/statistics', methods=['GET'])
 @login_required
 def get_log_statistics():
-    """获取日志统计数据"""
+    """获取日志统计数据（可按时间桶返回趋势）"""
     start_time = request.args.get('start_time')
     end_time = request.args.get('end_time')
-    
-    query = Log.query
+    bucket = request.args.get('bucket')
     
     # 默认查询最近30天
     if not start_time:
@@ -142,22 +222,27 @@ def get_log_statistics():
         except ValueError:
             end_dt = datetime.now()
     
-    query = query.filter(
-        Log.timestamp >= start_dt,
-        Log.timestamp <= end_dt
-    )
-    
-    total = query.count()
-    info_count = query.filter(Log.level == 'INFO').count()
-    warning_count = query.filter(Log.level == 'WARNING').count()
-    error_count = query.filter(Log.level == 'ERROR').count()
+    width = None
+    if bucket:
+        width = parse_bucket_width(bucket)
+        if width is None:
+            return jsonify({'success': False, 'message': '桶宽格式无效，示例: 30m, 6h, 2d, 1w'}), 400
+        if bucket_count(start_dt, end_dt, width) > MAX_BUCKETS:
+            return jsonify({'success': False, 'message': f'时间范围内的桶数不能超过{MAX_BUCKETS}'}), 400
+    
+    # 各级别计数在同一次范围扫描中完成
+    counts, trend = count_by_conditions({
+        'info': Log.level == 'INFO',
+        'warning': Log.level == 'WARNING',
+        'error': Log.level == 'ERROR'
+    }, [Log.timestamp >= start_dt, Log.timestamp <= end_dt],
+        time_column=Log.timestamp, start=start_dt, end=end_dt, width=width)
+    
+    data = dict(counts)
+    if trend is not None:
+        data['trend'] = trend
     
     return jsonify({
         'success': True,
-        'data': {
-            'info': info_count,
-            'warning': warning_count,
-            'error': error_count,
-            'total': total
-        }
+        'data': data
     })
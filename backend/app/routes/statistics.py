@@ -1,11 +1,14 @@
 from flask import Blueprint, request, jsonify
 from app import db
-from app.models.device import Device
 from app.models.feeding import FeedingHistory
-from app.models.environment import EnvironmentData
-from app.models.alert import Alert
 from app.models.pond import Pond
+from app.services.list_totals import list_totals
+from app.services.config_cache import config_cache
+from app.services.partitions import partition_manager
+from app.services.stat_counters import stat_counters
+from app.services.trend import PERIODS, MAX_BUCKETS, parse_bucket_width, cumulative_trend
 from app.utils.decorators import login_required
+from bisect import bisect_left
 from datetime import datetime, timedelta
 from sqlalchemy import func
 import random
@@ -18,27 +21,23 @@ statistics_bp = Blueprint('statistics', __name__)
 def get_overview_statistics():
     """获取系统总览统计数据"""
     try:
-        # 统计总数
-        total_devices = Device.query.count()
-        total_feedings = FeedingHistory.query.count()
-        total_alerts = Alert.query.count()
-        total_monitoring = EnvironmentData.query.count()
+        # 读取写入方维护的计数器，避免每次全表 COUNT
+        counters = stat_counters.snapshot()
         
-        # 在线设备数
-        online_devices = Device.query.filter_by(status='online').count()
-        
-        # 未解决的告警数
-        unresolved_alerts = Alert.query.filter_by(status='未处理').count()
+        total_devices = sum(value for name, value in counters.items() if name.startswith('devices.status.'))
+        online_devices = counters.get('devices.status.online', 0)
+        resolved_alerts = counters.get('alerts.resolved', 0)
+        unresolved_alerts = counters.get('alerts.unresolved', 0)
         
         return jsonify({
             'success': True,
             'data': {
                 'totalDevices': total_devices,
                 'onlineDevices': online_devices,
-                'totalFeedings': total_feedings,
-                'totalAlerts': total_alerts,
+                'totalFeedings': counters.get('feedings.total', 0),
+                'totalAlerts': resolved_alerts + unresolved_alerts,
                 'unresolvedAlerts': unresolved_alerts,
-                'totalMonitoring': total_monitoring
+                'totalMonitoring': counters.get('monitoring.total', 0)
             }
         })
     except Exception as e:
@@ -48,6 +47,25 @@ def get_overview_statistics():
         }), 500
 
 
+@statistics_bp.route('/counters', methods=['GET'])
+@login_required
+def get_counter_status():
+    """获取统计计数器、校准任务及列表总数缓存状态"""
+    counters = stat_counters.snapshot()
+    data = stat_counters.stats()
+    data['counters'] = counters
+    data['listTotals'] = list_totals.stats()
+    data['configCache'] = config_cache.stats()
+    return jsonify({'success': True, 'data': data})
+
+
+@statistics_bp.route('/partitions', methods=['GET'])
+@login_required
+def get_partition_status():
+    """获取时间分区与数据保留状态"""
+    return jsonify({'success': True, 'data': partition_manager.stats()})
+
+
 @statistics_bp.route('/pond/trend', methods=['GET'])
 @login_required
 def get_pond_trend():
@@ -56,8 +74,22 @@ def get_pond_trend():
         period = request.args.get('period', '7d')
         now = datetime.now()
         
-        # 检查是否有鱼塘数据
-        total_ponds = Pond.query.count()
+        # 自定义桶宽和桶数（如 bucket=6h&buckets=28），否则按预定义周期
+        bucket = request.args.get('bucket')
+        if bucket:
+            width = parse_bucket_width(bucket)
+            if width is None:
+                return jsonify({'success': False, 'message': '桶宽格式无效，示例: 30m, 6h, 2d, 1w'}), 400
+            count = request.args.get('buckets', 12, type=int)
+            if not count or count <= 0 or count > MAX_BUCKETS:
+                return jsonify({'success': False, 'message': f'桶数必须在1-{MAX_BUCKETS}之间'}), 400
+            fmt = None
+        else:
+            count, width, fmt = PERIODS.get(period, PERIODS['1y'])
+        
+        # 一次查询取出全部鱼塘的创建时间（升序）和状态，其余统计均在内存中完成
+        rows = db.session.query(Pond.created_at, Pond.status).order_by(Pond.created_at).all()
+        total_ponds = len(rows)
         
         if total_ponds == 0:
             # 如果没有数据，返回空数据
@@ -74,51 +106,17 @@ def get_pond_trend():
                 }
             })
         
-        # 根据时间范围计算鱼塘增长趋势
-        if period == '7d':
-            # 近一周：显示最近一周每天的鱼塘总数
-            labels = []
-            counts = []
-            for i in range(7):
-                date = now - timedelta(days=6-i)
-                labels.append(date.strftime('%m-%d'))
-                # 统计该日期之前创建的所有鱼塘
-                count = Pond.query.filter(Pond.created_at <= date).count()
-                counts.append(count)
-        elif period == '30d':
-            # 近一个月：显示每5天的数据
-            labels = []
-            counts = []
-            for i in range(6):
-                date = now - timedelta(days=25-i*5)
-                labels.append(date.strftime('%m-%d'))
-                count = Pond.query.filter(Pond.created_at <= date).count()
-                counts.append(count)
-        elif period == '3m':
-            # 近三个月：显示每两周的数据
-            labels = []
-            counts = []
-            for i in range(6):
-                date = now - timedelta(days=75-i*15)
-                labels.append(date.strftime('%m-%d'))
-                count = Pond.query.filter(Pond.created_at <= date).count()
-                counts.append(count)
-        else:  # 1y
-            # 近一年：显示12个月的数据
-            labels = []
-            counts = []
-            for i in range(12):
-                date = now - timedelta(days=(11-i)*30)
-                labels.append(date.strftime('%Y-%m'))
-                count = Pond.query.filter(Pond.created_at <= date).count()
-                counts.append(count)
+        created_times = [row.created_at for row in rows]
+        
+        # 每个时间点的鱼塘总数 = 该时间点之前创建的鱼塘数（二分查找）
+        labels, counts = cumulative_trend(created_times, now, count, width, fmt)
         
         # 统计本月新增鱼塘
         month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        new_this_month = Pond.query.filter(Pond.created_at >= month_start).count()
+        new_this_month = total_ponds - bisect_left(created_times, month_start)
         
         # 计算利用率（活跃鱼塘比例）
-        active_count = Pond.query.filter_by(status='active').count()
+        active_count = sum(1 for row in rows if row.status == 'active')
         utilization_rate = int((active_count / total_ponds) * 100) if total_ponds > 0 else 0
         
         return jsonify({
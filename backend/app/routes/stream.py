@@ -0,0 +1,78 @@
+from flask import Blueprint, request, jsonify, Response
+from app.services.event_hub import event_hub, EVENT_TYPES
+from app.utils.decorators import login_required
+from app.utils.long_requests import long_requests
+import json
+
+stream_bp = Blueprint('stream', __name__)
+
+# 无事件时发送心跳注释的间隔（秒），防止代理断开空闲连接
+HEARTBEAT_INTERVAL = 15
+
+
+def format_event(event):
+    """格式化为 Server-Sent Events 消息"""
+    data = json.dumps(event['data'], ensure_ascii=False)
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
+
+
+@stream_bp.route('', methods=['GET'])
+@login_required
+def stream_events():
+    """
+    实时事件推送（Server-Sent Events）
+    
+    推送新的环境数据以及告警的新增/处理事件，可按设备、鱼塘和事件类型过滤。
+    每个连接会占用一个工作线程，需使用多线程或协程工作模式部署；
+    单线程同步工作模式或长连接名额用尽时返回503，客户端按退避间隔重连。
+    """
+    types = request.args.get('types')
+    types = [t for t in types.split(',') if t in EVENT_TYPES] if types else list(EVENT_TYPES)
+    if not types:
+        return jsonify({
+            'success': False,
+            'message': f'types必须是以下值之一: {", ".join(EVENT_TYPES)}'
+        }), 400
+    
+    device_id = request.args.get('device_id')
+    pond_id = request.args.get('pond_id', type=int)
+    
+    if not long_requests.acquire():
+        return jsonify({'success': False, 'message': '服务器当前不支持更多实时连接'}), 503
+    
+    subscription = event_hub.subscribe(types, device_id, pond_id)
+    if subscription is None:
+        long_requests.release()
+        return jsonify({'success': False, 'message': '实时连接数已达上限'}), 503
+    
+    def generate():
+        # 断线后客户端3秒重连
+        yield 'retry: 3000\n\n'
+        while True:
+            event = subscription.get(timeout=HEARTBEAT_INTERVAL)
+            if event is None:
+                yield ': keepalive\n\n'
+                continue
+            yield format_event(event)
+    
+    def close():
+        event_hub.unsubscribe(subscription)
+        long_requests.release()
+    
+    response = Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # 连接关闭时（包括响应尚未开始发送）释放订阅和名额
+    response.call_on_close(close)
+    return response
+
+
+@stream_bp.route('/stats', methods=['GET'])
+@login_required
+def get_stream_stats():
+    """获取实时推送运行指标"""
+    return jsonify({
+        'success': True,
+        'data': {**event_hub.stats(), 'longRequests': long_requests.stats()}
+    })
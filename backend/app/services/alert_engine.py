@@ -0,0 +1,382 @@
+"""
+环境告警引擎
+
+环境数据入库时按阈值评估读数，在同一事务中创建或自动解除告警。
+
+- 阈值从配置缓存读取（版本号变化后重新加载），设备位置和告警状态缓存在进程内定期刷新，
+  评估时通常不查询数据库；
+- 整批读数先用 numpy 向量化比较，只有越限或已处于告警中的 (来源, 指标) 才逐条进入状态机，
+  正常读数只有一次数组比较的开销；
+- 越限需持续 ALERT_MIN_DURATION 秒才产生告警，短暂抖动不告警；
+- 告警解除需回到阈值范围内侧 ALERT_HYSTERESIS 的位置（回差），
+  读数在阈值附近来回波动时不会反复产生、解除告警；
+- 同一 (设备, 鱼塘, 指标) 同时最多一条未处理的告警，由告警表 open_key 唯一约束保证：
+  多个进程（或同一进程的写缓冲线程和批量上报请求）并发产生同一来源的告警时，
+  后写入的一方在保存点内插入失败，改为沿用已有的告警。
+"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models.alert import Alert
+from app.models.device import Device
+from app.models.pond import Pond
+from app.services.config_cache import config_cache, get_thresholds, THRESHOLDS
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class AlertMetric:
+    """参与告警评估的指标"""
+    field: str  # 读数字段
+    config_key: str  # 阈值配置中的键
+    label: str  # 显示名称
+    unit: str
+    low_level: str  # 低于下限时的告警级别
+    high_level: str  # 高于上限时的告警级别
+
+
+ALERT_METRICS = (
+    AlertMetric('temperature', 'temperature', '水温', '°C', 'warning', 'warning'),
+    AlertMetric('dissolved_oxygen', 'dissolvedOxygen', '溶解氧', 'mg/L', 'error', 'warning'),
+    AlertMetric('ph', 'ph', 'pH值', '', 'warning', 'warning'),
+)
+
+METRIC_FIELDS = tuple(metric.field for metric in ALERT_METRICS)
+
+# 数据库中没有阈值配置时使用的默认值（与阈值表默认值一致）
+DEFAULT_THRESHOLDS = {
+    'temperature': (18.0, 28.0),
+    'dissolved_oxygen': (5.0, 8.0),
+    'ph': (7.0, 8.0),
+}
+
+DEFAULT_HYSTERESIS = {
+    'temperature': 0.5,
+    'dissolved_oxygen': 0.3,
+    'ph': 0.1,
+}
+
+# 告警状态
+PENDING = 'pending'  # 已越限，尚未达到最短持续时间
+ACTIVE = 'active'  # 已产生告警
+
+# 状态键: (device_id, pond_id, 指标下标)
+StateKey = Tuple[Optional[str], Optional[int], int]
+
+
+@dataclass
+class AlertState:
+    status: str
+    since: datetime  # 开始越限的读数时间
+    side: Optional[str]  # low / high，从数据库恢复的告警为None
+    alert_id: Optional[int] = None
+
+
+@dataclass
+class Thresholds:
+    """阈值快照（numpy 数组，按 ALERT_METRICS 顺序）"""
+    low: np.ndarray
+    high: np.ndarray
+    clear_low: np.ndarray  # 告警解除需要回到的区间
+    clear_high: np.ndarray
+    version: int  # 加载时的阈值配置版本
+    loaded_at: float
+
+
+@dataclass
+class AlertBatch:
+    """一批读数的评估结果，提交成功后 commit，失败时 rollback 恢复状态"""
+    created: List[Alert] = field(default_factory=list)
+    resolved: List[Alert] = field(default_factory=list)
+    recovered: Dict[int, datetime] = field(default_factory=dict)  # 待解除的告警ID -> 恢复时间
+    previous: Dict[StateKey, Optional[AlertState]] = field(default_factory=dict)
+
+
+class AlertEngine:
+    """环境告警引擎"""
+
+    def __init__(self):
+        self.enabled = True
+        self.refresh_interval = 30.0
+        self.min_duration = 60.0
+        self.hysteresis = dict(DEFAULT_HYSTERESIS)
+        self._thresholds: Optional[Thresholds] = None
+        self._devices: Dict[str, str] = {}
+        self._ponds: Dict[int, str] = {}
+        self._states: Dict[StateKey, AlertState] = {}
+        self._lock = threading.RLock()
+        self._stats = {'readings': 0, 'evaluated': 0, 'created': 0, 'resolved': 0,
+                       'suppressed': 0, 'duplicates': 0, 'batches': 0, 'seconds': 0.0}
+
+    def init_app(self, app):
+        self.enabled = app.config.get('ALERT_ENGINE_ENABLED', True)
+        self.refresh_interval = app.config.get('ALERT_STATE_REFRESH_INTERVAL', 30.0)
+        self.min_duration = app.config.get('ALERT_MIN_DURATION', 60)
+        self.hysteresis = {**DEFAULT_HYSTERESIS, **app.config.get('ALERT_HYSTERESIS', {})}
+
+    # ------------------------------------------------------------------
+    # 阈值与告警状态缓存
+    # ------------------------------------------------------------------
+
+    def _load(self, version: int) -> Thresholds:
+        config = get_thresholds()
+        bounds = [
+            (config[metric.config_key]['min'], config[metric.config_key]['max'])
+            if config else DEFAULT_THRESHOLDS[metric.field]
+            for metric in ALERT_METRICS
+        ]
+        low = np.array([bound[0] for bound in bounds], dtype=float)
+        high = np.array([bound[1] for bound in bounds], dtype=float)
+        margin = np.array([self.hysteresis.get(name, 0.0) for name in METRIC_FIELDS], dtype=float)
+        # 区间过窄时回差收缩到区间中点
+        margin = np.minimum(margin, (high - low) / 2)
+
+        self._devices = dict(db.session.query(Device.id, Device.location).all())
+        self._ponds = {pond_id: name for pond_id, name in db.session.query(Pond.id, Pond.name).all()}
+        self._sync_states()
+        return Thresholds(low, high, low + margin, high - margin, version, time.monotonic())
+
+    def _sync_states(self):
+        """
+        与数据库中未处理的告警对齐
+
+        手工处理的告警从状态中移除（越限仍持续时重新计时），
+        其他进程产生的告警或重启前的告警补入状态，避免重复告警。
+        """
+        rows = db.session.query(
+            Alert.id, Alert.device_id, Alert.pond_id, Alert.metric, Alert.time
+        ).filter(Alert.resolved == False, Alert.metric.isnot(None)).all()
+
+        active = {}
+        for alert_id, device_id, pond_id, metric, since in rows:
+            if metric in METRIC_FIELDS:
+                key = (device_id, pond_id, METRIC_FIELDS.index(metric))
+                active[key] = AlertState(ACTIVE, since, None, alert_id)
+
+        for key, state in list(self._states.items()):
+            if state.status == ACTIVE and key not in active:
+                del self._states[key]
+        for key, state in active.items():
+            current = self._states.get(key)
+            if current is None or current.status != ACTIVE:
+                self._states[key] = state
+
+    def thresholds(self) -> Thresholds:
+        """阈值快照，阈值配置版本变化时重新加载，并定期刷新设备位置和告警状态"""
+        snapshot = self._thresholds
+        version = config_cache.version(THRESHOLDS)
+        if (snapshot is None or snapshot.version != version
+                or time.monotonic() - snapshot.loaded_at > self.refresh_interval):
+            with self._lock:
+                snapshot = self._thresholds = self._load(version)
+        return snapshot
+
+    def _location(self, device_id: Optional[str], pond_id: Optional[int]) -> str:
+        if device_id and device_id in self._devices:
+            return self._devices[device_id]
+        if pond_id is not None and pond_id in self._ponds:
+            return self._ponds[pond_id]
+        return device_id or (f'{pond_id}号鱼塘' if pond_id is not None else '未知位置')
+
+    # ------------------------------------------------------------------
+    # 评估
+    # ------------------------------------------------------------------
+
+    def evaluate(self, rows: List[Dict]) -> Optional[AlertBatch]:
+        """
+        评估一批读数（在写入环境数据的事务中调用）
+
+        新增和解除的告警已加入会话并 flush，随调用方的事务一起提交；
+        没有任何告警变化时返回None。
+        """
+        if not self.enabled or not rows:
+            return None
+
+        started = time.perf_counter()
+        th = self.thresholds()
+        values = np.array([[row[name] for name in METRIC_FIELDS] for row in rows], dtype=float)
+        # 上报时缺失、按0补齐的读数不参与评估
+        missing = np.zeros(values.shape, dtype=bool)
+        for i, row in enumerate(rows):
+            for name in row.get('defaulted', ()):
+                missing[i, METRIC_FIELDS.index(name)] = True
+        low = (values < th.low) & ~missing
+        high = (values > th.high) & ~missing
+        self._stats['readings'] += len(rows)
+
+        with self._lock:
+            states = self._states
+            violating = np.flatnonzero((low | high).any(axis=1))
+            if not states and not len(violating):
+                self._record_time(started)
+                return None
+
+            # 越限或已有告警状态的来源，本批中该来源的全部读数（包括恢复正常的读数）都要进入状态机
+            sources = {(key[0], key[1]) for key in states}
+            sources.update((rows[i].get('device_id'), rows[i].get('pond_id')) for i in violating)
+            candidates = [
+                i for i, row in enumerate(rows)
+                if (row.get('device_id'), row.get('pond_id')) in sources
+            ]
+
+            batch = AlertBatch()
+            recover = (values >= th.clear_low) & (values <= th.clear_high)
+            candidates.sort(key=lambda i: rows[i]['timestamp'])
+            for i in candidates:
+                row = rows[i]
+                for j in range(len(ALERT_METRICS)):
+                    key = (row.get('device_id'), row.get('pond_id'), j)
+                    if low[i, j] or high[i, j]:
+                        self._on_violation(batch, key, row, j, 'low' if low[i, j] else 'high', th)
+                    elif key in states and not missing[i, j]:
+                        self._on_normal(batch, key, row, bool(recover[i, j]))
+            self._stats['evaluated'] += len(candidates)
+
+            if batch.recovered:
+                batch.resolved = Alert.query.filter(
+                    Alert.id.in_(list(batch.recovered)), Alert.resolved == False
+                ).all()
+                for alert in batch.resolved:
+                    alert.resolve('system', batch.recovered[alert.id])
+                # 先写入解除，释放来源键
+                db.session.flush()
+            for alert in list(batch.created):
+                # 逐条在保存点内插入（新增告警很少），统计计数器由会话事件同步维护
+                key = (alert.device_id, alert.pond_id, METRIC_FIELDS.index(alert.metric))
+                try:
+                    with db.session.begin_nested():
+                        db.session.add(alert)
+                except IntegrityError:
+                    # 其他事务已为该来源产生告警
+                    batch.created.remove(alert)
+                    states[key].alert_id = db.session.query(Alert.id).filter(
+                        Alert.open_key == alert.open_key
+                    ).scalar()
+                    self._stats['duplicates'] += 1
+                    continue
+                states[key].alert_id = alert.id
+
+        self._record_time(started)
+        return batch if batch.previous else None
+
+    def _remember(self, batch: AlertBatch, key: StateKey):
+        if key not in batch.previous:
+            current = self._states.get(key)
+            batch.previous[key] = None if current is None else AlertState(
+                current.status, current.since, current.side, current.alert_id
+            )
+
+    def _on_violation(self, batch: AlertBatch, key: StateKey, row: Dict, j: int, side: str, th: Thresholds):
+        state = self._states.get(key)
+        timestamp = row['timestamp']
+        if state is None:
+            self._remember(batch, key)
+            state = self._states[key] = AlertState(PENDING, timestamp, side)
+        elif state.status == PENDING and state.side != side:
+            # 越限方向变化（如骤升骤降）重新计时
+            self._remember(batch, key)
+            state.since, state.side = timestamp, side
+
+        if state.status == PENDING and (timestamp - state.since).total_seconds() >= self.min_duration:
+            self._remember(batch, key)
+            state.status = ACTIVE
+            batch.created.append(self._build_alert(row, j, side, state.since, th))
+
+    def _on_normal(self, batch: AlertBatch, key: StateKey, row: Dict, recovered: bool):
+        state = self._states[key]
+        if state.status == PENDING:
+            self._remember(batch, key)
+            del self._states[key]
+            self._stats['suppressed'] += 1
+        elif recovered:
+            self._remember(batch, key)
+            del self._states[key]
+            if state.alert_id is not None:
+                batch.recovered[state.alert_id] = row['timestamp']
+
+    def _build_alert(self, row: Dict, j: int, side: str, since: datetime, th: Thresholds) -> Alert:
+        metric = ALERT_METRICS[j]
+        value = row[metric.field]
+        if side == 'low':
+            title = f'{metric.label}过低'
+            description = f'{metric.label}降至{value:g}{metric.unit}，低于下限{th.low[j]:g}{metric.unit}'
+            level = metric.low_level
+        else:
+            title = f'{metric.label}过高'
+            description = f'{metric.label}达到{value:g}{metric.unit}，超过上限{th.high[j]:g}{metric.unit}'
+            level = metric.high_level
+        return Alert(
+            title=title,
+            level=level,
+            time=since,
+            location=self._location(row.get('device_id'), row.get('pond_id'))[:100],
+            description=description,
+            resolved=False,
+            device_id=row.get('device_id'),
+            pond_id=row.get('pond_id'),
+            metric=metric.field,
+            open_key=Alert.make_open_key(row.get('device_id'), row.get('pond_id'), metric.field)
+        )
+
+    def commit(self, batch: Optional[AlertBatch]):
+        """事务提交后发布告警事件"""
+        if not batch:
+            return
+        from app.services.event_hub import publish_alerts
+        self._stats['created'] += len(batch.created)
+        self._stats['resolved'] += len(batch.resolved)
+        publish_alerts(batch.created, 'created')
+        publish_alerts(batch.resolved, 'resolved')
+
+    def rollback(self, batch: Optional[AlertBatch]):
+        """事务回滚时恢复本批修改过的告警状态"""
+        if not batch:
+            return
+        with self._lock:
+            for key, state in batch.previous.items():
+                if state is None:
+                    self._states.pop(key, None)
+                else:
+                    self._states[key] = state
+
+    def _record_time(self, started: float):
+        self._stats['batches'] += 1
+        self._stats['seconds'] += time.perf_counter() - started
+
+    def reset(self):
+        """清空缓存和状态（测试、基准脚本使用）"""
+        with self._lock:
+            self._thresholds = None
+            self._states.clear()
+
+    def stats(self) -> Dict:
+        readings = self._stats['readings']
+        states = list(self._states.values())
+        return {
+            'enabled': self.enabled,
+            'minDurationSeconds': self.min_duration,
+            'hysteresis': self.hysteresis,
+            'pending': sum(1 for state in states if state.status == PENDING),
+            'active': sum(1 for state in states if state.status == ACTIVE),
+            'readings': readings,
+            'evaluated': self._stats['evaluated'],
+            'created': self._stats['created'],
+            'resolved': self._stats['resolved'],
+            'suppressed': self._stats['suppressed'],
+            'duplicates': self._stats['duplicates'],
+            'avgMicrosPerReading': round(self._stats['seconds'] / readings * 1e6, 2) if readings else None
+        }
+
+
+# 全局告警引擎实例
+alert_engine = AlertEngine()
@@ -0,0 +1,404 @@
+"""
+设备指令队列
+
+下发给设备的指令（投喂等）持久化在 device_commands 表中，按设备排队：
+- 设备以长轮询拉取指令：没有可下发的指令时请求在服务端挂起，
+  本进程入队的指令在事务提交后立即唤醒该设备的挂起请求；
+  其他进程入队的指令由挂起期间每 COMMAND_RECHECK_INTERVAL 秒一次的复查取到；
+  挂起的请求占用工作线程，按长连接名额（见 app.utils.long_requests）限制，
+  单线程同步工作模式或名额用尽时不挂起，由设备按 retryAfter 间隔重新拉取；
+- 设备批量回执，指令状态与对应投喂记录的状态在一个事务中更新；
+- 下发后超过 COMMAND_ACK_TIMEOUT 秒未回执的指令再次下发，最多 COMMAND_MAX_ATTEMPTS 次，
+  超过有效期或重试次数用尽仍未回执的指令由清扫任务标记为过期。
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, event, func, insert, or_, select, update
+from sqlalchemy.orm import joinedload
+
+from app import db
+from app.models.device import DeviceCommand
+from app.utils.long_requests import long_requests
+from app.utils.unit_of_work import unit_of_work, audit_log
+
+logger = logging.getLogger(__name__)
+
+
+# 设备可回执的结果
+ACK_STATUSES = ('done', 'failed')
+
+# 单次回执最多条数
+MAX_ACK_BATCH = 1000
+
+# 审计日志中最多列出的指令数
+LOGGED_COMMANDS = 20
+
+# 会话中记录本事务入队指令的设备，提交后唤醒
+_NOTIFY_KEY = 'command_queue.notify'
+
+
+def _describe(commands: List[DeviceCommand]) -> str:
+    shown = ', '.join(f'#{command.id}({command.device_id})' for command in commands[:LOGGED_COMMANDS])
+    if len(commands) > LOGGED_COMMANDS:
+        shown += f' 等{len(commands)}条'
+    return shown
+
+
+class _Waiters:
+    """同一设备的挂起请求，入队时递增 generation 并唤醒"""
+
+    __slots__ = ('condition', 'generation', 'count')
+
+    def __init__(self, lock):
+        self.condition = threading.Condition(lock)
+        self.generation = 0
+        self.count = 0
+
+
+class CommandQueue:
+    """设备指令队列"""
+
+    def __init__(self):
+        self.ttl = 300.0
+        self.ack_timeout = 30.0
+        self.max_attempts = 3
+        self.long_poll_timeout = 25.0
+        self.recheck_interval = 5.0
+        self.fetch_limit = 20
+        self.max_waiters = 500
+        self.job = None
+        self._waiters: Dict[str, _Waiters] = {}
+        self._waiting = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            'enqueued': 0, 'delivered': 0, 'redelivered': 0, 'wakeups': 0,
+            'done': 0, 'failed': 0, 'expired': 0, 'rejected': 0
+        }
+
+    def init_app(self, app):
+        """读取队列配置，注册提交事件，并按配置启动过期清扫任务"""
+        self.ttl = float(app.config.get('COMMAND_TTL', 300))
+        self.ack_timeout = float(app.config.get('COMMAND_ACK_TIMEOUT', 30))
+        self.max_attempts = app.config.get('COMMAND_MAX_ATTEMPTS', 3)
+        self.long_poll_timeout = float(app.config.get('COMMAND_LONG_POLL_TIMEOUT', 25))
+        self.recheck_interval = float(app.config.get('COMMAND_RECHECK_INTERVAL', 5))
+        self.fetch_limit = app.config.get('COMMAND_FETCH_LIMIT', 20)
+        self.max_waiters = app.config.get('COMMAND_MAX_WAITERS', 500)
+
+        if not event.contains(db.session, 'after_commit', self._after_commit):
+            event.listen(db.session, 'after_commit', self._after_commit)
+            event.listen(db.session, 'after_rollback', self._after_rollback)
+
+        if app.config.get('COMMAND_SWEEP_ENABLED', True):
+            from app.services.lease import LeasedJob
+            self.job = LeasedJob(
+                'device_command_sweep',
+                self.sweep,
+                app.config.get('COMMAND_SWEEP_INTERVAL', 30)
+            )
+            self.job.start(app)
+
+    # ------------------------------------------------------------------
+    # 入队与唤醒
+    # ------------------------------------------------------------------
+
+    def enqueue(self, device_id: str, command: str, payload: Dict,
+                history=None) -> DeviceCommand:
+        """
+        在当前事务中加入一条指令，事务提交后唤醒该设备的挂起请求
+
+        history 为对应的投喂记录，设备回执或指令过期时同步更新其状态。
+        """
+        now = datetime.now()
+        item = DeviceCommand(
+            device_id=device_id,
+            command=command,
+            payload=payload,
+            history=history,
+            status='pending',
+            attempts=0,
+            created_at=now,
+            expires_at=now + timedelta(seconds=self.ttl)
+        )
+        db.session.add(item)
+        db.session.info.setdefault(_NOTIFY_KEY, set()).add(device_id)
+        self._stats['enqueued'] += 1
+        return item
+
+    def enqueue_many(self, commands: List[Dict]) -> int:
+        """
+        在当前事务中以一条批量语句加入多条指令，事务提交后唤醒相关设备的挂起请求
+
+        commands 每项包含 device_id、command、payload，可选 history_id（已写入的投喂记录ID）。
+        """
+        if not commands:
+            return 0
+        now = datetime.now()
+        rows = [{
+            'device_id': item['device_id'],
+            'command': item['command'],
+            'payload': item['payload'],
+            'history_id': item.get('history_id'),
+            'status': 'pending',
+            'attempts': 0,
+            'created_at': now,
+            'expires_at': now + timedelta(seconds=self.ttl)
+        } for item in commands]
+        db.session.execute(insert(DeviceCommand), rows)
+        db.session.info.setdefault(_NOTIFY_KEY, set()).update(row['device_id'] for row in rows)
+        self._stats['enqueued'] += len(rows)
+        return len(rows)
+
+    def _after_commit(self, session):
+        device_ids = session.info.pop(_NOTIFY_KEY, None)
+        if device_ids:
+            self.notify(device_ids)
+
+    def _after_rollback(self, session):
+        session.info.pop(_NOTIFY_KEY, None)
+
+    def notify(self, device_ids: Iterable[str]):
+        """唤醒设备的挂起请求"""
+        with self._lock:
+            for device_id in device_ids:
+                waiters = self._waiters.get(device_id)
+                if waiters is not None:
+                    waiters.generation += 1
+                    waiters.condition.notify_all()
+
+    def _register(self, device_id: str) -> Optional[_Waiters]:
+        with self._lock:
+            if self._waiting >= self.max_waiters or not long_requests.acquire():
+                self._stats['rejected'] += 1
+                return None
+            waiters = self._waiters.get(device_id)
+            if waiters is None:
+                waiters = self._waiters[device_id] = _Waiters(self._lock)
+            waiters.count += 1
+            self._waiting += 1
+            return waiters
+
+    def _unregister(self, device_id: str, waiters: _Waiters):
+        with self._lock:
+            waiters.count -= 1
+            self._waiting -= 1
+            if waiters.count == 0:
+                self._waiters.pop(device_id, None)
+        long_requests.release()
+
+    # ------------------------------------------------------------------
+    # 下发
+    # ------------------------------------------------------------------
+
+    def _deliverable(self, now: datetime):
+        """可下发：未下发，或已下发但回执超时且仍可重试；均未过期"""
+        return and_(
+            DeviceCommand.expires_at > now,
+            or_(
+                DeviceCommand.status == 'pending',
+                and_(
+                    DeviceCommand.status == 'sent',
+                    DeviceCommand.sent_at < now - timedelta(seconds=self.ack_timeout),
+                    DeviceCommand.attempts < self.max_attempts
+                )
+            )
+        )
+
+    def fetch(self, device_id: str, limit: Optional[int] = None) -> List[Dict]:
+        """
+        认领并返回设备当前可下发的指令（不等待）
+
+        每条指令以 attempts 条件更新认领，同一设备的并发请求不会重复下发同一次重试。
+        """
+        now = datetime.now()
+        rows = db.session.execute(
+            select(
+                DeviceCommand.id, DeviceCommand.command, DeviceCommand.payload,
+                DeviceCommand.attempts, DeviceCommand.expires_at
+            )
+            .where(DeviceCommand.device_id == device_id, self._deliverable(now))
+            .order_by(DeviceCommand.id)
+            .limit(limit or self.fetch_limit)
+        ).all()
+        if not rows:
+            # 结束只读事务：归还连接，复查时也能看到其他事务新提交的指令
+            db.session.rollback()
+            return []
+
+        messages = []
+        for row in rows:
+            result = db.session.execute(
+                update(DeviceCommand)
+                .where(DeviceCommand.id == row.id, DeviceCommand.attempts == row.attempts)
+                .values(status='sent', attempts=DeviceCommand.attempts + 1, sent_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount != 1:
+                continue
+            messages.append({
+                'id': row.id,
+                'command': row.command,
+                'payload': row.payload,
+                'attempt': row.attempts + 1,
+                'expiresAt': row.expires_at.isoformat()
+            })
+            if row.attempts:
+                self._stats['redelivered'] += 1
+        db.session.commit()
+        self._stats['delivered'] += len(messages)
+        return messages
+
+    def poll(self, device_id: str, wait: Optional[float] = None,
+             limit: Optional[int] = None) -> Tuple[List[Dict], Optional[float]]:
+        """
+        长轮询拉取指令（需在请求上下文中调用）
+
+        有可下发的指令时立即返回；否则挂起至多 wait 秒（不超过 COMMAND_LONG_POLL_TIMEOUT），
+        期间被入队唤醒或到复查时间时重新查询。挂起期间不占用数据库连接。
+        挂起请求数达到 COMMAND_MAX_WAITERS、或当前工作进程没有空闲的长连接名额时不挂起，直接返回当前结果。
+
+        返回:
+            (指令列表, 建议设备下次拉取前等待的秒数)；请求已按 wait 挂起或取到指令时等待秒数为None
+        """
+        wait = self.long_poll_timeout if wait is None else max(0.0, min(wait, self.long_poll_timeout))
+        deadline = time.monotonic() + wait
+        waiters = self._register(device_id) if wait > 0 else None
+        retry_after = self.recheck_interval if wait > 0 and waiters is None else None
+        try:
+            while True:
+                generation = waiters.generation if waiters else 0
+                messages = self.fetch(device_id, limit)
+                remaining = deadline - time.monotonic()
+                if messages:
+                    return messages, None
+                if waiters is None or remaining <= 0:
+                    return messages, retry_after
+                with waiters.condition:
+                    woken = waiters.condition.wait_for(
+                        lambda: waiters.generation != generation,
+                        timeout=min(remaining, self.recheck_interval)
+                    )
+                if woken:
+                    self._stats['wakeups'] += 1
+        finally:
+            if waiters is not None:
+                self._unregister(device_id, waiters)
+
+    # ------------------------------------------------------------------
+    # 回执与过期
+    # ------------------------------------------------------------------
+
+    def ack(self, device_id: str, acks: List[Dict]) -> Dict[str, List[int]]:
+        """
+        处理设备的批量回执，指令与投喂记录的状态在一个事务中更新
+
+        acks 为 [{'id': 指令ID, 'status': 'done' | 'failed', 'result': 说明}]（已校验）。
+        已回执过的指令、不属于该设备的指令计入 ignored，设备重发回执不会重复处理。
+        过期后才收到的回执照常记录：设备已执行的指令以回执为准。
+
+        返回:
+            {'acked': 本次处理的指令ID, 'ignored': 忽略的指令ID}
+        """
+        by_id = {item['id']: item for item in acks}
+        commands = (
+            DeviceCommand.query
+            .options(joinedload(DeviceCommand.history))
+            .filter(DeviceCommand.device_id == device_id, DeviceCommand.id.in_(list(by_id)))
+            .all()
+        )
+
+        now = datetime.now()
+        acked, failed = [], []
+        for command in commands:
+            if command.status in ACK_STATUSES:
+                continue
+            item = by_id[command.id]
+            command.status = item['status']
+            command.result = item.get('result')
+            command.completed_at = now
+            if command.history is not None:
+                command.history.status = item['status']
+            acked.append(command.id)
+            if item['status'] == 'failed':
+                failed.append(command)
+
+        if acked:
+            with unit_of_work():
+                if failed:
+                    audit_log('设备管理', '指令执行失败',
+                              f'设备 {device_id} 回执执行失败: {_describe(failed)}',
+                              level='WARNING', operator='system')
+        else:
+            db.session.rollback()
+
+        self._stats['done'] += len(acked) - len(failed)
+        self._stats['failed'] += len(failed)
+        acked_ids = set(acked)
+        return {'acked': acked, 'ignored': [command_id for command_id in by_id if command_id not in acked_ids]}
+
+    def sweep(self, now: Optional[datetime] = None) -> int:
+        """把超过有效期、或重试次数用尽仍未回执的指令标记为过期，返回处理条数"""
+        now = now or datetime.now()
+        cutoff = now - timedelta(seconds=self.ack_timeout)
+        commands = (
+            DeviceCommand.query
+            .options(joinedload(DeviceCommand.history))
+            .filter(or_(
+                and_(DeviceCommand.status.in_(('pending', 'sent')), DeviceCommand.expires_at <= now),
+                and_(
+                    DeviceCommand.status == 'sent',
+                    DeviceCommand.attempts >= self.max_attempts,
+                    DeviceCommand.sent_at < cutoff
+                )
+            ))
+            .all()
+        )
+        if not commands:
+            return 0
+
+        for command in commands:
+            command.result = '超过有效期未回执' if command.expires_at <= now else '重试次数用尽未回执'
+            command.status = 'expired'
+            command.completed_at = now
+            if command.history is not None and command.history.status == 'pending':
+                command.history.status = 'expired'
+
+        with unit_of_work():
+            audit_log('设备管理', '指令过期', f'{len(commands)}条设备指令未收到回执，已过期: {_describe(commands)}',
+                      level='WARNING', operator='system')
+
+        self._stats['expired'] += len(commands)
+        logger.info('%d 条设备指令已过期', len(commands))
+        return len(commands)
+
+    def stats(self) -> Dict:
+        queued = dict(
+            db.session.query(DeviceCommand.status, func.count(DeviceCommand.id))
+            .filter(DeviceCommand.status.in_(('pending', 'sent')))
+            .group_by(DeviceCommand.status)
+        )
+        with self._lock:
+            waiting = self._waiting
+            devices = len(self._waiters)
+        return {
+            'ttlSeconds': self.ttl,
+            'ackTimeoutSeconds': self.ack_timeout,
+            'maxAttempts': self.max_attempts,
+            'longPollTimeoutSeconds': self.long_poll_timeout,
+            'pending': queued.get('pending', 0),
+            'sent': queued.get('sent', 0),
+            'waiting': waiting,
+            'waitingDevices': devices,
+            **self._stats,
+            'longRequests': long_requests.stats(),
+            'sweepJob': self.job.stats() if self.job else None
+        }
+
+
+# 全局设备指令队列
+command_queue = CommandQueue()
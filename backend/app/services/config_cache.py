@@ -0,0 +1,201 @@
+"""
+配置缓存
+
+环境告警阈值、设备联动配置、设备配置读多写少，缓存在进程内，读取时不访问数据库。
+
+每类配置对应 config_versions 表中的一个版本号，保存配置的接口在同一事务中递增版本号。
+各进程读取配置时最多每 CONFIG_VERSION_POLL_INTERVAL 秒查询一次版本表（一条很小的主键查询），
+版本号变化的配置丢弃本地缓存，因此其他进程修改的配置最多延迟一个轮询间隔可见；
+本进程修改的配置提交后立即可见。
+
+缓存内容同时保存加载时计算的内容摘要，条件请求据此生成 ETag，无需重新序列化配置。
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, NamedTuple, Optional
+
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models.config_version import ConfigVersion
+from app.models.device import DeviceConfig, DeviceLinkageConfig
+from app.models.environment import EnvironmentThreshold
+from app.utils.http_cache import content_digest
+
+
+# 配置命名空间
+THRESHOLDS = 'thresholds'
+LINKAGE = 'linkage'
+DEVICE_CONFIG = 'device_config'
+
+
+class ConfigEntry(NamedTuple):
+    """缓存的配置：内容摘要和内容"""
+    digest: str
+    data: Any
+
+
+def make_entry(data: Any) -> ConfigEntry:
+    return ConfigEntry(content_digest(data), data)
+
+
+# 加载结果为空（数据库中没有该配置）时的占位值，避免反复查询
+_MISSING = object()
+
+
+class ConfigCache:
+    """按版本号失效的配置缓存"""
+
+    def __init__(self):
+        self.poll_interval = 1.0
+        self._versions: Dict[str, int] = {}
+        self._entries: Dict[str, Dict[Hashable, Any]] = {}
+        # 命名空间每次失效时递增，加载期间发生失效的结果不写入缓存
+        self._generations: Dict[str, int] = {}
+        self._last_poll = 0.0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'polls': 0, 'invalidations': 0}
+
+    def init_app(self, app):
+        self.poll_interval = app.config.get('CONFIG_VERSION_POLL_INTERVAL', 1.0)
+
+    def _poll(self, force: bool = False):
+        """读取版本表，丢弃版本号发生变化的命名空间"""
+        now = time.monotonic()
+        if not force and now - self._last_poll < self.poll_interval:
+            return
+        versions = dict(db.session.query(ConfigVersion.name, ConfigVersion.version).all())
+        with self._lock:
+            self._last_poll = now
+            self._stats['polls'] += 1
+            for namespace in set(self._versions) | set(versions):
+                if versions.get(namespace, 0) != self._versions.get(namespace, 0):
+                    if self._invalidate(namespace):
+                        self._stats['invalidations'] += 1
+            self._versions = versions
+
+    def _invalidate(self, namespace: str) -> bool:
+        """丢弃命名空间的缓存（调用方持有锁），返回是否有缓存被丢弃"""
+        self._generations[namespace] = self._generations.get(namespace, 0) + 1
+        return bool(self._entries.pop(namespace, None))
+
+    def version(self, namespace: str) -> int:
+        """当前已知的配置版本号（按轮询间隔刷新）"""
+        self._poll()
+        return self._versions.get(namespace, 0)
+
+    def get(self, namespace: str, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        读取配置，未缓存时调用 loader 加载
+
+        loader 应返回可直接序列化的普通对象（dict 等），配置不存在时返回None；
+        返回值被多个请求共享，调用方不能修改。
+        加载期间该命名空间被判定失效（其他进程保存后本进程轮询到新版本）时，
+        加载结果可能是旧内容，只返回不缓存。
+        """
+        self._poll()
+        with self._lock:
+            entries = self._entries.get(namespace)
+            if entries is not None and key in entries:
+                self._stats['hits'] += 1
+                value = entries[key]
+                return None if value is _MISSING else value
+            self._stats['misses'] += 1
+            generation = self._generations.get(namespace, 0)
+
+        value = loader()
+        with self._lock:
+            if self._generations.get(namespace, 0) == generation:
+                self._entries.setdefault(namespace, {})[key] = _MISSING if value is None else value
+        return value
+
+    def bump(self, namespace: str):
+        """
+        递增配置版本号（在保存配置的事务中调用）
+
+        本进程的缓存立即丢弃，并在下次读取时重新轮询版本表；
+        事务回滚时版本号不变，只是多加载一次配置。
+        """
+        result = db.session.execute(
+            update(ConfigVersion)
+            .where(ConfigVersion.name == namespace)
+            .values(version=ConfigVersion.version + 1)
+        )
+        if result.rowcount == 0:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(insert(ConfigVersion).values(name=namespace, version=1))
+            except IntegrityError:
+                # 其他进程同时创建了版本行
+                db.session.execute(
+                    update(ConfigVersion)
+                    .where(ConfigVersion.name == namespace)
+                    .values(version=ConfigVersion.version + 1)
+                )
+
+        with self._lock:
+            self._invalidate(namespace)
+            self._last_poll = 0.0
+
+    def clear(self):
+        with self._lock:
+            for namespace in set(self._entries) | set(self._generations):
+                self._invalidate(namespace)
+            self._versions.clear()
+            self._last_poll = 0.0
+
+    def stats(self) -> Dict:
+        return {
+            'pollIntervalSeconds': self.poll_interval,
+            'versions': dict(self._versions),
+            'entries': {namespace: len(entries) for namespace, entries in self._entries.items()},
+            'hits': self._stats['hits'],
+            'misses': self._stats['misses'],
+            'polls': self._stats['polls'],
+            'invalidations': self._stats['invalidations']
+        }
+
+
+# 全局配置缓存实例
+config_cache = ConfigCache()
+
+
+def thresholds_entry() -> Optional[ConfigEntry]:
+    """环境告警阈值（EnvironmentThreshold.to_dict() 格式），未配置时返回None"""
+    def load():
+        threshold = EnvironmentThreshold.query.first()
+        return make_entry(threshold.to_dict()) if threshold else None
+    return config_cache.get(THRESHOLDS, None, load)
+
+
+def linkage_entry() -> Optional[ConfigEntry]:
+    """设备联动配置（DeviceLinkageConfig.to_dict() 格式），未配置时返回None"""
+    def load():
+        config = DeviceLinkageConfig.query.first()
+        return make_entry(config.to_dict()) if config else None
+    return config_cache.get(LINKAGE, None, load)
+
+
+def device_config_entry(device_id: str) -> Optional[ConfigEntry]:
+    """设备配置内容，未配置时返回None"""
+    def load():
+        config = DeviceConfig.query.filter_by(device_id=device_id).first()
+        return make_entry(config.config) if config else None
+    return config_cache.get(DEVICE_CONFIG, device_id, load)
+
+
+def get_thresholds() -> Optional[Dict]:
+    entry = thresholds_entry()
+    return entry.data if entry else None
+
+
+def get_linkage_config() -> Optional[Dict]:
+    entry = linkage_entry()
+    return entry.data if entry else None
+
+
+def get_device_config(device_id: str) -> Optional[Dict]:
+    entry = device_config_entry(device_id)
+    return entry.data if entry else None
@@ -0,0 +1,162 @@
+"""
+环境数据写入服务
+
+负责设备上报环境数据的解析校验和批量入库。
+批量写入使用单条 executemany 语句加一次提交，避免逐条提交带来的事务开销。
+"""
+
+from datetime import datetime
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from sqlalchemy import insert
+
+from app import db
+from app.models.environment import EnvironmentData
+from app.services.alert_engine import alert_engine
+from app.services.environment_rollup import apply_rollups
+from app.services.latest_cache import latest_cache
+from app.services.event_hub import publish_readings
+from app.services.stat_counters import stat_counters
+from app.utils.validators import ValidationError, validate_range, sanitize_string
+
+
+# 各指标的合理物理范围，超出范围视为无效读数
+READING_FIELDS = (
+    ('temperature', '温度', -5.0, 50.0),
+    ('dissolved_oxygen', '溶解氧', 0.0, 30.0),
+    ('ph', 'pH值', 0.0, 14.0),
+    ('water_flow', '水流量', 0.0, 100.0),
+)
+
+# 可选字段，缺省时按0处理
+OPTIONAL_FIELDS = frozenset({'water_flow'})
+
+# 单条上报接口保持原有行为：缺少的读数均按0处理
+SINGLE_OPTIONAL_FIELDS = frozenset(field for field, *_ in READING_FIELDS)
+
+
+def parse_timestamp(value) -> datetime:
+    """解析上报时间，支持ISO字符串和毫秒时间戳，统一转换为本地无时区时间"""
+    if value is None or value == '':
+        return datetime.now()
+
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return datetime.fromtimestamp(value / 1000)
+
+    if isinstance(value, str):
+        try:
+            dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            raise ValidationError('时间格式无效', 'timestamp')
+        if dt.tzinfo is not None:
+            dt = dt.astimezone().replace(tzinfo=None)
+        return dt
+
+    raise ValidationError('时间格式无效', 'timestamp')
+
+
+def parse_source(item: Dict, defaults: Optional[Dict] = None) -> Dict:
+    """解析读数来源（设备ID、鱼塘ID），缺省时使用批次级默认值"""
+    defaults = defaults or {}
+
+    device_id = item.get('device_id', defaults.get('device_id'))
+    if device_id is not None and device_id != '':
+        device_id = sanitize_string(device_id, 50)
+    else:
+        device_id = None
+
+    pond_id = item.get('pond_id', defaults.get('pond_id'))
+    if pond_id is not None and pond_id != '':
+        try:
+            pond_id = int(pond_id)
+        except (TypeError, ValueError):
+            raise ValidationError('鱼塘ID必须是整数', 'pond_id')
+    else:
+        pond_id = None
+
+    return {'device_id': device_id, 'pond_id': pond_id}
+
+
+def parse_reading(item: Dict, defaults: Optional[Dict] = None,
+                  optional: FrozenSet[str] = OPTIONAL_FIELDS) -> Dict:
+    """
+    校验单条读数并转换为入库字段，校验失败抛出 ValidationError
+
+    optional 中的字段缺省时按0入库；告警评估的指标按0补齐时记入 row['defaulted']，
+    告警引擎跳过这些值（写入时该键被忽略）。
+    """
+    if not isinstance(item, dict):
+        raise ValidationError('数据格式错误')
+
+    row = parse_source(item, defaults)
+    for field, label, min_val, max_val in READING_FIELDS:
+        value = item.get(field)
+        if value is None or value == '':
+            if field in optional:
+                row[field] = 0.0
+                if field not in OPTIONAL_FIELDS:
+                    row.setdefault('defaulted', []).append(field)
+                continue
+            raise ValidationError(f'缺少必填字段: {field}', field)
+
+        valid, msg = validate_range(value, min_val, max_val, label)
+        if not valid:
+            raise ValidationError(msg, field)
+        row[field] = float(value)
+
+    row['timestamp'] = parse_timestamp(item.get('timestamp'))
+    return row
+
+
+def parse_readings(items: List, defaults: Optional[Dict] = None) -> Tuple[List[Dict], List[Dict]]:
+    """
+    批量校验读数
+
+    参数:
+        items: 读数列表
+        defaults: 批次级默认字段（如整批数据共用的 device_id、pond_id）
+
+    返回:
+        (有效记录列表, 错误列表)，错误项包含原始下标和错误原因
+    """
+    rows = []
+    errors = []
+    for index, item in enumerate(items):
+        try:
+            rows.append(parse_reading(item, defaults))
+        except ValidationError as e:
+            errors.append({'index': index, 'field': e.field, 'message': e.message})
+    return rows, errors
+
+
+def insert_readings(rows: List[Dict]) -> int:
+    """
+    批量写入环境数据
+
+    所有记录通过一条 executemany 语句写入，同时增量更新分钟/小时/日聚合表、
+    按阈值评估告警，并在一次事务中提交。
+    """
+    if not rows:
+        return 0
+
+    now = datetime.now()
+    for row in rows:
+        row.setdefault('created_at', now)
+
+    alerts = None
+    try:
+        db.session.execute(insert(EnvironmentData), rows)
+        # 聚合表、统计计数器、告警与原始数据在同一事务中更新
+        apply_rollups(rows)
+        stat_counters.increment({'monitoring.total': len(rows)})
+        alerts = alert_engine.evaluate(rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        alert_engine.rollback(alerts)
+        raise
+
+    latest_cache.update(rows)
+    publish_readings(rows)
+    alert_engine.commit(alerts)
+    return len(rows)
@@ -0,0 +1,443 @@
+"""
+环境数据降采样聚合服务
+
+维护分钟、小时、日三级聚合表（每个时间桶的 sum/min/max/count），
+在数据写入的同一事务中增量更新。统计和历史查询优先从能覆盖请求区间的
+最粗粒度聚合表读取，一年的日级曲线只需读取约365行而不是数千万条原始数据。
+"""
+
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, delete, select
+
+from app import db
+from app.models.environment import (
+    EnvironmentData, EnvironmentRollupMinute, EnvironmentRollupHour, EnvironmentRollupDay
+)
+
+
+METRICS = ('temperature', 'dissolved_oxygen', 'ph', 'water_flow')
+
+# 聚合层级，按粒度从细到粗排列
+TIERS = OrderedDict([
+    ('minute', (EnvironmentRollupMinute, timedelta(minutes=1))),
+    ('hour', (EnvironmentRollupHour, timedelta(hours=1))),
+    ('day', (EnvironmentRollupDay, timedelta(days=1))),
+])
+
+# 查询接口支持的时间桶宽度
+INTERVALS = {
+    'minute': timedelta(minutes=1),
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+    'week': timedelta(days=7),
+}
+
+REBUILD_CHUNK_SIZE = 5000
+
+
+def bucket_floor(dt: datetime, tier: str) -> datetime:
+    """将时间向下取整到聚合层级的时间桶起点"""
+    if tier == 'minute':
+        return dt.replace(second=0, microsecond=0)
+    if tier == 'hour':
+        return dt.replace(minute=0, second=0, microsecond=0)
+    if tier == 'day':
+        return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    if tier == 'week':
+        day = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+        return day - timedelta(days=day.weekday())
+    raise ValueError(f'未知的聚合层级: {tier}')
+
+
+def bucket_ceil(dt: datetime, tier: str) -> datetime:
+    """将时间向上取整到聚合层级的时间桶起点"""
+    floor = bucket_floor(dt, tier)
+    if floor == dt:
+        return floor
+    return floor + TIERS[tier][1]
+
+
+def fit_interval(start: datetime, end: datetime, interval: str, max_buckets: int) -> Optional[str]:
+    """
+    限制曲线的时间桶数量
+
+    区间按 interval 分桶超过 max_buckets 个时依次改用更粗的桶宽度，
+    最粗的 week 仍超过时返回None（由调用方拒绝请求）。
+    """
+    names = list(INTERVALS)
+    span = end - start
+    for name in names[names.index(interval):]:
+        if span <= INTERVALS[name] * max_buckets:
+            return name
+    return None
+
+
+def choose_tier(interval: str) -> str:
+    """选择不超过请求桶宽度的最粗聚合层级（调用方应先用 fit_interval 限制桶数量）"""
+    width = INTERVALS.get(interval, INTERVALS['day'])
+    chosen = 'minute'
+    for tier, (_, tier_width) in TIERS.items():
+        if tier_width <= width:
+            chosen = tier
+    return chosen
+
+
+def _source_key(row: Dict) -> Tuple[str, int]:
+    """聚合表中用空字符串和0代替未标记的设备/鱼塘，保证唯一键可用"""
+    return row.get('device_id') or '', row.get('pond_id') or 0
+
+
+def aggregate_rows(rows: Iterable[Dict], tier: str) -> List[Dict]:
+    """
+    将原始读数按 (设备, 鱼塘, 时间桶) 汇总为聚合表增量
+
+    增量按唯一键排序返回：并发的写入事务以相同顺序锁定聚合行，避免交叉加锁造成死锁。
+    """
+    buckets = {}
+    for row in rows:
+        device_id, pond_id = _source_key(row)
+        key = (device_id, pond_id, bucket_floor(row['timestamp'], tier))
+        agg = buckets.get(key)
+        if agg is None:
+            agg = {'device_id': device_id, 'pond_id': pond_id, 'bucket_start': key[2], 'sample_count': 0}
+            for metric in METRICS:
+                agg[f'{metric}_sum'] = 0.0
+                agg[f'{metric}_min'] = row[metric]
+                agg[f'{metric}_max'] = row[metric]
+            buckets[key] = agg
+
+        agg['sample_count'] += 1
+        for metric in METRICS:
+            value = row[metric]
+            agg[f'{metric}_sum'] += value
+            if value < agg[f'{metric}_min']:
+                agg[f'{metric}_min'] = value
+            if value > agg[f'{metric}_max']:
+                agg[f'{metric}_max'] = value
+    return [buckets[key] for key in sorted(buckets)]
+
+
+def _upsert_statement(model):
+    """按数据库方言构造“插入或累加”语句"""
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        stmt = mysql_insert(table)
+        incoming = stmt.inserted
+        values = {'sample_count': table.c.sample_count + incoming.sample_count}
+        for metric in METRICS:
+            values[f'{metric}_sum'] = table.c[f'{metric}_sum'] + incoming[f'{metric}_sum']
+            values[f'{metric}_min'] = func.least(table.c[f'{metric}_min'], incoming[f'{metric}_min'])
+            values[f'{metric}_max'] = func.greatest(table.c[f'{metric}_max'], incoming[f'{metric}_max'])
+        return stmt.on_duplicate_key_update(**values)
+
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            least, greatest = func.min, func.max
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            least, greatest = func.least, func.greatest
+        stmt = dialect_insert(table)
+        incoming = stmt.excluded
+        values = {'sample_count': table.c.sample_count + incoming.sample_count}
+        for metric in METRICS:
+            values[f'{metric}_sum'] = table.c[f'{metric}_sum'] + incoming[f'{metric}_sum']
+            values[f'{metric}_min'] = least(table.c[f'{metric}_min'], incoming[f'{metric}_min'])
+            values[f'{metric}_max'] = greatest(table.c[f'{metric}_max'], incoming[f'{metric}_max'])
+        return stmt.on_conflict_do_update(
+            index_elements=['device_id', 'pond_id', 'bucket_start'],
+            set_=values
+        )
+
+    return None
+
+
+def _merge_rows(model, deltas: List[Dict]):
+    """不支持原生 upsert 的数据库：逐桶读出后合并"""
+    for delta in deltas:
+        record = model.query.filter_by(
+            device_id=delta['device_id'],
+            pond_id=delta['pond_id'],
+            bucket_start=delta['bucket_start']
+        ).with_for_update().first()
+        if record is None:
+            db.session.add(model(**delta))
+            continue
+        record.sample_count += delta['sample_count']
+        for metric in METRICS:
+            setattr(record, f'{metric}_sum', getattr(record, f'{metric}_sum') + delta[f'{metric}_sum'])
+            setattr(record, f'{metric}_min', min(getattr(record, f'{metric}_min'), delta[f'{metric}_min']))
+            setattr(record, f'{metric}_max', max(getattr(record, f'{metric}_max'), delta[f'{metric}_max']))
+    db.session.flush()
+
+
+def apply_rollups(rows: List[Dict]):
+    """
+    将一批原始读数增量合并到各级聚合表
+
+    在调用方的事务中执行，由调用方负责提交，保证原始数据与聚合数据一致。
+    """
+    if not rows:
+        return
+
+    for tier, (model, _) in TIERS.items():
+        deltas = aggregate_rows(rows, tier)
+        stmt = _upsert_statement(model)
+        if stmt is None:
+            _merge_rows(model, deltas)
+        else:
+            db.session.execute(stmt, deltas)
+
+
+def rebuild_rollups(start: Optional[datetime] = None, end: Optional[datetime] = None) -> int:
+    """
+    根据原始数据重建聚合表（用于初始化或修复）
+
+    start/end 会被扩展到日边界，保证重建的时间桶完整。
+    """
+    filters = []
+    if start is not None:
+        start = bucket_floor(start, 'day')
+        filters.append(EnvironmentData.timestamp >= start)
+    if end is not None:
+        end = bucket_ceil(end, 'day')
+        filters.append(EnvironmentData.timestamp < end)
+
+    try:
+        for model, _ in TIERS.values():
+            stmt = delete(model)
+            if start is not None:
+                stmt = stmt.where(model.bucket_start >= start)
+            if end is not None:
+                stmt = stmt.where(model.bucket_start < end)
+            db.session.execute(stmt)
+
+        columns = [EnvironmentData.device_id, EnvironmentData.pond_id, EnvironmentData.timestamp]
+        columns += [getattr(EnvironmentData, metric) for metric in METRICS]
+        result = db.session.execute(
+            select(*columns).where(*filters).order_by(EnvironmentData.timestamp)
+        )
+
+        total = 0
+        while True:
+            chunk = result.fetchmany(REBUILD_CHUNK_SIZE)
+            if not chunk:
+                break
+            apply_rollups([dict(row._mapping) for row in chunk])
+            total += len(chunk)
+
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return total
+
+
+def _source_filters(model, device_id: Optional[str], pond_id: Optional[int]) -> List:
+    filters = []
+    if device_id:
+        filters.append(model.device_id == device_id)
+    if pond_id is not None:
+        filters.append(model.pond_id == pond_id)
+    return filters
+
+
+def split_range(start: datetime, end: datetime, tiers: Optional[List[str]] = None) -> List[Tuple[Optional[str], datetime, datetime]]:
+    """
+    将左闭右开区间拆分为尽量粗的对齐段
+
+    返回 (层级, 段起点, 段终点) 列表，层级为 None 的段需要从原始表读取，
+    这类段只会出现在区间两端且不足一分钟。
+    """
+    if tiers is None:
+        tiers = list(reversed(TIERS.keys()))
+    if start >= end:
+        return []
+    if not tiers:
+        return [(None, start, end)]
+
+    tier, finer = tiers[0], tiers[1:]
+    aligned_start = bucket_ceil(start, tier)
+    aligned_end = bucket_floor(end, tier)
+    if aligned_start >= aligned_end:
+        return split_range(start, end, finer)
+
+    return (
+        split_range(start, aligned_start, finer)
+        + [(tier, aligned_start, aligned_end)]
+        + split_range(aligned_end, end, finer)
+    )
+
+
+def summarize(start: datetime, end: datetime,
+              device_id: Optional[str] = None, pond_id: Optional[int] = None) -> Optional[Dict]:
+    """
+    统计区间内各指标的 avg/min/max（包含 end 时刻）
+
+    区间中间部分读聚合表，两端不足一分钟的零头读原始表，结果与全表扫描一致。
+    """
+    end_exclusive = end + timedelta(microseconds=1)
+    total = {'count': 0}
+    for metric in METRICS:
+        total[metric] = {'sum': 0.0, 'min': None, 'max': None}
+
+    for tier, seg_start, seg_end in split_range(start, end_exclusive):
+        if tier is None:
+            columns = [func.count(EnvironmentData.id)]
+            for metric in METRICS:
+                column = getattr(EnvironmentData, metric)
+                columns += [func.sum(column), func.min(column), func.max(column)]
+            filters = [EnvironmentData.timestamp >= seg_start, EnvironmentData.timestamp < seg_end]
+            filters += _source_filters(EnvironmentData, device_id, pond_id)
+        else:
+            model = TIERS[tier][0]
+            columns = [func.sum(model.sample_count)]
+            for metric in METRICS:
+                columns += [
+                    func.sum(getattr(model, f'{metric}_sum')),
+                    func.min(getattr(model, f'{metric}_min')),
+                    func.max(getattr(model, f'{metric}_max'))
+                ]
+            filters = [model.bucket_start >= seg_start, model.bucket_start < seg_end]
+            filters += _source_filters(model, device_id, pond_id)
+
+        row = db.session.execute(select(*columns).where(*filters)).one()
+        if not row[0]:
+            continue
+
+        total['count'] += int(row[0])
+        for i, metric in enumerate(METRICS):
+            part_sum, part_min, part_max = row[1 + i * 3: 4 + i * 3]
+            stats = total[metric]
+            stats['sum'] += part_sum
+            stats['min'] = part_min if stats['min'] is None else min(stats['min'], part_min)
+            stats['max'] = part_max if stats['max'] is None else max(stats['max'], part_max)
+
+    if total['count'] == 0:
+        return None
+
+    result = {'count': total['count']}
+    for metric in METRICS:
+        stats = total[metric]
+        result[metric] = {
+            'avg': stats['sum'] / total['count'],
+            'min': stats['min'],
+            'max': stats['max']
+        }
+    return result
+
+
+def count_samples(start: Optional[datetime], end: datetime,
+                  device_id: Optional[str] = None, pond_id: Optional[int] = None) -> int:
+    """
+    统计区间内的原始读数条数（包含 end 时刻）
+
+    与 summarize 相同按层级拆分区间，只累加 sample_count；start 为空时从最早的日聚合桶算起。
+    原始数据被删除或清理后聚合表不会同步减少，结果只适合作为估算值。
+    """
+    if start is None:
+        start = db.session.query(func.min(EnvironmentRollupDay.bucket_start)).scalar()
+        if start is None:
+            return 0
+
+    total = 0
+    for tier, seg_start, seg_end in split_range(start, end + timedelta(microseconds=1)):
+        if tier is None:
+            column = func.count(EnvironmentData.id)
+            filters = [EnvironmentData.timestamp >= seg_start, EnvironmentData.timestamp < seg_end]
+            filters += _source_filters(EnvironmentData, device_id, pond_id)
+        else:
+            model = TIERS[tier][0]
+            column = func.sum(model.sample_count)
+            filters = [model.bucket_start >= seg_start, model.bucket_start < seg_end]
+            filters += _source_filters(model, device_id, pond_id)
+        total += int(db.session.execute(select(column).where(*filters)).scalar() or 0)
+    return total
+
+
+def _series_query(tier: str, start: datetime, end: datetime,
+                  device_id: Optional[str], pond_id: Optional[int]):
+    """按时间桶汇总聚合表（跨设备合并）"""
+    model = TIERS[tier][0]
+    columns = [model.bucket_start, func.sum(model.sample_count).label('sample_count')]
+    for metric in METRICS:
+        columns += [
+            func.sum(getattr(model, f'{metric}_sum')).label(f'{metric}_sum'),
+            func.min(getattr(model, f'{metric}_min')).label(f'{metric}_min'),
+            func.max(getattr(model, f'{metric}_max')).label(f'{metric}_max')
+        ]
+    filters = [model.bucket_start >= bucket_floor(start, tier), model.bucket_start <= end]
+    filters += _source_filters(model, device_id, pond_id)
+    return select(*columns).where(*filters).group_by(model.bucket_start)
+
+
+def _format_bucket(bucket_start: datetime, agg: Dict) -> Dict:
+    count = agg['sample_count']
+    item = {'timestamp': bucket_start.isoformat(), 'count': count}
+    for metric, key in (('temperature', 'temperature'), ('dissolved_oxygen', 'dissolvedOxygen'),
+                        ('ph', 'ph'), ('water_flow', 'waterFlow')):
+        item[key] = {
+            'avg': round(agg[f'{metric}_sum'] / count, 2) if count else 0,
+            'min': round(agg[f'{metric}_min'], 2),
+            'max': round(agg[f'{metric}_max'], 2)
+        }
+    return item
+
+
+def series(start: datetime, end: datetime, interval: str = 'day',
+           device_id: Optional[str] = None, pond_id: Optional[int] = None,
+           descending: bool = False, limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+    """
+    获取按 interval 分桶的降采样曲线
+
+    从不超过桶宽度的最粗聚合层级读取，桶宽度大于层级时在内存中二次合并。
+    """
+    if interval not in INTERVALS:
+        interval = 'day'
+    tier = choose_tier(interval)
+    model = TIERS[tier][0]
+    order = model.bucket_start.desc() if descending else model.bucket_start
+    stmt = _series_query(tier, start, end, device_id, pond_id).order_by(order)
+
+    # 桶宽度与层级一致时直接在数据库分页
+    paged_in_sql = tier == interval and limit is not None
+    if paged_in_sql:
+        stmt = stmt.offset(offset).limit(limit)
+
+    buckets = OrderedDict()
+    for row in db.session.execute(stmt):
+        data = dict(row._mapping)
+        key = bucket_floor(data.pop('bucket_start'), interval)
+        agg = buckets.get(key)
+        if agg is None:
+            buckets[key] = data
+            continue
+        agg['sample_count'] += data['sample_count']
+        for metric in METRICS:
+            agg[f'{metric}_sum'] += data[f'{metric}_sum']
+            agg[f'{metric}_min'] = min(agg[f'{metric}_min'], data[f'{metric}_min'])
+            agg[f'{metric}_max'] = max(agg[f'{metric}_max'], data[f'{metric}_max'])
+
+    items = [_format_bucket(bucket_start, agg) for bucket_start, agg in buckets.items()]
+    if limit is not None and not paged_in_sql:
+        items = items[offset:offset + limit]
+    return items
+
+
+def count_buckets(start: datetime, end: datetime, interval: str = 'day',
+                  device_id: Optional[str] = None, pond_id: Optional[int] = None) -> int:
+    """统计区间内的时间桶数量"""
+    if interval not in INTERVALS:
+        interval = 'day'
+    tier = choose_tier(interval)
+    if tier != interval:
+        return len(series(start, end, interval, device_id, pond_id))
+    subquery = _series_query(tier, start, end, device_id, pond_id).subquery()
+    return db.session.execute(select(func.count()).select_from(subquery)).scalar() or 0
@@ -0,0 +1,362 @@
+"""
+实时事件分发中心
+
+数据写入和告警变更时发布一次事件，由分发中心推送给所有匹配的订阅者，
+N 个前端连接只需一次发布，不再各自轮询数据库。
+每个订阅者有独立的有界队列，消费过慢时丢弃最旧的事件，不会阻塞发布方。
+
+多进程部署时订阅者分布在各个工作进程中：
+- 有订阅者的进程启动中转线程，在 stream_listeners 表中登记并定期续期，
+  每 EVENT_STREAM_POLL_INTERVAL 秒按自增ID读取其他进程写入 stream_events 表的事件，投递给本进程的订阅者；
+- 发布方先投递本进程的订阅者，只有存在其他监听进程时才把事件批量写入 stream_events 表，
+  没有任何前端连接时不产生额外写入。
+事件表只保留 EVENT_STREAM_RETENTION 秒，推送与进程内一样是尽力而为的：
+并发写入的事件偶尔乱序提交时可能被跳过，前端重连后应重新拉取一次当前数据。
+"""
+
+import atexit
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select, update
+
+from app import db
+from app.models.stream_event import StreamEvent, StreamListener
+from app.services.lease import make_owner_id
+
+logger = logging.getLogger(__name__)
+
+
+EVENT_TYPES = ('environment', 'alert')
+
+# 中转线程单次读取的最大事件数
+RELAY_BATCH_SIZE = 1000
+
+
+class Subscription:
+    """单个客户端的订阅"""
+
+    def __init__(self, types: Iterable[str], device_id: Optional[str] = None,
+                 pond_id: Optional[int] = None, maxsize: int = 100):
+        self.types = set(types)
+        self.device_id = device_id
+        self.pond_id = pond_id
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def matches(self, event: Dict) -> bool:
+        """按事件类型、设备、鱼塘过滤；未标记来源的事件（如全局告警）推送给所有订阅者"""
+        if event['type'] not in self.types:
+            return False
+        if self.device_id and event.get('device_id') and event['device_id'] != self.device_id:
+            return False
+        if self.pond_id is not None and event.get('pond_id') is not None and event['pond_id'] != self.pond_id:
+            return False
+        return True
+
+    def offer(self, event: Dict):
+        """投递事件，队列满时丢弃最旧的事件"""
+        while True:
+            try:
+                self.queue.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout: float) -> Optional[Dict]:
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventHub:
+    """事件分发中心"""
+
+    def __init__(self):
+        self.max_subscribers = 200
+        self.queue_size = 100
+        self.relay_enabled = True
+        self.poll_interval = 1.0
+        self.listener_ttl = 10.0
+        self.retention = 60.0
+        self.owner = make_owner_id()
+        self.app = None
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._sequence = itertools.count(1)
+        self._relay = None
+        self._relay_stop = threading.Event()
+        self._last_event_id = None
+        self._last_purge = 0.0
+        self._remote = (0.0, False)  # (检查时间, 是否存在其他监听进程)
+        self._stats = {'published': 0, 'delivered': 0, 'forwarded': 0, 'relayed': 0, 'relay_errors': 0}
+
+    def init_app(self, app):
+        self.app = app
+        self.max_subscribers = app.config.get('EVENT_STREAM_MAX_SUBSCRIBERS', 200)
+        self.queue_size = app.config.get('EVENT_STREAM_QUEUE_SIZE', 100)
+        self.relay_enabled = app.config.get('EVENT_STREAM_RELAY_ENABLED', True)
+        self.poll_interval = app.config.get('EVENT_STREAM_POLL_INTERVAL', 1.0)
+        self.listener_ttl = app.config.get('EVENT_STREAM_LISTENER_TTL', 10.0)
+        self.retention = app.config.get('EVENT_STREAM_RETENTION', 60.0)
+        if self.relay_enabled:
+            atexit.register(self.stop_relay)
+            if hasattr(os, 'register_at_fork'):
+                os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self.owner = make_owner_id()
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._relay = None
+        self._relay_stop = threading.Event()
+        self._last_event_id = None
+        self._remote = (0.0, False)
+
+    def subscribe(self, types: Iterable[str], device_id: Optional[str] = None,
+                  pond_id: Optional[int] = None) -> Optional[Subscription]:
+        """新增订阅，超过最大连接数时返回None"""
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            subscription = Subscription(types, device_id, pond_id, self.queue_size)
+            self._subscribers.add(subscription)
+            if self.relay_enabled and self.app is not None and self._relay is None:
+                self._relay_stop.clear()
+                self._relay = threading.Thread(target=self._run_relay, name='event-hub-relay', daemon=True)
+                self._relay.start()
+            return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def has_subscribers(self, event_type: Optional[str] = None) -> bool:
+        """是否有订阅者（含其他进程），发布方可据此跳过事件构造"""
+        subscribers = self._subscribers
+        if event_type is None:
+            local = bool(subscribers)
+        else:
+            local = any(event_type in sub.types for sub in list(subscribers))
+        return local or self._remote_listening()
+
+    def publish(self, event_type: str, data: Dict,
+                device_id: Optional[str] = None, pond_id: Optional[int] = None):
+        """发布事件"""
+        self.publish_many(event_type, [(data, device_id, pond_id)])
+
+    def publish_many(self, event_type: str, items: List[Tuple[Dict, Optional[str], Optional[int]]]):
+        """
+        批量发布同一类型的事件
+
+        items 为 (data, device_id, pond_id) 列表，转发给其他进程时合并为一条批量写入。
+        """
+        if not items:
+            return
+        self._stats['published'] += len(items)
+        if self._subscribers:
+            for data, device_id, pond_id in items:
+                self._deliver({'type': event_type, 'device_id': device_id, 'pond_id': pond_id, 'data': data})
+        if self._remote_listening():
+            self._forward(event_type, items)
+
+    def _deliver(self, event: Dict):
+        """投递给本进程的订阅者"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        event['id'] = next(self._sequence)
+        for subscription in subscribers:
+            if subscription.matches(event):
+                subscription.offer(event)
+                self._stats['delivered'] += 1
+
+    def _remote_listening(self) -> bool:
+        """是否存在其他监听进程（按轮询间隔缓存）"""
+        if not self.relay_enabled:
+            return False
+        checked_at, present = self._remote
+        now = time.monotonic()
+        if now - checked_at < self.poll_interval:
+            return present
+        try:
+            with db.engine.connect() as conn:
+                present = conn.execute(
+                    select(StreamListener.owner)
+                    .where(StreamListener.expires_at > datetime.now())
+                    .where(StreamListener.owner != self.owner)
+                    .limit(1)
+                ).first() is not None
+        except Exception as e:
+            logger.warning('查询实时事件监听进程失败: %s', e)
+            present = False
+        self._remote = (now, present)
+        return present
+
+    def _forward(self, event_type: str, items: List[Tuple[Dict, Optional[str], Optional[int]]]):
+        """写入事件中转表（独立连接，不影响发布方的事务），失败只记录日志"""
+        now = datetime.now()
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(insert(StreamEvent), [{
+                    'origin': self.owner,
+                    'type': event_type,
+                    'device_id': device_id,
+                    'pond_id': pond_id,
+                    'payload': data,
+                    'created_at': now
+                } for data, device_id, pond_id in items])
+            self._stats['forwarded'] += len(items)
+        except Exception as e:
+            self._stats['relay_errors'] += 1
+            logger.warning('转发实时事件失败: %s', e)
+
+    def relay_once(self) -> int:
+        """
+        续期本进程的监听登记，并投递其他进程发布的新事件（需在应用上下文中调用）
+
+        首次调用只记录当前最大事件ID，不回放历史事件。
+        返回投递的事件数。
+        """
+        now = datetime.now()
+        expires_at = now + timedelta(seconds=self.listener_ttl)
+        with db.engine.begin() as conn:
+            renewed = conn.execute(
+                update(StreamListener)
+                .where(StreamListener.owner == self.owner)
+                .values(expires_at=expires_at)
+            ).rowcount
+            if not renewed:
+                conn.execute(insert(StreamListener).values(owner=self.owner, expires_at=expires_at))
+
+            if self._last_event_id is None:
+                self._last_event_id = conn.execute(select(func.max(StreamEvent.id))).scalar() or 0
+                return 0
+
+            rows = conn.execute(
+                select(StreamEvent.__table__)
+                .where(StreamEvent.id > self._last_event_id)
+                .order_by(StreamEvent.id)
+                .limit(RELAY_BATCH_SIZE)
+            ).all()
+
+            if time.monotonic() - self._last_purge >= self.retention:
+                self._last_purge = time.monotonic()
+                conn.execute(delete(StreamListener).where(StreamListener.expires_at < now))
+                conn.execute(delete(StreamEvent).where(
+                    StreamEvent.created_at < now - timedelta(seconds=self.retention)))
+
+        relayed = 0
+        for row in rows:
+            self._last_event_id = row.id
+            if row.origin == self.owner:
+                continue
+            self._deliver({'type': row.type, 'device_id': row.device_id,
+                           'pond_id': row.pond_id, 'data': row.payload})
+            relayed += 1
+        self._stats['relayed'] += relayed
+        return relayed
+
+    def _run_relay(self):
+        """中转线程：本进程没有订阅者后注销登记并退出，下次订阅时重新启动"""
+        while not self._relay_stop.is_set():
+            with self._lock:
+                if not self._subscribers:
+                    self._relay = None
+                    self._last_event_id = None
+                    break
+            try:
+                with self.app.app_context():
+                    self.relay_once()
+            except Exception as e:
+                self._stats['relay_errors'] += 1
+                logger.warning('读取实时事件中转表失败: %s', e)
+            self._relay_stop.wait(self.poll_interval)
+        self._unregister()
+
+    def _unregister(self):
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as conn:
+                    conn.execute(delete(StreamListener).where(StreamListener.owner == self.owner))
+        except Exception as e:
+            logger.warning('注销实时事件监听失败: %s', e)
+
+    def stop_relay(self, timeout: float = 5.0):
+        """停止中转线程（进程退出时调用）"""
+        self._relay_stop.set()
+        relay = self._relay
+        if relay is not None and relay.is_alive():
+            relay.join(timeout)
+
+    def stats(self) -> Dict:
+        subscribers = list(self._subscribers)
+        return {
+            'subscribers': len(subscribers),
+            'published': self._stats['published'],
+            'delivered': self._stats['delivered'],
+            'dropped': sum(sub.dropped for sub in subscribers),
+            'relayRunning': self._relay is not None and self._relay.is_alive(),
+            'forwarded': self._stats['forwarded'],
+            'relayed': self._stats['relayed'],
+            'relayErrors': self._stats['relay_errors']
+        }
+
+
+# 全局事件分发中心
+event_hub = EventHub()
+
+
+def publish_readings(rows: Iterable[Dict]):
+    """发布环境数据事件，每个传感器只推送本批中最新的一条"""
+    if not event_hub.has_subscribers('environment'):
+        return
+
+    latest = {}
+    for row in rows:
+        key = (row.get('device_id'), row.get('pond_id'))
+        current = latest.get(key)
+        if current is None or row['timestamp'] >= current['timestamp']:
+            latest[key] = row
+
+    event_hub.publish_many('environment', [({
+        'deviceId': device_id,
+        'pondId': pond_id,
+        'timestamp': row['timestamp'].isoformat(),
+        'temperature': round(row['temperature'], 1),
+        'dissolvedOxygen': round(row['dissolved_oxygen'], 1),
+        'ph': round(row['ph'], 2),
+        'waterFlow': round(row['water_flow'], 2)
+    }, device_id, pond_id) for (device_id, pond_id), row in latest.items()])
+
+
+def publish_alerts(alerts: Iterable, action: str):
+    """
+    发布告警事件
+
+    action 为 created 或 resolved，事件中附带当前未处理告警数，
+    前端无需再轮询 /api/alerts/unresolved/count。
+    """
+    alerts = list(alerts)
+    if not alerts or not event_hub.has_subscribers('alert'):
+        return
+
+    # 取 alerts.unresolved 计数器，不在写入路径上对告警表做全表计数
+    from app.services.stat_counters import stat_counters
+    unresolved = stat_counters.snapshot().get('alerts.unresolved', 0)
+
+    event_hub.publish_many('alert', [({
+        'action': action,
+        'alert': alert.to_dict(),
+        'unresolvedCount': unresolved
+    }, getattr(alert, 'device_id', None), None) for alert in alerts])
@@ -12,14 +12,21 @@
 
 """
 
+import logging
+import threading
+import time
+from collections import OrderedDict
+from types import MappingProxyType
 import numpy as np
-from typing import Dict, Tuple, Optional
+from typing import Dict, Mapping, Tuple, Optional
 from dataclasses import dataclass
 
+logger = logging.getLogger(__name__)
 
-@dataclass
+
+@dataclass(frozen=True)
 class FishSpeciesParams:
-    """鱼类品种参数"""
+    """鱼类品种参数（不可变，修改参数需替换 FISH_SPECIES_PARAMS 中的对象）"""
     name: str  # 品种名称
     optimal_temp: float  # 最适水温 (°C)
     temp_range: Tuple[float, float]  # 适宜温度范围
@@ -97,12 +104,224 @@ FISH_SPECIES_PARAMS = {
 }
 
 
+class SpeciesFactorTables:
+    """
+    品种响应曲线查找表
+    
+    在物理量程内按固定步长预先计算温度高斯曲线和溶解氧Sigmoid曲线，
+    查询时线性插值，把每次调用的 exp 运算变为数组下标访问。
+    边界惩罚、过饱和下调等分段规则仍按解析式计算；超出量程的输入回退到解析式。
+    pH因子本身是分段线性函数，解析计算已足够快，不建表。
+    """
+    
+    def __init__(self, params: FishSpeciesParams,
+                 temp_range: Tuple[float, float] = (-5.0, 50.0), temp_step: float = 0.01,
+                 do_range: Tuple[float, float] = (0.0, 30.0), do_step: float = 0.01):
+        self.params = params
+        self.temp_min, self.temp_step = temp_range[0], temp_step
+        self.do_min, self.do_step = do_range[0], do_step
+        
+        temp_grid = self._grid(temp_range, temp_step)
+        do_grid = self._grid(do_range, do_step)
+        self.temp_table = self.temperature_curve_exact(temp_grid, params)
+        self.do_table = self.do_curve_exact(do_grid, params)
+        # 标量查询使用Python列表，避免numpy标量的装箱开销
+        self._temp_list = self.temp_table.tolist()
+        self._do_list = self.do_table.tolist()
+        self._temp_last = len(self._temp_list) - 1
+        self._do_last = len(self._do_list) - 1
+    
+    @staticmethod
+    def _grid(value_range: Tuple[float, float], step: float) -> np.ndarray:
+        count = int(round((value_range[1] - value_range[0]) / step)) + 1
+        return value_range[0] + np.arange(count) * step
+    
+    @staticmethod
+    def temperature_curve_exact(temp, params: FishSpeciesParams):
+        """温度高斯曲线解析式 exp(-((T - T_opt)^2) / (2 * sigma^2))"""
+        t_min, t_max = params.temp_range
+        sigma = (t_max - t_min) / 4
+        return np.exp(-((temp - params.optimal_temp) ** 2) / (2 * sigma ** 2))
+    
+    @staticmethod
+    def do_curve_exact(do, params: FishSpeciesParams):
+        """溶解氧Sigmoid曲线解析式 1 / (1 + exp(-k * (DO - DO_crit)))"""
+        do_crit = (params.min_do + params.optimal_do) / 2
+        k = 2.0  # 曲线陡度
+        return 1.0 / (1.0 + np.exp(-k * (do - do_crit)))
+    
+    @staticmethod
+    def _lookup(table: list, last: int, start: float, step: float, value: float) -> Optional[float]:
+        position = (value - start) / step
+        if position < 0 or position > last:
+            return None
+        index = int(position)
+        if index == last:
+            return table[last]
+        low = table[index]
+        return low + (table[index + 1] - low) * (position - index)
+    
+    @staticmethod
+    def _lookup_array(table: np.ndarray, start: float, step: float, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """数组插值，运算顺序与标量查询一致；返回 (插值结果, 是否在量程内)"""
+        last = len(table) - 1
+        position = (values - start) / step
+        in_range = (position >= 0) & (position <= last)
+        position = np.where(in_range, position, 0.0)
+        index = np.minimum(position.astype(np.int64), last - 1)
+        low = table[index]
+        result = low + (table[index + 1] - low) * (position - index)
+        # 恰好落在最后一个格点时直接取表值
+        result = np.where(position == last, table[last], result)
+        return result, in_range
+    
+    def temperature_curve(self, temp: float) -> float:
+        value = self._lookup(self._temp_list, self._temp_last, self.temp_min, self.temp_step, temp)
+        if value is None:
+            return float(self.temperature_curve_exact(temp, self.params))
+        return value
+    
+    def do_curve(self, do: float) -> float:
+        value = self._lookup(self._do_list, self._do_last, self.do_min, self.do_step, do)
+        if value is None:
+            return float(self.do_curve_exact(do, self.params))
+        return value
+    
+    def temperature_curve_array(self, temp: np.ndarray) -> np.ndarray:
+        result, in_range = self._lookup_array(self.temp_table, self.temp_min, self.temp_step, temp)
+        if in_range.all():
+            return result
+        return np.where(in_range, result, self.temperature_curve_exact(temp, self.params))
+    
+    def do_curve_array(self, do: np.ndarray) -> np.ndarray:
+        result, in_range = self._lookup_array(self.do_table, self.do_min, self.do_step, do)
+        if in_range.all():
+            return result
+        return np.where(in_range, result, self.do_curve_exact(do, self.params))
+    
+    def max_error(self, samples: int = 10007) -> float:
+        """在格点之间取样，返回插值结果与解析式的最大绝对误差"""
+        temp_max = self.temp_min + self._temp_last * self.temp_step
+        do_max = self.do_min + self._do_last * self.do_step
+        temps = np.linspace(self.temp_min, temp_max, samples)
+        dos = np.linspace(self.do_min, do_max, samples)
+        temp_error = np.abs(self.temperature_curve_array(temps) - self.temperature_curve_exact(temps, self.params))
+        do_error = np.abs(self.do_curve_array(dos) - self.do_curve_exact(dos, self.params))
+        return float(max(temp_error.max(), do_error.max()))
+
+
+class EnvironmentFactorCache:
+    """
+    环境修正因子缓存（LRU + TTL）
+    
+    投喂因子只取决于品种参数和（水温, 溶解氧, pH），传感器读数变化缓慢，
+    大部分计算是重复的。缓存键为品种加量化后的环境值，量化步长为None时按原值精确匹配。
+    每个条目记录计算时使用的品种参数对象，参数被替换后自动失效。
+    """
+    
+    def __init__(self, max_size: int = 4096, ttl: Optional[float] = 300.0,
+                 quantization: Optional[Dict[str, float]] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.quantization = quantization or {}
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'stale': 0,
+                       'evictions': 0, 'invalidations': 0}
+    
+    def configure(self, max_size: int = None, ttl: Optional[float] = None,
+                  quantization: Optional[Dict[str, float]] = None):
+        """更新缓存参数，已有条目全部失效"""
+        if max_size is not None:
+            self.max_size = max_size
+        self.ttl = ttl
+        self.quantization = quantization or {}
+        self.invalidate()
+    
+    def quantize(self, field: str, value: float) -> float:
+        """按配置的步长量化输入值"""
+        step = self.quantization.get(field)
+        if not step:
+            return value
+        return round(value / step) * step
+    
+    def quantize_array(self, field: str, values: np.ndarray) -> np.ndarray:
+        """数组版本的量化，供批量计算与单条计算保持一致"""
+        step = self.quantization.get(field)
+        if not step:
+            return values
+        return np.round(values / step) * step
+    
+    def get(self, key, params):
+        """读取缓存，未命中、过期或品种参数已变化时返回None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            value, entry_params, cached_at = entry
+            if entry_params is not params:
+                del self._entries[key]
+                self._stats['stale'] += 1
+                self._stats['misses'] += 1
+                return None
+            if self.ttl is not None and time.monotonic() - cached_at > self.ttl:
+                del self._entries[key]
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+    
+    def put(self, key, params, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, params, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+    
+    def invalidate(self):
+        """清空缓存（品种参数或多项式系数变化时调用）"""
+        with self._lock:
+            self._entries.clear()
+            self._stats['invalidations'] += 1
+    
+    def stats(self) -> Dict:
+        """获取缓存命中指标"""
+        lookups = self._stats['hits'] + self._stats['misses']
+        return {
+            'size': len(self._entries),
+            'maxSize': self.max_size,
+            'ttlSeconds': self.ttl,
+            'quantization': dict(self.quantization),
+            'hits': self._stats['hits'],
+            'misses': self._stats['misses'],
+            'expired': self._stats['expired'],
+            'stale': self._stats['stale'],
+            'evictions': self._stats['evictions'],
+            'invalidations': self._stats['invalidations'],
+            'hitRate': round(self._stats['hits'] / lookups, 4) if lookups else 0
+        }
+
+
 class SmartFeedingAlgorithm:
     """智能投喂算法类"""
     
+    # 查找表插值与解析式允许的最大误差，超出时该品种回退到解析计算
+    LOOKUP_TOLERANCE = 1e-5
+    
     def __init__(self):
+        self.factor_cache = EnvironmentFactorCache()
+        self.use_lookup_tables = True
+        self._factor_tables: Dict[int, Tuple[FishSpeciesParams, Optional[SpeciesFactorTables]]] = {}
+        
         # 多项式系数 (通过历史数据拟合得到)
-        self.poly_coefficients = {
+        # 系数参与缓存的因子计算，对外只读，修改必须经过 setter / set_interaction_coefficients 使缓存失效
+        self._poly_coefficients = self._freeze_coefficients({
             'temp': [1.0, -0.02, 0.001],  # 温度多项式系数
             'do': [0.5, 0.08, -0.005],    # 溶解氧多项式系数
             'ph': [0.2, 0.1, -0.01],      # pH多项式系数
@@ -111,12 +330,122 @@ class SmartFeedingAlgorithm:
                 'temp_ph': 0.008,          # 温度-pH交互项
                 'do_ph': 0.012             # 溶解氧-pH交互项
             }
+        })
+        
+        # 加载时为预定义品种建表
+        self.build_factor_tables()
+    
+    def init_app(self, app):
+        """从应用配置初始化因子缓存和查找表"""
+        self.use_lookup_tables = app.config.get('FEEDING_FACTOR_LUT_ENABLED', True)
+        self.factor_cache.configure(
+            max_size=app.config.get('FEEDING_FACTOR_CACHE_SIZE', 4096),
+            ttl=app.config.get('FEEDING_FACTOR_CACHE_TTL', 300.0),
+            quantization=app.config.get('FEEDING_FACTOR_QUANTIZATION')
+        )
+    
+    @staticmethod
+    def _freeze_coefficients(value: Dict) -> Mapping:
+        """复制系数并转换为只读结构"""
+        return MappingProxyType({
+            name: MappingProxyType(dict(coeffs)) if isinstance(coeffs, Mapping) else tuple(coeffs)
+            for name, coeffs in value.items()
+        })
+    
+    @property
+    def poly_coefficients(self) -> Mapping:
+        return self._poly_coefficients
+    
+    @poly_coefficients.setter
+    def poly_coefficients(self, value: Dict):
+        self._poly_coefficients = self._freeze_coefficients(value)
+        self.factor_cache.invalidate()
+    
+    def set_interaction_coefficients(self, **coefficients):
+        """更新交互项系数（如重新拟合后），并使因子缓存失效"""
+        unknown = set(coefficients) - set(self._poly_coefficients['interaction'])
+        if unknown:
+            raise ValueError(f'未知的交互项系数: {", ".join(sorted(unknown))}')
+        self.poly_coefficients = {
+            **self._poly_coefficients,
+            'interaction': {**self._poly_coefficients['interaction'], **coefficients}
         }
     
+    def set_species_params(self, fish_type: str, params: FishSpeciesParams):
+        """新增或替换鱼类品种参数，重建查找表并使因子缓存失效"""
+        FISH_SPECIES_PARAMS[fish_type] = params
+        self.build_factor_tables()
+        self.factor_cache.invalidate()
+    
+    def build_factor_tables(self):
+        """为当前所有品种参数建立查找表，并校验插值误差"""
+        # 按参数对象标识索引（冻结数据类的哈希需要逐字段计算，查询开销较大）
+        tables = {}
+        for params in FISH_SPECIES_PARAMS.values():
+            if id(params) in tables:
+                continue
+            existing = self._factor_tables.get(id(params))
+            if existing is not None and existing[0] is params:
+                tables[id(params)] = existing
+                continue
+            table = SpeciesFactorTables(params)
+            error = table.max_error()
+            if error > self.LOOKUP_TOLERANCE:
+                logger.warning('品种 %s 查找表插值误差 %.2e 超出容差，使用解析计算', params.name, error)
+                table = None
+            tables[id(params)] = (params, table)
+        self._factor_tables = tables
+    
+    def get_factor_tables(self, params: FishSpeciesParams) -> Optional[SpeciesFactorTables]:
+        """获取品种查找表，未启用或误差超限时返回None"""
+        if not self.use_lookup_tables:
+            return None
+        entry = self._factor_tables.get(id(params))
+        if entry is None or entry[0] is not params:
+            # 直接替换 FISH_SPECIES_PARAMS 条目的情况，按需补建
+            self.build_factor_tables()
+            entry = self._factor_tables.get(id(params))
+            if entry is None:
+                return None
+        return entry[1]
+    
     def get_species_params(self, fish_type: str) -> FishSpeciesParams:
         """获取鱼类品种参数"""
         return FISH_SPECIES_PARAMS.get(fish_type, FISH_SPECIES_PARAMS['default'])
     
+    def calculate_environment_factors(self, fish_type: str, temperature: float,
+                                      dissolved_oxygen: float, ph: float) -> Tuple[float, float, float, float]:
+        """
+        计算（或从缓存读取）环境修正因子
+        
+        返回:
+            (温度因子, 溶解氧因子, pH因子, 交互项因子)
+        """
+        species_key = fish_type if fish_type in FISH_SPECIES_PARAMS else 'default'
+        params = FISH_SPECIES_PARAMS[species_key]
+        
+        cache = self.factor_cache
+        temperature = cache.quantize('temperature', temperature)
+        dissolved_oxygen = cache.quantize('dissolved_oxygen', dissolved_oxygen)
+        ph = cache.quantize('ph', ph)
+        key = (species_key, temperature, dissolved_oxygen, ph)
+        
+        factors = cache.get(key, params)
+        if factors is not None:
+            return factors
+        
+        temp_factor = self.calculate_temperature_factor(temperature, params)
+        do_factor = self.calculate_dissolved_oxygen_factor(dissolved_oxygen, params)
+        ph_factor = self.calculate_ph_factor(ph, params)
+        interaction_factor = self.calculate_interaction_terms(
+            temperature, dissolved_oxygen, ph,
+            temp_factor, do_factor, ph_factor
+        )
+        
+        factors = (temp_factor, do_factor, ph_factor, interaction_factor)
+        cache.put(key, params, factors)
+        return factors
+    
     def calculate_temperature_factor(self, temp: float, params: FishSpeciesParams) -> float:
         """
         计算温度修正因子
@@ -124,14 +453,14 @@ class SmartFeedingAlgorithm:
         采用二次多项式模型，以最适温度为中心的高斯型分布
         f(T) = exp(-((T - T_opt)^2) / (2 * sigma^2))
         """
-        t_opt = params.optimal_temp
         t_min, t_max = params.temp_range
         
-        # 计算标准差（基于温度范围）
-        sigma = (t_max - t_min) / 4
-        
-        # 高斯型温度响应函数
-        factor = np.exp(-((temp - t_opt) ** 2) / (2 * sigma ** 2))
+        # 高斯型温度响应函数（查表插值，未建表时按解析式计算）
+        tables = self.get_factor_tables(params)
+        if tables is not None:
+            factor = tables.temperature_curve(temp)
+        else:
+            factor = float(SpeciesFactorTables.temperature_curve_exact(temp, params))
         
         # 添加边界惩罚
         if temp < t_min:
@@ -141,7 +470,7 @@ class SmartFeedingAlgorithm:
             penalty = 0.5 * ((temp - t_max) / t_max)
             factor = max(0.1, factor - penalty)
         
-        return np.clip(factor, 0.1, 1.0)
+        return min(max(factor, 0.1), 1.0)
     
     def calculate_dissolved_oxygen_factor(self, do: float, params: FishSpeciesParams) -> float:
         """
@@ -153,12 +482,12 @@ class SmartFeedingAlgorithm:
         do_opt = params.optimal_do
         do_min = params.min_do
         
-        # 临界点设为最低DO和最适DO的中点
-        do_crit = (do_min + do_opt) / 2
-        k = 2.0  # 曲线陡度
-        
-        # Sigmoid函数
-        factor = 1.0 / (1.0 + np.exp(-k * (do - do_crit)))
+        # Sigmoid函数（临界点为最低DO和最适DO的中点，查表插值）
+        tables = self.get_factor_tables(params)
+        if tables is not None:
+            factor = tables.do_curve(do)
+        else:
+            factor = float(SpeciesFactorTables.do_curve_exact(do, params))
         
         # 高于最适值时略微下调（过饱和可能有害）
         if do > do_opt * 1.5:
@@ -168,7 +497,7 @@ class SmartFeedingAlgorithm:
         if do < do_min:
             factor *= max(0.1, do / do_min)
         
-        return np.clip(factor, 0.1, 1.0)
+        return min(max(factor, 0.1), 1.0)
     
     def calculate_ph_factor(self, ph: float, params: FishSpeciesParams) -> float:
         """
@@ -212,7 +541,7 @@ class SmartFeedingAlgorithm:
         )
         
         # 限制交互项影响范围
-        return np.clip(1.0 + interaction, 0.8, 1.2)
+        return min(max(1.0 + interaction, 0.8), 1.2)
     
     def calculate_polynomial_features(self, temp: float, do: float, ph: float) -> np.ndarray:
         """
@@ -283,15 +612,9 @@ class SmartFeedingAlgorithm:
         # 计算基础投喂量
         base_feeding = biomass * (params.base_feeding_rate / 100) * time_interval
         
-        # 计算各环境因子
-        temp_factor = self.calculate_temperature_factor(temperature, params)
-        do_factor = self.calculate_dissolved_oxygen_factor(dissolved_oxygen, params)
-        ph_factor = self.calculate_ph_factor(ph, params)
-        
-        # 计算交互项修正
-        interaction_factor = self.calculate_interaction_terms(
-            temperature, dissolved_oxygen, ph,
-            temp_factor, do_factor, ph_factor
+        # 计算各环境因子及交互项修正（带缓存）
+        temp_factor, do_factor, ph_factor, interaction_factor = self.calculate_environment_factors(
+            fish_type, temperature, dissolved_oxygen, ph
         )
         
         # 综合环境修正因子
@@ -372,6 +695,192 @@ class SmartFeedingAlgorithm:
         return feeding_type, '；'.join(reasons)
 
 
+    # ------------------------------------------------------------------
+    # 批量（向量化）计算接口
+    # ------------------------------------------------------------------
+    
+    def get_species_param_arrays(self, fish_types) -> Dict[str, np.ndarray]:
+        """
+        将鱼种列表展开为逐项的参数数组
+        
+        每个不同鱼种只查一次参数，再按下标展开，未知鱼种使用通用参数。
+        """
+        fish_types = np.atleast_1d(np.asarray(fish_types, dtype=object))
+        keys, inverse = np.unique(fish_types.astype(str), return_inverse=True)
+        species = [self.get_species_params(key) for key in keys]
+        
+        def column(getter):
+            return np.array([getter(p) for p in species], dtype=float)[inverse]
+        
+        return {
+            'optimal_temp': column(lambda p: p.optimal_temp),
+            'temp_min': column(lambda p: p.temp_range[0]),
+            'temp_max': column(lambda p: p.temp_range[1]),
+            'optimal_do': column(lambda p: p.optimal_do),
+            'min_do': column(lambda p: p.min_do),
+            'ph_min': column(lambda p: p.optimal_ph[0]),
+            'ph_max': column(lambda p: p.optimal_ph[1]),
+            'base_feeding_rate': column(lambda p: p.base_feeding_rate),
+            'fcr': column(lambda p: p.fcr),
+            'energy_requirement': column(lambda p: p.energy_requirement),
+            'feed_energy_content': column(lambda p: p.feed_energy_content),
+            'params': np.array(species, dtype=object)[inverse],
+            'species': species,
+            'inverse': inverse
+        }
+    
+    def _species_curve_batch(self, values: np.ndarray, p: Dict[str, np.ndarray], curve: str) -> np.ndarray:
+        """按品种分组计算响应曲线（查表插值或解析式）"""
+        result = np.empty_like(values)
+        for index, params in enumerate(p['species']):
+            mask = p['inverse'] == index
+            tables = self.get_factor_tables(params)
+            if curve == 'temperature':
+                if tables is not None:
+                    result[mask] = tables.temperature_curve_array(values[mask])
+                else:
+                    result[mask] = SpeciesFactorTables.temperature_curve_exact(values[mask], params)
+            else:
+                if tables is not None:
+                    result[mask] = tables.do_curve_array(values[mask])
+                else:
+                    result[mask] = SpeciesFactorTables.do_curve_exact(values[mask], params)
+        return result
+    
+    def calculate_temperature_factor_batch(self, temp: np.ndarray, p: Dict[str, np.ndarray]) -> np.ndarray:
+        """温度修正因子（向量化），与 calculate_temperature_factor 逐项一致"""
+        t_min, t_max = p['temp_min'], p['temp_max']
+        factor = self._species_curve_batch(temp, p, 'temperature')
+        
+        low = temp < t_min
+        high = temp > t_max
+        penalty = np.where(low, 0.5 * ((t_min - temp) / t_min), 0.5 * ((temp - t_max) / t_max))
+        factor = np.where(low | high, np.maximum(0.1, factor - penalty), factor)
+        
+        return np.clip(factor, 0.1, 1.0)
+    
+    def calculate_dissolved_oxygen_factor_batch(self, do: np.ndarray, p: Dict[str, np.ndarray]) -> np.ndarray:
+        """溶解氧修正因子（向量化），与 calculate_dissolved_oxygen_factor 逐项一致"""
+        do_opt, do_min = p['optimal_do'], p['min_do']
+        factor = self._species_curve_batch(do, p, 'do')
+        
+        factor = np.where(do > do_opt * 1.5, factor * 0.95, factor)
+        factor = np.where(do < do_min, factor * np.maximum(0.1, do / do_min), factor)
+        
+        return np.clip(factor, 0.1, 1.0)
+    
+    def calculate_ph_factor_batch(self, ph: np.ndarray, p: Dict[str, np.ndarray]) -> np.ndarray:
+        """pH修正因子（向量化），与 calculate_ph_factor 逐项一致"""
+        ph_min, ph_max = p['ph_min'], p['ph_max']
+        deviation = np.where(ph < ph_min, ph_min - ph, ph - ph_max)
+        factor = np.maximum(0.2, 1.0 - 0.4 * deviation)
+        
+        return np.where((ph >= ph_min) & (ph <= ph_max), 1.0, factor)
+    
+    def calculate_interaction_terms_batch(self, temp: np.ndarray, do: np.ndarray, ph: np.ndarray) -> np.ndarray:
+        """环境因子交互项（向量化），与 calculate_interaction_terms 逐项一致"""
+        coeffs = self.poly_coefficients['interaction']
+        
+        temp_norm = (temp - 20) / 10
+        do_norm = (do - 6) / 2
+        ph_norm = (ph - 7.5) / 0.5
+        
+        interaction = (
+            coeffs['temp_do'] * temp_norm * do_norm +
+            coeffs['temp_ph'] * temp_norm * ph_norm +
+            coeffs['do_ph'] * do_norm * ph_norm
+        )
+        
+        return np.clip(1.0 + interaction, 0.8, 1.2)
+    
+    def calculate_feeding_batch(self, fish_counts, average_weights,
+                                fish_types='default',
+                                temperatures=24.0,
+                                dissolved_oxygens=6.0,
+                                phs=7.5,
+                                time_interval=1.0) -> Dict:
+        """
+        批量计算建议投喂量（向量化接口）
+        
+        参数均可为数组或标量（标量会广播到所有网箱），各环境因子、交互项和
+        能量平衡均以数组运算完成，结果与逐条调用 calculate_feeding_amount 一致。
+        
+        返回:
+            列式字典，每个字段为与输入等长的列表
+        """
+        fish_counts, average_weights, temperatures, dissolved_oxygens, phs, time_interval = np.broadcast_arrays(
+            np.asarray(fish_counts, dtype=float),
+            np.asarray(average_weights, dtype=float),
+            np.asarray(temperatures, dtype=float),
+            np.asarray(dissolved_oxygens, dtype=float),
+            np.asarray(phs, dtype=float),
+            np.asarray(time_interval, dtype=float)
+        )
+        fish_counts = np.atleast_1d(fish_counts)
+        size = fish_counts.shape[0]
+        average_weights = np.atleast_1d(average_weights)
+        temperatures = np.atleast_1d(temperatures)
+        dissolved_oxygens = np.atleast_1d(dissolved_oxygens)
+        phs = np.atleast_1d(phs)
+        time_interval = np.atleast_1d(time_interval)
+        
+        if np.ndim(fish_types) == 0:
+            fish_types = [fish_types] * size
+        p = self.get_species_param_arrays(fish_types)
+        
+        # 计算总生物量和基础投喂量
+        biomass = fish_counts * average_weights
+        base_feeding = biomass * (p['base_feeding_rate'] / 100) * time_interval
+        
+        # 计算各环境因子（与单条接口使用相同的量化规则）
+        cache = self.factor_cache
+        q_temp = cache.quantize_array('temperature', temperatures)
+        q_do = cache.quantize_array('dissolved_oxygen', dissolved_oxygens)
+        q_ph = cache.quantize_array('ph', phs)
+        temp_factor = self.calculate_temperature_factor_batch(q_temp, p)
+        do_factor = self.calculate_dissolved_oxygen_factor_batch(q_do, p)
+        ph_factor = self.calculate_ph_factor_batch(q_ph, p)
+        interaction_factor = self.calculate_interaction_terms_batch(q_temp, q_do, q_ph)
+        
+        # 综合环境修正因子
+        env_factor = temp_factor * do_factor * ph_factor * interaction_factor
+        
+        adjusted_feeding = base_feeding * env_factor
+        energy_feeding = (biomass * p['energy_requirement'] * time_interval * env_factor) / \
+                         (p['fcr'] * p['feed_energy_content'])
+        final_feeding = 0.6 * adjusted_feeding + 0.4 * energy_feeding
+        
+        # 推荐类型和原因为文本，逐项生成
+        types, reasons = [], []
+        rows = zip(env_factor.tolist(), temp_factor.tolist(), do_factor.tolist(), ph_factor.tolist(),
+                   temperatures.tolist(), dissolved_oxygens.tolist(), phs.tolist(), p['params'])
+        for row in rows:
+            feeding_type, reason = self._determine_feeding_recommendation(*row)
+            types.append(feeding_type)
+            reasons.append(reason)
+        
+        # 与单条接口相同，按Python float十进制舍入
+        def rounded(values: np.ndarray, digits: int) -> list:
+            return [round(v, digits) for v in values.tolist()]
+        
+        return {
+            'amount': rounded(final_feeding, 2),
+            'type': types,
+            'reason': reasons,
+            'details': {
+                'biomass': rounded(biomass, 2),
+                'base_feeding': rounded(base_feeding, 2),
+                'temp_factor': rounded(temp_factor, 3),
+                'do_factor': rounded(do_factor, 3),
+                'ph_factor': rounded(ph_factor, 3),
+                'env_factor': rounded(env_factor, 3),
+                'adjusted_feeding': rounded(adjusted_feeding, 2),
+                'energy_feeding': rounded(energy_feeding, 2),
+                'fish_species': [params.name for params in p['params']]
+            }
+        }
+
+
 # 创建全局算法实例
 feeding_algorithm = SmartFeedingAlgorithm()
 
@@ -393,3 +902,23 @@ def calculate_feeding(fish_count: int, average_weight: float,
         dissolved_oxygen=env_data.get('dissolvedOxygen', 6.0),
         ph=env_data.get('ph', 7.5)
     )
+
+
+def calculate_feeding_batch(fish_counts, average_weights, fish_types='default',
+                            env_data: Optional[Dict] = None) -> Dict:
+    """
+    便捷接口：批量计算建议投喂量
+    
+    env_data 中的各项可以是数组（逐网箱）或标量（所有网箱共用）
+    """
+    if env_data is None:
+        env_data = {}
+    
+    return feeding_algorithm.calculate_feeding_batch(
+        fish_counts=fish_counts,
+        average_weights=average_weights,
+        fish_types=fish_types,
+        temperatures=env_data.get('temperature', 24.0),
+        dissolved_oxygens=env_data.get('dissolvedOxygen', 6.0),
+        phs=env_data.get('ph', 7.5)
+    )
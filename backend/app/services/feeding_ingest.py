@@ -0,0 +1,196 @@
+"""
+设备投喂记录上传服务
+
+设备批量上传本地执行的投喂记录，每条记录带设备生成的事件ID（event_id）。
+网络重试会重复上传同一批记录，去重分两层：
+- 每台设备最近上传过的事件ID保存在进程内的有界集合中，常见的整批重传直接丢弃，不访问数据库；
+- 其余记录按 (device_id, event_id) 唯一键一次查出已入库的事件ID，新记录以一条批量语句写入；
+  写入语句只忽略该唯一键的冲突（MySQL ON DUPLICATE KEY UPDATE id=id，SQLite ON CONFLICT DO NOTHING），
+  查询之后其他进程并发写入的同一事件被丢弃，截断、非空、外键等其他错误照常报错。
+"""
+
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import select
+
+from app import db
+from app.models.feeding import FeedingHistory
+from app.services.environment_ingest import parse_timestamp
+from app.services.stat_counters import stat_counters
+from app.utils.validators import ValidationError, validate_positive_number, sanitize_string
+
+
+# 设备上报的执行结果 -> 投喂记录状态
+EVENT_STATUSES = {'success': 'done', 'done': 'done', 'failed': 'failed'}
+
+FEEDING_TYPES = ('auto', 'manual')
+
+
+class RecentEventIds:
+    """每台设备最近上传过的事件ID（按写入顺序淘汰）"""
+
+    def __init__(self, per_device: int = 1000):
+        self.per_device = per_device
+        self._devices: Dict[str, OrderedDict] = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.per_device = app.config.get('FEEDING_EVENT_RECENT_IDS', 1000)
+
+    def filter_new(self, device_id: str, event_ids: Iterable[str]) -> List[str]:
+        """返回不在近期集合中的事件ID"""
+        with self._lock:
+            seen = self._devices.get(device_id)
+            if not seen:
+                return list(event_ids)
+            return [event_id for event_id in event_ids if event_id not in seen]
+
+    def add(self, device_id: str, event_ids: Iterable[str]):
+        with self._lock:
+            seen = self._devices.setdefault(device_id, OrderedDict())
+            for event_id in event_ids:
+                seen[event_id] = None
+                seen.move_to_end(event_id)
+            while len(seen) > self.per_device:
+                seen.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._devices.clear()
+
+
+# 全局近期事件ID集合
+recent_event_ids = RecentEventIds()
+
+
+def parse_feeding_event(item: Dict) -> Dict:
+    """校验单条投喂记录并转换为入库字段，校验失败抛出 ValidationError"""
+    if not isinstance(item, dict):
+        raise ValidationError('数据格式错误')
+
+    event_id = item.get('event_id')
+    if isinstance(event_id, int) and not isinstance(event_id, bool):
+        event_id = str(event_id)
+    if not isinstance(event_id, str) or not event_id.strip():
+        raise ValidationError('缺少必填字段: event_id', 'event_id')
+    event_id = event_id.strip()
+    if len(event_id) > 64:
+        raise ValidationError('event_id最长64个字符', 'event_id')
+
+    valid, msg = validate_positive_number(item.get('amount'), '投喂量')
+    if not valid:
+        raise ValidationError(msg, 'amount')
+
+    try:
+        time = parse_timestamp(item.get('time'))
+    except ValidationError:
+        raise ValidationError('时间格式无效', 'time')
+
+    feeding_type = item.get('type') or 'auto'
+    if feeding_type not in FEEDING_TYPES:
+        raise ValidationError(f'type必须是以下值之一: {", ".join(FEEDING_TYPES)}', 'type')
+
+    status = EVENT_STATUSES.get(item.get('status') or 'success')
+    if status is None:
+        raise ValidationError(f'status必须是以下值之一: {", ".join(EVENT_STATUSES)}', 'status')
+
+    fish_count = item.get('fish_count')
+    average_weight = item.get('average_weight')
+    try:
+        fish_count = int(fish_count) if fish_count not in (None, '') else None
+        average_weight = float(average_weight) if average_weight not in (None, '') else None
+    except (TypeError, ValueError):
+        raise ValidationError('鱼群数量和平均体重必须是数字')
+
+    return {
+        'event_id': event_id,
+        'amount': float(item['amount']),
+        'time': time,
+        'timestamp': time,
+        'type': feeding_type,
+        'operator': sanitize_string(item.get('operator') or 'device', 50),
+        'status': status,
+        'fish_type': sanitize_string(item['fish_type'], 50) if item.get('fish_type') else None,
+        'fish_count': fish_count,
+        'average_weight': average_weight
+    }
+
+
+def parse_feeding_events(items: List) -> Tuple[List[Dict], List[Dict]]:
+    """
+    批量校验投喂记录
+
+    返回:
+        (有效记录列表, 错误列表)，错误项包含原始下标和错误原因
+    """
+    rows = []
+    errors = []
+    for index, item in enumerate(items):
+        try:
+            rows.append(parse_feeding_event(item))
+        except ValidationError as e:
+            errors.append({'index': index, 'field': e.field, 'message': e.message})
+    return rows, errors
+
+
+def _insert_ignoring_duplicates(rows: List[Dict]) -> int:
+    """按方言构造只忽略 (device_id, event_id) 冲突的批量写入，返回写入行数"""
+    table = FeedingHistory.__table__
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        statement = mysql_insert(table).on_duplicate_key_update(id=table.c.id)
+        db.session.execute(statement, rows)
+        # 连接启用了 CLIENT_FOUND_ROWS，命中重复行时 rowcount 同样计1，
+        # 写入前已排除入库的事件，只有并发写入同一事件时会多计
+        return len(rows)
+
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    statement = dialect_insert(table).on_conflict_do_nothing(index_elements=['device_id', 'event_id'])
+    return db.session.execute(statement, rows).rowcount
+
+
+def insert_feeding_events(device_id: str, rows: List[Dict]) -> Tuple[int, int]:
+    """
+    批量写入设备上传的投喂记录（一次唯一键查询 + 一条批量写入 + 一次提交）
+
+    返回:
+        (新写入条数, 重复丢弃条数)，同一批次内重复的事件ID只写入第一条
+    """
+    unique = {}
+    for row in rows:
+        unique.setdefault(row['event_id'], row)
+    fresh_ids = recent_event_ids.filter_new(device_id, unique)
+    if not fresh_ids:
+        return 0, len(rows)
+
+    try:
+        stored = set(db.session.execute(
+            select(FeedingHistory.event_id)
+            .where(FeedingHistory.device_id == device_id, FeedingHistory.event_id.in_(fresh_ids))
+        ).scalars())
+        fresh = [unique[event_id] for event_id in fresh_ids if event_id not in stored]
+
+        inserted = 0
+        if fresh:
+            now = datetime.now()
+            for row in fresh:
+                row['device_id'] = device_id
+                row['created_at'] = now
+            # 按表写入（而非 ORM 批量写入），Core 写入不经过 ORM 事件，计数器按写入行数累加
+            inserted = _insert_ignoring_duplicates(fresh)
+            stat_counters.increment({'feedings.total': inserted})
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    recent_event_ids.add(device_id, fresh_ids)
+    return inserted, len(rows) - inserted
@@ -0,0 +1,357 @@
+"""
+投喂计划调度服务
+
+进程内维护一个按下次执行时间排序的最小堆，后台线程只在最近一个计划到期时唤醒，
+不再逐分钟扫描计划表。计划的增删改由接口在提交后增量更新到堆中；
+其他工作进程的修改通过定期比对计划表指纹（行数 + 最大更新时间）发现并重建。
+
+多个 gunicorn 工作进程中只有持有数据库租约的进程会执行计划；每次执行前
+以 last_fired_at 做条件更新认领，租约交接的边界情况下同一计划也不会重复投喂。
+"""
+
+import atexit
+import heapq
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, insert, or_, select, update
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = 'feeding_scheduler'
+
+
+def plan_event_id(plan_id: int, fire_at: datetime) -> str:
+    """计划投喂记录的事件ID：同一计划同一执行时间只有一条记录（唯一键 device_id, event_id）"""
+    return f'plan:{plan_id}:{fire_at:%Y%m%d%H%M%S}'
+
+
+class FeedingScheduler:
+    """投喂计划调度器"""
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.sync_interval = 30.0
+        self.grace_period = 300.0
+        self.lease = None
+
+        self._heap: List = []
+        # 计划ID -> 当前有效版本号，堆中版本号不一致的条目视为已作废（惰性删除）
+        self._versions: Dict[int, int] = {}
+        self._version_counter = 0
+        self._fingerprint = None
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._next_maintenance = 0.0
+
+        self._stats = {
+            'fired': 0,
+            'skipped': 0,
+            'reloads': 0,
+            'last_fired_at': None
+        }
+
+    def init_app(self, app):
+        """从应用配置初始化调度参数，并启动后台线程"""
+        from app.services.lease import DatabaseLease
+
+        self.app = app
+        self.enabled = app.config.get('FEEDING_SCHEDULER_ENABLED', True)
+        self.sync_interval = app.config.get('FEEDING_SCHEDULER_SYNC_INTERVAL', 30.0)
+        self.grace_period = app.config.get('FEEDING_SCHEDULER_GRACE_PERIOD', 300.0)
+        self.lease = DatabaseLease(LEASE_NAME, app.config.get('FEEDING_SCHEDULER_LEASE_TTL', 30.0))
+
+        if self.enabled:
+            self.start()
+            atexit.register(self.stop)
+            if hasattr(os, 'register_at_fork'):
+                # 预加载应用后 fork 的工作进程中线程不会被继承，需要重新启动
+                os.register_at_fork(after_in_child=self._after_fork)
+
+    # ------------------------------------------------------------------
+    # 线程管理
+    # ------------------------------------------------------------------
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._next_maintenance = 0.0
+        self._thread = threading.Thread(target=self._run, name='feeding-scheduler', daemon=True)
+        self._thread.start()
+
+    def _after_fork(self):
+        self._condition = threading.Condition()
+        self._thread = None
+        self.lease.reset_owner()
+        self.start()
+
+    def stop(self, timeout: float = 5.0):
+        """停止后台线程并释放租约"""
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+        if self.lease is not None and self.lease.held:
+            with self.app.app_context():
+                self.lease.release()
+
+    def _run(self):
+        """调度线程主循环：等待到最近的到期时间或维护时间"""
+        while not self._stop_event.is_set():
+            with self._condition:
+                timeout = self._next_maintenance - time.monotonic()
+                # 未持有租约的进程只需按时尝试抢占租约
+                next_fire = self._peek() if self.lease.held else None
+                if next_fire is not None:
+                    timeout = min(timeout, (next_fire - datetime.now()).total_seconds())
+                if timeout > 0:
+                    self._condition.wait(timeout)
+            if self._stop_event.is_set():
+                break
+
+            try:
+                with self.app.app_context():
+                    if time.monotonic() >= self._next_maintenance:
+                        self._maintain()
+                        self._next_maintenance = time.monotonic() + self._maintenance_interval()
+                    if self.lease.held:
+                        self.fire_due()
+            except Exception as e:
+                logger.error('投喂计划调度失败: %s', e)
+                self._next_maintenance = time.monotonic() + self._maintenance_interval()
+                # 数据库异常时退避，避免到期计划反复重试占满CPU
+                self._stop_event.wait(self._maintenance_interval())
+
+    def _maintenance_interval(self) -> float:
+        # 续约间隔取租约有效期的三分之一，保证持有者在到期前完成续约
+        return min(self.sync_interval, self.lease.ttl / 3)
+
+    def _maintain(self):
+        """续约租约，并检查计划表是否被其他进程修改"""
+        was_held = self.lease.held
+        held = self.lease.acquire()
+        if not held:
+            return
+        fingerprint = self._read_fingerprint()
+        if not was_held or fingerprint != self._fingerprint:
+            self.reload(fingerprint)
+
+    # ------------------------------------------------------------------
+    # 计划堆维护
+    # ------------------------------------------------------------------
+
+    def _read_fingerprint(self):
+        from app import db
+        from app.models.feeding import FeedingPlan
+
+        row = db.session.query(func.count(FeedingPlan.id), func.max(FeedingPlan.updated_at)).one()
+        return tuple(row)
+
+    def next_fire_time(self, plan_time, last_fired_at: Optional[datetime],
+                       updated_at: Optional[datetime], now: Optional[datetime] = None) -> datetime:
+        """
+        计算计划的下次执行时间
+
+        今天的执行时间刚过去不久（宽限期内）且尚未执行时立即补执行，
+        用于覆盖进程重启、租约交接期间错过的计划；计划在执行时间之后才创建或修改的不补执行。
+        """
+        now = now or datetime.now()
+        today_at = datetime.combine(now.date(), plan_time)
+        if today_at > now:
+            return today_at
+
+        missed = (now - today_at).total_seconds() <= self.grace_period
+        fired = last_fired_at is not None and last_fired_at >= today_at
+        changed_after = updated_at is not None and updated_at > today_at
+        if missed and not fired and not changed_after:
+            return today_at
+        return today_at + timedelta(days=1)
+
+    def _push(self, plan_id: int, fire_at: datetime):
+        self._version_counter += 1
+        self._versions[plan_id] = self._version_counter
+        heapq.heappush(self._heap, (fire_at, plan_id, self._version_counter))
+
+    def _peek(self) -> Optional[datetime]:
+        """返回最近的有效执行时间，顺便弹出已作废的堆顶条目"""
+        while self._heap:
+            fire_at, plan_id, version = self._heap[0]
+            if self._versions.get(plan_id) == version:
+                return fire_at
+            heapq.heappop(self._heap)
+        return None
+
+    def schedule_plan(self, plan):
+        """计划创建或修改后调用（事务提交后），增量更新堆"""
+        if not self.enabled:
+            return
+        with self._condition:
+            if plan.status != 'active':
+                self._versions.pop(plan.id, None)
+            else:
+                self._push(plan.id, self.next_fire_time(plan.time, plan.last_fired_at, plan.updated_at))
+            self._condition.notify()
+
+    def remove_plan(self, plan_id: int):
+        """计划删除后调用"""
+        if not self.enabled:
+            return
+        with self._condition:
+            self._versions.pop(plan_id, None)
+            self._condition.notify()
+
+    def reload(self, fingerprint=None):
+        """从计划表重建整个堆（成为租约持有者或发现其他进程修改计划时）"""
+        from app.models.feeding import FeedingPlan
+
+        plans = FeedingPlan.query.filter(FeedingPlan.status == 'active').all()
+        now = datetime.now()
+        with self._condition:
+            self._heap = []
+            self._versions = {}
+            for plan in plans:
+                self._push(plan.id, self.next_fire_time(plan.time, plan.last_fired_at, plan.updated_at, now))
+            self._fingerprint = fingerprint if fingerprint is not None else self._read_fingerprint()
+            self._stats['reloads'] += 1
+            self._condition.notify()
+
+    def _pop_due(self, now: datetime) -> Dict[int, datetime]:
+        due = {}
+        with self._condition:
+            while self._peek() is not None and self._heap[0][0] <= now:
+                fire_at, plan_id, _ = heapq.heappop(self._heap)
+                self._versions.pop(plan_id, None)
+                due[plan_id] = fire_at
+        return due
+
+    # ------------------------------------------------------------------
+    # 执行
+    # ------------------------------------------------------------------
+
+    def fire_due(self, now: Optional[datetime] = None) -> int:
+        """
+        执行所有到期的计划（需在应用上下文中调用）
+
+        到期计划逐条以 last_fired_at 条件更新认领，认领成功的计划写入投喂历史并向设备下发投喂指令，
+        与认领在同一事务中提交。返回本次执行的计划数。
+        """
+        from app import db
+        from app.models.feeding import FeedingPlan, FeedingHistory
+        from app.services.command_queue import command_queue
+        from app.services.stat_counters import stat_counters
+        from app.utils.unit_of_work import audit_log
+
+        now = now or datetime.now()
+        due = self._pop_due(now)
+        if not due:
+            return 0
+
+        plans = FeedingPlan.query.filter(
+            FeedingPlan.id.in_(list(due)),
+            FeedingPlan.status == 'active'
+        ).all()
+
+        plan_ids = [plan.id for plan in plans]
+        rows = []
+        fired_plans = []
+        try:
+            for plan in plans:
+                fire_at = due[plan.id]
+                result = db.session.execute(
+                    update(FeedingPlan)
+                    .where(FeedingPlan.id == plan.id)
+                    .where(FeedingPlan.status == 'active')
+                    .where(or_(FeedingPlan.last_fired_at.is_(None), FeedingPlan.last_fired_at < fire_at))
+                    # 执行记录不算计划修改，保持 updated_at 不变以免触发其他进程重建
+                    .values(last_fired_at=fire_at, updated_at=FeedingPlan.updated_at)
+                    .execution_options(synchronize_session=False)
+                )
+                if result.rowcount != 1:
+                    self._stats['skipped'] += 1
+                    continue
+                rows.append({
+                    'device_id': plan.device_id,
+                    'event_id': plan_event_id(plan.id, fire_at),
+                    'amount': plan.amount,
+                    'time': fire_at,
+                    'timestamp': now,
+                    'type': 'auto',
+                    'operator': 'scheduler',
+                    'status': 'pending',
+                    'created_at': now
+                })
+                fired_plans.append(plan)
+
+            if rows:
+                # 投喂记录和指令各一条批量语句写入；记录ID按 (设备, 事件ID) 一次查回
+                db.session.execute(insert(FeedingHistory), rows)
+                stat_counters.increment({'feedings.total': len(rows)})
+                history_ids = {
+                    (device_id, event_id): history_id
+                    for history_id, device_id, event_id in db.session.execute(
+                        select(FeedingHistory.id, FeedingHistory.device_id, FeedingHistory.event_id)
+                        .where(FeedingHistory.device_id.in_({row['device_id'] for row in rows}))
+                        .where(FeedingHistory.event_id.in_([row['event_id'] for row in rows]))
+                    )
+                }
+                command_queue.enqueue_many([{
+                    'device_id': plan.device_id,
+                    'command': 'feed',
+                    'payload': {'amount': plan.amount, 'planId': plan.id},
+                    'history_id': history_ids.get((row['device_id'], row['event_id']))
+                } for plan, row in zip(fired_plans, rows)])
+
+            if fired_plans:
+                audit_log('投喂管理', '执行计划投喂', '执行投喂计划: ' + ', '.join(
+                    f'{plan.name}(ID: {plan.id}, 设备: {plan.device_id}, 投喂量: {plan.amount}kg)'
+                    for plan in fired_plans
+                ), operator='system')
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # 执行失败时放回堆中，下一轮重试
+            with self._condition:
+                for plan_id, fire_at in due.items():
+                    self._push(plan_id, fire_at)
+            raise
+
+        # 已执行的计划排入下一天
+        with self._condition:
+            for plan_id in plan_ids:
+                if plan_id not in self._versions:
+                    self._push(plan_id, due[plan_id] + timedelta(days=1))
+
+        self._stats['fired'] += len(fired_plans)
+        if fired_plans:
+            self._stats['last_fired_at'] = now
+        return len(fired_plans)
+
+    def stats(self) -> Dict:
+        """获取调度器运行状态"""
+        with self._condition:
+            next_fire = self._peek()
+            scheduled = len(self._versions)
+        return {
+            'enabled': self.enabled,
+            'running': self._thread is not None and self._thread.is_alive(),
+            'leaseHeld': bool(self.lease and self.lease.held),
+            'owner': self.lease.owner if self.lease else None,
+            'scheduledPlans': scheduled,
+            'nextFireAt': next_fire.isoformat() if next_fire else None,
+            'fired': self._stats['fired'],
+            'skipped': self._stats['skipped'],
+            'reloads': self._stats['reloads'],
+            'lastFiredAt': self._stats['last_fired_at'].isoformat() if self._stats['last_fired_at'] else None
+        }
+
+
+# 全局调度器实例
+feeding_scheduler = FeedingScheduler()
@@ -0,0 +1,257 @@
+"""
+环境数据写缓冲服务
+
+设备上报的读数先进入进程内有界队列，由后台线程按批量大小或时间间隔
+合并写入数据库。队列满时拒绝写入（由接口返回429），进程正常退出时
+会把队列中剩余的数据全部落库。
+
+批量写入失败先整批重试；重试耗尽后把批次二分拆开分别写入，
+只丢弃单独写入仍失败的记录（如超出字段范围的读数），其余记录照常落库。
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from sqlalchemy.exc import OperationalError
+
+logger = logging.getLogger(__name__)
+
+
+class IngestBuffer:
+    """环境数据写缓冲（write-behind）"""
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.max_size = 10000
+        self.batch_size = 500
+        self.flush_interval = 1.0
+        self.max_retries = 3
+
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._retry_batch: List[Dict] = []
+        self._retry_count = 0
+
+        self._stats = {
+            'accepted': 0,
+            'rejected_full': 0,
+            'flushed_rows': 0,
+            'flush_count': 0,
+            'failed_flushes': 0,
+            'dropped_rows': 0,
+            'salvaged_rows': 0,
+            'last_flush_latency_ms': 0.0,
+            'max_flush_latency_ms': 0.0,
+            'total_flush_latency_ms': 0.0
+        }
+
+    def init_app(self, app):
+        """从应用配置初始化缓冲参数"""
+        self.app = app
+        self.enabled = app.config.get('INGEST_BUFFER_ENABLED', True)
+        self.max_size = app.config.get('INGEST_QUEUE_MAXSIZE', 10000)
+        self.batch_size = app.config.get('INGEST_FLUSH_BATCH_SIZE', 500)
+        self.flush_interval = app.config.get('INGEST_FLUSH_INTERVAL', 1.0)
+        self.max_retries = app.config.get('INGEST_FLUSH_MAX_RETRIES', 3)
+        atexit.register(self.stop)
+
+    def _ensure_started(self):
+        """按需启动后台刷新线程（兼容 fork 后的工作进程）"""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                # fork 后父进程的队列和线程不可用，重新创建
+                self._queue = queue.Queue(maxsize=self.max_size)
+                self._retry_batch = []
+                self._retry_count = 0
+            self._pid = os.getpid()
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name='ingest-flusher', daemon=True)
+            self._thread.start()
+
+    def submit(self, row: Dict) -> bool:
+        """提交一条读数，队列已满时返回False"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            with self._lock:
+                self._stats['rejected_full'] += 1
+            return False
+        with self._lock:
+            self._stats['accepted'] += 1
+        return True
+
+    def _collect(self) -> List[Dict]:
+        """收集一批待写入数据，达到批量大小或等待超时即返回"""
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=self.flush_interval))
+        except queue.Empty:
+            return batch
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self) -> List[Dict]:
+        """取出队列中当前全部数据"""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _insert(self, batch: List[Dict]):
+        """写入一批数据并记录写入耗时，失败时抛出异常"""
+        from app.services.environment_ingest import insert_readings
+
+        started = time.perf_counter()
+        with self.app.app_context():
+            insert_readings(batch)
+        latency = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._stats['flushed_rows'] += len(batch)
+            self._stats['flush_count'] += 1
+            self._stats['last_flush_latency_ms'] = latency
+            self._stats['total_flush_latency_ms'] += latency
+            self._stats['max_flush_latency_ms'] = max(self._stats['max_flush_latency_ms'], latency)
+
+    def _flush(self, batch: List[Dict]):
+        """将一批数据写入数据库，失败时保留到下一轮重试，重试耗尽后拆批写入"""
+        if self._retry_batch:
+            batch = self._retry_batch + batch
+            self._retry_batch = []
+        if not batch:
+            return
+
+        try:
+            self._insert(batch)
+        except Exception as e:
+            with self._lock:
+                self._stats['failed_flushes'] += 1
+            self._retry_count += 1
+            if self._retry_count > self.max_retries:
+                logger.warning('环境数据写入重试耗尽，拆分 %d 条逐段写入: %s', len(batch), e)
+                self._retry_count = 0
+                self._salvage(batch, e)
+            else:
+                logger.warning('环境数据写入失败，等待重试: %s', e)
+                self._retry_batch = batch
+            return
+
+        self._retry_count = 0
+
+    def _salvage(self, batch: List[Dict], error: Exception):
+        """
+        二分拆分写入失败的批次，只丢弃单条写入仍失败的记录
+
+        按原顺序写入（告警持续时间依赖读数先后）。失败原因是数据库不可用时
+        拆分没有意义，剩余记录直接丢弃。
+        """
+        # (记录, 整段写入时的错误)，错误为None表示尚未尝试
+        pending = deque([(batch, error)])
+        while pending:
+            part, error = pending.popleft()
+            if error is not None:
+                if len(part) == 1:
+                    logger.error('环境数据写入失败，丢弃设备 %s 的读数 %s: %s',
+                                 part[0].get('device_id'), part[0].get('timestamp'), error)
+                    with self._lock:
+                        self._stats['dropped_rows'] += 1
+                    continue
+                half = len(part) // 2
+                pending.extendleft(((part[half:], None), (part[:half], None)))
+                continue
+
+            try:
+                self._insert(part)
+            except OperationalError as e:
+                dropped = len(part) + sum(len(rest) for rest, _ in pending)
+                logger.error('环境数据写入失败（数据库不可用），丢弃 %d 条: %s', dropped, e)
+                with self._lock:
+                    self._stats['failed_flushes'] += 1
+                    self._stats['dropped_rows'] += dropped
+                return
+            except Exception as e:
+                with self._lock:
+                    self._stats['failed_flushes'] += 1
+                pending.appendleft((part, e))
+                continue
+            with self._lock:
+                self._stats['salvaged_rows'] += len(part)
+
+    def _run(self):
+        """后台刷新线程主循环"""
+        while not self._stop_event.is_set():
+            batch = self._collect()
+            if batch or self._retry_batch:
+                self._flush(batch)
+
+    def flush(self):
+        """立即写入队列中的全部数据"""
+        if self._queue is None or self._pid != os.getpid():
+            return
+        self._flush(self._drain())
+
+    def stop(self, timeout: float = 5.0):
+        """停止后台线程并写入剩余数据（进程退出时调用）"""
+        self._stop_event.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                # 刷新线程仍在写入，并发写入会重复处理重试批次，剩余数据随进程退出丢失
+                logger.error('环境数据刷新线程 %.1f 秒内未退出，放弃写入队列中剩余的 %d 条',
+                             timeout, self._queue.qsize())
+                return
+        self.flush()
+        if self._retry_batch:
+            self._flush([])
+
+    def stats(self) -> Dict:
+        """获取缓冲运行指标"""
+        with self._lock:
+            stats = dict(self._stats)
+        flush_count = stats['flush_count']
+        return {
+            'enabled': self.enabled,
+            'queueDepth': self._queue.qsize() if self._queue is not None else 0,
+            'queueCapacity': self.max_size,
+            'accepted': stats['accepted'],
+            'rejectedFull': stats['rejected_full'],
+            'flushedRows': stats['flushed_rows'],
+            'flushCount': flush_count,
+            'failedFlushes': stats['failed_flushes'],
+            'salvagedRows': stats['salvaged_rows'],
+            'droppedRows': stats['dropped_rows'],
+            'pendingRetryRows': len(self._retry_batch),
+            'lastFlushLatencyMs': round(stats['last_flush_latency_ms'], 2),
+            'avgFlushLatencyMs': round(stats['total_flush_latency_ms'] / flush_count, 2) if flush_count else 0,
+            'maxFlushLatencyMs': round(stats['max_flush_latency_ms'], 2)
+        }
+
+
+# 全局写缓冲实例
+ingest_buffer = IngestBuffer()
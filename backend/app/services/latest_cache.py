@@ -0,0 +1,129 @@
+"""
+最新环境读数缓存
+
+数据写入后更新进程内的最新读数（按传感器以及全局各保存一份），
+实时数据接口和投喂量计算直接读取缓存，未命中时回退到数据库查询并回填。
+缓存条目设有有效期，多进程部署时其他进程写入的数据最多延迟一个有效期可见。
+"""
+
+import threading
+import time
+from typing import Dict, List, Optional
+
+from app.models.environment import EnvironmentData
+
+
+# 全局最新读数的缓存键
+ALL_SENSORS = '*'
+
+# 数据库中没有读数时的占位值，避免冷启动时反复查询
+_EMPTY = object()
+
+
+class LatestReadingCache:
+    """最新读数缓存"""
+
+    def __init__(self):
+        self.ttl = 5.0
+        self._entries: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'updates': 0}
+
+    def init_app(self, app):
+        self.ttl = app.config.get('LATEST_CACHE_TTL', 5.0)
+
+    def _put(self, key: str, reading, cached_at: float):
+        current = self._entries.get(key)
+        if current is not None and current[0] is not _EMPTY and reading is not _EMPTY:
+            # 乱序到达的旧数据不覆盖更新的读数
+            if current[0]['timestamp'] > reading['timestamp']:
+                self._entries[key] = (current[0], cached_at)
+                return
+        self._entries[key] = (reading, cached_at)
+
+    def update(self, rows: List[Dict]):
+        """写入成功后用本批数据更新缓存"""
+        if not rows:
+            return
+
+        latest = {}
+        for row in rows:
+            for key in (row.get('device_id') or None, ALL_SENSORS):
+                if key is None:
+                    continue
+                current = latest.get(key)
+                if current is None or row['timestamp'] >= current['timestamp']:
+                    latest[key] = row
+
+        now = time.monotonic()
+        with self._lock:
+            for key, row in latest.items():
+                self._put(key, {
+                    'device_id': row.get('device_id'),
+                    'pond_id': row.get('pond_id'),
+                    'timestamp': row['timestamp'],
+                    'temperature': row['temperature'],
+                    'dissolved_oxygen': row['dissolved_oxygen'],
+                    'ph': row['ph'],
+                    'water_flow': row['water_flow']
+                }, now)
+            self._stats['updates'] += 1
+
+    def get(self, device_id: Optional[str] = None) -> Optional[Dict]:
+        """
+        获取最新读数
+
+        缓存未命中或过期时查询数据库并回填，没有任何数据时返回None。
+        """
+        key = device_id or ALL_SENSORS
+        entry = self._entries.get(key)
+        if entry is not None:
+            if time.monotonic() - entry[1] <= self.ttl:
+                self._stats['hits'] += 1
+                return None if entry[0] is _EMPTY else entry[0]
+            self._stats['expired'] += 1
+
+        self._stats['misses'] += 1
+        reading = self._load(device_id)
+        with self._lock:
+            self._entries[key] = (_EMPTY if reading is None else reading, time.monotonic())
+        return reading
+
+    def _load(self, device_id: Optional[str]) -> Optional[Dict]:
+        """从数据库读取最新读数"""
+        query = EnvironmentData.query
+        if device_id:
+            query = query.filter(EnvironmentData.device_id == device_id)
+        record = query.order_by(EnvironmentData.timestamp.desc()).first()
+        if record is None:
+            return None
+        return {
+            'device_id': record.device_id,
+            'pond_id': record.pond_id,
+            'timestamp': record.timestamp,
+            'temperature': record.temperature,
+            'dissolved_oxygen': record.dissolved_oxygen,
+            'ph': record.ph,
+            'water_flow': record.water_flow
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """获取缓存命中指标"""
+        lookups = self._stats['hits'] + self._stats['misses']
+        return {
+            'size': len(self._entries),
+            'ttlSeconds': self.ttl,
+            'hits': self._stats['hits'],
+            'misses': self._stats['misses'],
+            'expired': self._stats['expired'],
+            'updates': self._stats['updates'],
+            'hitRate': round(self._stats['hits'] / lookups, 4) if lookups else 0
+        }
+
+
+# 全局缓存实例
+latest_cache = LatestReadingCache()
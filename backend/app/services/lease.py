@@ -0,0 +1,276 @@
+"""
+数据库租约服务
+
+多个 gunicorn 工作进程各自启动后台线程时，通过 service_leases 表中的一行
+选出唯一的执行者：持有者在到期前续约，持有者进程退出后租约过期，由其他进程接管。
+抢占和续约都是单条条件 UPDATE，依赖数据库行锁保证原子性。
+LeasedJob 在租约之上封装周期性后台任务（计数器校准、分区维护等）。
+任务执行期间由单独的线程续约；租约失效（续约失败或超时）后任务中的提交被拒绝，
+避免耗时较长的任务被其他进程接管后两个进程同时执行。
+"""
+
+import atexit
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, update, or_
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models.lease import ServiceLease
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseLostError(RuntimeError):
+    """租约任务执行期间租约已失效"""
+
+
+# 当前线程正在执行的租约任务
+_job_context = threading.local()
+
+
+def ensure_lease_held():
+    """
+    在租约任务中调用：租约已失效时抛出 LeaseLostError
+
+    任务中的数据库提交会自动检查；执行隐式提交的 DDL 前需显式调用。
+    不在租约任务中调用时不做检查。
+    """
+    job = getattr(_job_context, 'job', None)
+    if job is not None and not job.lease.valid():
+        raise LeaseLostError(f'后台任务 {job.name} 的租约已失效，停止执行')
+
+
+def _check_lease_before_commit(session):
+    ensure_lease_held()
+
+
+def make_owner_id() -> str:
+    """生成当前进程的持有者标识"""
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+class DatabaseLease:
+    """基于数据库行的租约"""
+    
+    def __init__(self, name: str, ttl: float = 30.0):
+        self.name = name
+        self.ttl = ttl
+        self.owner = make_owner_id()
+        self.held = False
+        self._valid_until = 0.0
+    
+    def reset_owner(self):
+        """fork 后子进程需要使用新的持有者标识"""
+        self.owner = make_owner_id()
+        self.held = False
+    
+    def valid(self) -> bool:
+        """租约是否仍然有效（最近一次成功续约后未超过有效期）"""
+        return self.held and time.monotonic() < self._valid_until
+    
+    def _granted(self, started: float):
+        self.held = True
+        self._valid_until = started + self.ttl
+    
+    def acquire(self) -> bool:
+        """
+        抢占或续约租约（需在应用上下文中调用）
+        
+        租约未过期且由其他进程持有时返回False。
+        """
+        started = time.monotonic()
+        now = datetime.now()
+        expires_at = now + timedelta(seconds=self.ttl)
+        
+        try:
+            result = db.session.execute(
+                update(ServiceLease)
+                .where(ServiceLease.name == self.name)
+                .where(or_(ServiceLease.owner == self.owner, ServiceLease.expires_at < now))
+                .values(owner=self.owner, expires_at=expires_at, updated_at=now)
+            )
+            if result.rowcount == 1:
+                db.session.commit()
+                self._granted(started)
+                return True
+            
+            if db.session.get(ServiceLease, self.name) is not None:
+                db.session.rollback()
+                self.held = False
+                return False
+            
+            # 租约行不存在，尝试创建；并发创建时只有一个进程成功
+            db.session.add(ServiceLease(name=self.name, owner=self.owner,
+                                        expires_at=expires_at, updated_at=now))
+            db.session.commit()
+            self._granted(started)
+            return True
+        except IntegrityError:
+            db.session.rollback()
+            self.held = False
+            return False
+        except Exception:
+            db.session.rollback()
+            self.held = False
+            raise
+    
+    def renew(self) -> bool:
+        """
+        续约已持有的租约（任务执行期间由续约线程调用）
+
+        使用独立连接提交，不影响任务所在会话的事务。租约已被其他进程接管时返回False。
+        """
+        started = time.monotonic()
+        now = datetime.now()
+        with db.engine.begin() as connection:
+            result = connection.execute(
+                update(ServiceLease)
+                .where(ServiceLease.name == self.name)
+                .where(ServiceLease.owner == self.owner)
+                .values(expires_at=now + timedelta(seconds=self.ttl), updated_at=now)
+            )
+        if result.rowcount == 1:
+            self._granted(started)
+            return True
+        self.held = False
+        return False
+    
+    def release(self):
+        """主动释放租约（进程正常退出时调用），其他进程可立即接管"""
+        if not self.held:
+            return
+        try:
+            db.session.execute(
+                update(ServiceLease)
+                .where(ServiceLease.name == self.name)
+                .where(ServiceLease.owner == self.owner)
+                .values(expires_at=datetime.now() - timedelta(seconds=1))
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+        self.held = False
+
+
+class LeasedJob:
+    """
+    周期性后台任务
+
+    每个进程都会启动线程，但只有持有租约的进程执行任务，
+    其余进程仅定期尝试抢占租约，持有者退出后自动接管。
+    due 为可选的检查函数，持有者每次续约时调用，返回True时不等周期到达立即执行。
+    """
+
+    def __init__(self, name: str, func, interval: float, lease_ttl: float = 60.0, due=None):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.due = due
+        self.lease = DatabaseLease(name, lease_ttl)
+        self.app = None
+
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._next_run = 0.0
+        self._stats = {'runs': 0, 'failures': 0, 'last_run_at': None, 'last_error': None}
+
+    def start(self, app):
+        """启动后台线程（进程退出时自动停止，fork 出的子进程会重新启动）"""
+        self.app = app
+        if not event.contains(db.session, 'before_commit', _check_lease_before_commit):
+            event.listen(db.session, 'before_commit', _check_lease_before_commit)
+        self._start_thread()
+        atexit.register(self.stop)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _start_thread(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=f'job-{self.name}', daemon=True)
+        self._thread.start()
+
+    def _after_fork(self):
+        self._stop_event = threading.Event()
+        self.lease.reset_owner()
+        self._next_run = 0.0
+        self._start_thread()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop_event.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+        if self.lease.held:
+            with self.app.app_context():
+                self.lease.release()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                with self.app.app_context():
+                    if self.lease.acquire() and (time.monotonic() >= self._next_run or (self.due and self.due())):
+                        self.run_once()
+            except Exception as e:
+                logger.warning('后台任务 %s 租约检查失败: %s', self.name, e)
+
+            wait = self.lease.ttl / 3
+            if self.lease.held:
+                wait = min(wait, max(0.0, self._next_run - time.monotonic()))
+            self._stop_event.wait(wait)
+
+    def _keep_lease(self, done: threading.Event):
+        """任务执行期间定期续约，租约被接管后停止"""
+        while not done.wait(self.lease.ttl / 3):
+            try:
+                with self.app.app_context():
+                    if not self.lease.renew():
+                        logger.error('后台任务 %s 执行期间租约被其他进程接管', self.name)
+                        return
+            except Exception as e:
+                logger.warning('后台任务 %s 续约失败: %s', self.name, e)
+
+    def run_once(self):
+        """立即执行一次任务（需在应用上下文中调用）"""
+        self._next_run = time.monotonic() + self.interval
+        done = threading.Event()
+        keeper = None
+        if self.lease.held:
+            # 只有持有租约时才续约并检查租约（手动调用时不检查）
+            _job_context.job = self
+            keeper = threading.Thread(target=self._keep_lease, args=(done,),
+                                      name=f'lease-{self.name}', daemon=True)
+            keeper.start()
+        try:
+            self.func()
+            self._stats['runs'] += 1
+            self._stats['last_error'] = None
+        except Exception as e:
+            db.session.rollback()
+            self._stats['failures'] += 1
+            self._stats['last_error'] = str(e)
+            logger.error('后台任务 %s 执行失败: %s', self.name, e)
+        finally:
+            _job_context.job = None
+            done.set()
+            if keeper is not None:
+                keeper.join()
+        self._stats['last_run_at'] = datetime.now()
+
+    def stats(self) -> dict:
+        """获取任务运行状态"""
+        last_run_at = self._stats['last_run_at']
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'leaseHeld': self.lease.held,
+            'intervalSeconds': self.interval,
+            'runs': self._stats['runs'],
+            'failures': self._stats['failures'],
+            'lastRunAt': last_run_at.isoformat() if last_run_at else None,
+            'lastError': self._stats['last_error']
+        }
@@ -0,0 +1,131 @@
+"""
+列表接口总数服务
+
+分页列表每翻一页都对整个过滤范围执行 COUNT(*)，在 InnoDB 上相当于一次全索引扫描。
+这里统一处理列表总数：
+- 精确总数按过滤条件缓存一个较短的有效期，翻页时直接复用；
+- 调用方能廉价估算总数（统计计数器、聚合表、表统计信息）且估算值超过阈值时返回估算值，
+  大范围不再精确计数；
+- 客户端传 include_total=false 时完全跳过计数。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+from sqlalchemy import func, text
+
+from app import db
+
+
+class ListTotals:
+    """列表总数缓存与估算"""
+
+    def __init__(self):
+        self.ttl = 10.0
+        self.max_size = 1024
+        self.exact_threshold = 100000
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'exact': 0, 'estimated': 0, 'skipped': 0}
+
+    def init_app(self, app):
+        self.ttl = app.config.get('LIST_TOTAL_CACHE_TTL', 10.0)
+        self.max_size = app.config.get('LIST_TOTAL_CACHE_SIZE', 1024)
+        self.exact_threshold = app.config.get('LIST_TOTAL_EXACT_THRESHOLD', 100000)
+
+    def _get(self, key: Hashable) -> Optional[Tuple[int, bool]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[2] > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0], entry[1]
+
+    def _put(self, key: Hashable, total: int, exact: bool):
+        with self._lock:
+            self._entries[key] = (total, exact, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def resolve(self, key: Hashable, count: Callable[[], int],
+                estimate: Optional[Callable[[], Optional[int]]] = None,
+                include_total: bool = True) -> Tuple[Optional[int], Optional[bool]]:
+        """
+        获取列表总数
+
+        参数:
+            key: 缓存键，应包含接口名和全部过滤条件（不含分页参数）
+            count: 精确计数函数
+            estimate: 估算函数，无法估算时返回None
+            include_total: 为False时不计数
+
+        返回:
+            (总数, 是否精确)，不计数时均为None
+        """
+        if not include_total:
+            self._stats['skipped'] += 1
+            return None, None
+
+        cached = self._get(key)
+        if cached is not None:
+            self._stats['hits'] += 1
+            return cached
+
+        if estimate is not None:
+            approx = estimate()
+            if approx is not None and approx >= self.exact_threshold:
+                self._put(key, approx, False)
+                self._stats['estimated'] += 1
+                return approx, False
+
+        total = count()
+        self._put(key, total, True)
+        self._stats['exact'] += 1
+        return total, True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        return {
+            'size': len(self._entries),
+            'ttlSeconds': self.ttl,
+            'exactThreshold': self.exact_threshold,
+            'hits': self._stats['hits'],
+            'exact': self._stats['exact'],
+            'estimated': self._stats['estimated'],
+            'skipped': self._stats['skipped']
+        }
+
+
+def estimate_table_rows(model) -> Optional[int]:
+    """
+    按表统计信息估算整表行数
+
+    MySQL 读取 information_schema 中 InnoDB 维护的行数估计；
+    其他数据库用主键跨度（MAX(id) - MIN(id) + 1）近似，只走主键索引两端。
+    """
+    table = model.__tablename__
+    if db.engine.dialect.name == 'mysql':
+        rows = db.session.execute(text(
+            'SELECT TABLE_ROWS FROM information_schema.TABLES '
+            'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table'
+        ), {'table': table}).scalar()
+        if rows is not None:
+            return int(rows)
+
+    low, high = db.session.query(func.min(model.id), func.max(model.id)).one()
+    if low is None:
+        return 0
+    return high - low + 1
+
+
+# 全局总数服务实例
+list_totals = ListTotals()
@@ -0,0 +1,242 @@
+"""
+设备在线状态（心跳）
+
+设备定期批量上报心跳，最近心跳时间记录在进程内的存活表中，心跳本身不写数据库：
+- 设备从离线变为在线时，本批所有上线设备一次提交（状态、审计日志）；
+- 后台清扫任务把超过 DEVICE_HEARTBEAT_TIMEOUT 秒没有心跳的设备批量置为离线。
+
+多进程部署时心跳会落到不同的工作进程，每个进程只看到一部分心跳。
+为了让清扫任务（通过租约只在一个进程中运行）判断准确，devices.last_seen 采用与服务租约相同的续约方式：
+距数据库中的 last_seen 超过续写窗口才写一次，续写语句带 last_seen 条件，
+同一窗口内多个进程收到同一设备的心跳也只有一个进程写入；离线判断以数据库中的 last_seen 为准。
+续写窗口为超时时间减去清扫间隔和设备心跳间隔，保证续写总在清扫判定超时之前完成。
+
+不存在的设备ID在进程内短期缓存，重复上报不再查询数据库。
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, bindparam, or_, update
+
+from app import db
+from app.models.device import Device
+from app.utils.unit_of_work import unit_of_work, audit_log
+
+logger = logging.getLogger(__name__)
+
+
+# 审计日志中最多列出的设备ID数
+LOGGED_DEVICE_IDS = 20
+
+# 不存在的设备ID缓存上限（心跳接口无需认证，防止随机ID占满内存）
+MAX_UNKNOWN_IDS = 10000
+
+
+def _describe(device_ids: List[str]) -> str:
+    shown = ', '.join(device_ids[:LOGGED_DEVICE_IDS])
+    if len(device_ids) > LOGGED_DEVICE_IDS:
+        shown += f' 等{len(device_ids)}台'
+    return shown
+
+
+def _renew(seen_at: Dict[str, datetime]):
+    """写入 last_seen（保持 updated_at 不变，updated_at 只反映设备信息和状态的修改）"""
+    table = Device.__table__
+    db.session.execute(
+        update(table)
+        .where(table.c.id == bindparam('device_id'))
+        .values(last_seen=bindparam('seen_at'), updated_at=table.c.updated_at),
+        [{'device_id': device_id, 'seen_at': value} for device_id, value in seen_at.items()]
+    )
+
+
+class DeviceLiveness:
+    """设备存活表与超时清扫"""
+
+    def __init__(self):
+        self.timeout = 90.0
+        self.sweep_interval = 10.0
+        self.heartbeat_interval = 30.0
+        self.unknown_ttl = 60.0
+        self.max_batch = 5000
+        self.job = None
+        self._last_seen: Dict[str, float] = {}  # 设备ID -> 最近心跳（time.time()）
+        self._persisted: Dict[str, float] = {}  # 设备ID -> 已知的数据库 last_seen
+        self._unknown: OrderedDict = OrderedDict()  # 不存在的设备ID -> 缓存到期时间
+        self._lock = threading.Lock()
+        self._stats = {'heartbeats': 0, 'renewals': 0, 'online': 0, 'offline': 0, 'unknown': 0}
+
+    def init_app(self, app):
+        """读取心跳配置，并按配置启动超时清扫任务"""
+        self.timeout = float(app.config.get('DEVICE_HEARTBEAT_TIMEOUT', 90))
+        self.heartbeat_interval = float(app.config.get('DEVICE_HEARTBEAT_INTERVAL', 30))
+        self.unknown_ttl = float(app.config.get('DEVICE_HEARTBEAT_UNKNOWN_TTL', 60))
+        self.max_batch = app.config.get('DEVICE_HEARTBEAT_MAX_BATCH', 5000)
+        self.sweep_interval = float(app.config.get('DEVICE_LIVENESS_SWEEP_INTERVAL', 10))
+
+        if app.config.get('DEVICE_LIVENESS_SWEEP_ENABLED', True):
+            from app.services.lease import LeasedJob
+            self.job = LeasedJob('device_liveness_sweep', self.sweep, self.sweep_interval)
+            self.job.start(app)
+
+    @property
+    def renew_interval(self) -> float:
+        """last_seen 续写窗口：窗口结束后的下一次心跳写入，须早于清扫任务判定超时"""
+        return max(0.0, self.timeout - self.sweep_interval - self.heartbeat_interval)
+
+    def heartbeat(self, device_ids: Iterable[str], at: Optional[float] = None) -> Dict[str, List[str]]:
+        """
+        记录一批设备的心跳
+
+        只有需要续约 last_seen 的设备才访问数据库（一次查询 + 一次提交），
+        其中处于离线状态的设备同时置为在线。
+
+        返回:
+            {'online': 本次上线的设备ID, 'unknown': 不存在的设备ID}
+        """
+        now = at or time.time()
+        device_ids = list(dict.fromkeys(device_ids))
+        result = {'online': [], 'unknown': []}
+        with self._lock:
+            for device_id in device_ids:
+                expires = self._unknown.get(device_id)
+                if expires is None:
+                    continue
+                if expires > now:
+                    result['unknown'].append(device_id)
+                else:
+                    del self._unknown[device_id]
+            known = [device_id for device_id in device_ids if device_id not in self._unknown]
+            for device_id in known:
+                self._last_seen[device_id] = now
+            due = [
+                device_id for device_id in known
+                if now - self._persisted.get(device_id, 0.0) >= self.renew_interval
+            ]
+        self._stats['heartbeats'] += len(device_ids)
+
+        if not due:
+            return result
+
+        seen_at = datetime.fromtimestamp(now)
+        window_start = seen_at - timedelta(seconds=self.renew_interval)
+        devices = Device.query.filter(Device.id.in_(due)).all()
+        found = {device.id for device in devices}
+        unknown = [device_id for device_id in due if device_id not in found]
+        result['unknown'] += unknown
+
+        # 其他进程已在本窗口内写入的设备不再写入
+        renew = {
+            device.id for device in devices
+            if device.last_seen is None or device.last_seen < window_start or device.status != 'online'
+        }
+        for device in devices:
+            if device.status != 'online':
+                device.status = 'online'
+                result['online'].append(device.id)
+
+        renewed = 0
+        if renew or result['online']:
+            table = Device.__table__
+            with unit_of_work():
+                if renew:
+                    # 带 last_seen 条件：并发收到同一设备心跳的进程只有一个写入
+                    renewed = db.session.execute(
+                        update(table)
+                        .where(table.c.id.in_(renew))
+                        .where(or_(table.c.last_seen.is_(None), table.c.last_seen < window_start,
+                                   table.c.id.in_(result['online'])))
+                        .values(last_seen=seen_at, updated_at=table.c.updated_at)
+                    ).rowcount
+                if result['online']:
+                    audit_log('设备管理', '设备上线', f'心跳恢复，{_describe(result["online"])} 已上线',
+                              operator='system')
+
+        with self._lock:
+            for device in devices:
+                if device.id in renew:
+                    self._persisted[device.id] = now
+                else:
+                    self._persisted[device.id] = device.last_seen.timestamp()
+            # 不存在的设备不保留在存活表中，避免无效ID占用内存
+            for device_id in unknown:
+                self._last_seen.pop(device_id, None)
+                self._unknown[device_id] = now + self.unknown_ttl
+            while len(self._unknown) > MAX_UNKNOWN_IDS:
+                self._unknown.popitem(last=False)
+        self._stats['renewals'] += renewed
+        self._stats['online'] += len(result['online'])
+        self._stats['unknown'] += len(unknown)
+        return result
+
+    def sweep(self, now: Optional[float] = None) -> List[str]:
+        """
+        把超时未上报心跳的在线设备置为离线，返回本次离线的设备ID
+
+        只处理上报过心跳（last_seen 非空）的设备，未接入心跳的设备仍由状态接口维护。
+        """
+        now = now or time.time()
+        cutoff = datetime.fromtimestamp(now - self.timeout)
+        devices = Device.query.filter(and_(
+            Device.status == 'online',
+            Device.last_seen.isnot(None),
+            Device.last_seen < cutoff
+        )).all()
+        if not devices:
+            return []
+
+        offline = []
+        renewed = {}
+        for device in devices:
+            # 心跳刚好发到本进程、尚未续约的设备不置为离线
+            local = self._last_seen.get(device.id)
+            if local is not None and now - local < self.timeout:
+                renewed[device.id] = datetime.fromtimestamp(local)
+                continue
+            device.status = 'offline'
+            offline.append(device.id)
+
+        with unit_of_work():
+            if renewed:
+                _renew(renewed)
+            if offline:
+                audit_log('设备管理', '设备离线',
+                          f'超过{self.timeout:g}秒未收到心跳，{_describe(offline)} 已离线',
+                          level='WARNING', operator='system')
+
+        with self._lock:
+            for device_id in offline:
+                self._last_seen.pop(device_id, None)
+                self._persisted.pop(device_id, None)
+            for device_id in renewed:
+                self._persisted[device_id] = now
+        self._stats['offline'] += len(offline)
+        if offline:
+            logger.info('%d 台设备心跳超时，已置为离线', len(offline))
+        return offline
+
+    def stats(self) -> Dict:
+        now = time.time()
+        seen = list(self._last_seen.values())
+        return {
+            'timeoutSeconds': self.timeout,
+            'renewIntervalSeconds': self.renew_interval,
+            'tracked': len(seen),
+            'cachedUnknown': len(self._unknown),
+            'silent': sum(1 for value in seen if now - value >= self.timeout),
+            'heartbeats': self._stats['heartbeats'],
+            'renewals': self._stats['renewals'],
+            'online': self._stats['online'],
+            'offline': self._stats['offline'],
+            'unknown': self._stats['unknown'],
+            'sweepJob': self.job.stats() if self.job else None
+        }
+
+
+# 全局设备存活表
+device_liveness = DeviceLiveness()
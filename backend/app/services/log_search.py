@@ -0,0 +1,268 @@
+"""
+日志全文检索服务
+
+日志表的文本列（action、details、operator、module）建立全文索引，搜索走索引并按相关度排序：
+- MySQL：旁路表 logs_search 上的 FULLTEXT 索引（ngram 分词，支持中文），
+  由触发器与日志表同步。不直接在 logs 上建 FULLTEXT，是因为分区表不支持全文索引；
+- SQLite：FTS5 外部内容表 logs_fts（trigram 分词），同样由触发器同步。
+
+关键词过短（低于分词长度）或数据库不支持全文索引时回退到 LIKE 查询。
+"""
+
+import logging
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import inspect, or_, text
+
+from app import db
+from app.models.log import Log
+from app.services.list_totals import list_totals, estimate_table_rows
+from app.utils.pagination import keyset_paginate
+
+logger = logging.getLogger(__name__)
+
+
+# 各方言下全文索引可用的最短关键词长度（MySQL ngram_token_size 默认为2，SQLite trigram 为3）
+MIN_KEYWORD_LENGTH = {'mysql': 2, 'sqlite': 3}
+
+SQLITE_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS logs_fts USING fts5(
+        action, details, operator, module,
+        content='logs', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS logs_fts_insert AFTER INSERT ON logs BEGIN
+        INSERT INTO logs_fts(rowid, action, details, operator, module)
+        VALUES (new.id, new.action, new.details, new.operator, new.module);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS logs_fts_delete AFTER DELETE ON logs BEGIN
+        INSERT INTO logs_fts(logs_fts, rowid, action, details, operator, module)
+        VALUES ('delete', old.id, old.action, old.details, old.operator, old.module);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS logs_fts_update AFTER UPDATE ON logs BEGIN
+        INSERT INTO logs_fts(logs_fts, rowid, action, details, operator, module)
+        VALUES ('delete', old.id, old.action, old.details, old.operator, old.module);
+        INSERT INTO logs_fts(rowid, action, details, operator, module)
+        VALUES (new.id, new.action, new.details, new.operator, new.module);
+    END""",
+)
+
+SQLITE_REBUILD = "INSERT INTO logs_fts(logs_fts) VALUES ('rebuild')"
+
+MYSQL_DDL = (
+    """CREATE TABLE IF NOT EXISTS logs_search (
+        log_id INT PRIMARY KEY,
+        content TEXT NOT NULL,
+        FULLTEXT INDEX ft_logs_search_content (content) WITH PARSER ngram
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci""",
+    """CREATE TRIGGER logs_search_insert AFTER INSERT ON logs FOR EACH ROW
+        INSERT INTO logs_search (log_id, content)
+        VALUES (NEW.id, CONCAT_WS(' ', NEW.action, NEW.details, NEW.operator, NEW.module))""",
+    """CREATE TRIGGER logs_search_update AFTER UPDATE ON logs FOR EACH ROW
+        UPDATE logs_search SET content = CONCAT_WS(' ', NEW.action, NEW.details, NEW.operator, NEW.module)
+        WHERE log_id = NEW.id""",
+    """CREATE TRIGGER logs_search_delete AFTER DELETE ON logs FOR EACH ROW
+        DELETE FROM logs_search WHERE log_id = OLD.id""",
+)
+
+MYSQL_REBUILD = """INSERT IGNORE INTO logs_search (log_id, content)
+    SELECT id, CONCAT_WS(' ', action, details, operator, module) FROM logs"""
+
+
+class SearchPage(NamedTuple):
+    """一页搜索结果"""
+    items: List[Tuple[Log, Optional[float]]]  # (日志, 相关度)
+    total: Optional[int]
+    total_exact: Optional[bool]
+    mode: str  # fulltext / like
+    next_cursor: Optional[str]
+
+
+class LogSearchIndex:
+    """日志全文索引"""
+
+    def __init__(self):
+        self._ready = {}
+
+    def _dialect(self) -> str:
+        return db.engine.dialect.name
+
+    def ensure_index(self) -> bool:
+        """
+        按当前数据库创建全文索引及同步触发器（已存在时跳过）
+
+        首次创建时用已有日志回填索引。返回当前数据库是否支持全文检索。
+        """
+        dialect = self._dialect()
+        url = str(db.engine.url)
+        if url in self._ready:
+            return self._ready[url]
+
+        supported = dialect in MIN_KEYWORD_LENGTH
+        if supported:
+            try:
+                tables = inspect(db.engine).get_table_names()
+                if dialect == 'sqlite':
+                    # 日志表被删除重建后触发器随之丢失，索引内容也已失效，需要一并回填
+                    triggers = db.session.execute(text(
+                        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name = 'logs_fts_insert'"
+                    )).first()
+                    stale = 'logs_fts' not in tables or triggers is None
+                    for statement in SQLITE_DDL:
+                        db.session.execute(text(statement))
+                    if stale:
+                        db.session.execute(text(SQLITE_REBUILD))
+                elif 'logs_search' not in tables:
+                    for statement in MYSQL_DDL:
+                        db.session.execute(text(statement))
+                    db.session.execute(text(MYSQL_REBUILD))
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.warning('日志全文索引不可用，回退到 LIKE 查询: %s', e)
+                supported = False
+
+        self._ready[url] = supported
+        return supported
+
+    def rebuild(self):
+        """从日志表重建全文索引"""
+        if not self.ensure_index():
+            return
+        if self._dialect() == 'sqlite':
+            db.session.execute(text(SQLITE_REBUILD))
+        else:
+            db.session.execute(text('DELETE FROM logs_search'))
+            db.session.execute(text(MYSQL_REBUILD))
+        db.session.commit()
+
+    def prune_orphans(self) -> int:
+        """
+        删除日志已不存在的索引行（日志表整分区删除不会触发同步触发器）
+
+        日志ID随时间递增，按最小的现存日志ID做范围删除；个别补录的旧日志留下的索引行
+        不影响检索结果（检索时与日志表关联），仅占用少量空间。
+        """
+        if self._dialect() != 'mysql' or not self.ensure_index():
+            return 0
+        min_id = db.session.query(db.func.min(Log.id)).scalar()
+        if min_id is None:
+            result = db.session.execute(text('DELETE FROM logs_search'))
+        else:
+            result = db.session.execute(text('DELETE FROM logs_search WHERE log_id < :min_id'), {'min_id': min_id})
+        db.session.commit()
+        return result.rowcount
+
+    def can_use_index(self, keyword: str) -> bool:
+        dialect = self._dialect()
+        min_length = MIN_KEYWORD_LENGTH.get(dialect)
+        if min_length is None or len(keyword) < min_length:
+            return False
+        return self.ensure_index()
+
+    def _fulltext_query(self, keyword: str, scored: bool = True):
+        """
+        返回命中日志的子查询（log_id, score），score 越大越相关
+
+        不需要相关度时不计算得分，bm25 / MATCH 评分要遍历所有命中行，是检索的主要开销。
+        """
+        if self._dialect() == 'sqlite':
+            # 关键词整体作为短语匹配；bm25 越小越相关，取负数统一为越大越相关
+            phrase = '"' + keyword.replace('"', '""') + '"'
+            score = '-bm25(logs_fts)' if scored else 'NULL'
+            source = text(
+                f'SELECT rowid AS log_id, {score} AS score FROM logs_fts WHERE logs_fts MATCH :phrase'
+            )
+        else:
+            phrase = '"' + keyword.replace('"', ' ') + '"'
+            score = 'MATCH(content) AGAINST (:phrase IN BOOLEAN MODE)' if scored else 'NULL'
+            source = text(
+                f'SELECT log_id, {score} AS score '
+                'FROM logs_search WHERE MATCH(content) AGAINST (:phrase IN BOOLEAN MODE)'
+            )
+        return source.bindparams(phrase=phrase).columns(log_id=db.Integer, score=db.Float).subquery('matches')
+
+    def search(self, keyword: str, start_dt=None, end_dt=None, page: int = 1, per_page: int = 50,
+               sort: str = 'relevance', force_like: bool = False,
+               cursor: Optional[str] = None, include_total: bool = True) -> SearchPage:
+        """
+        搜索日志
+
+        参数:
+            sort: relevance 按相关度排序（仅全文检索时有效），time 按时间倒序
+            force_like: 强制使用 LIKE 查询（用于性能对比）
+            cursor: 上一页返回的游标，传入时忽略 page
+            include_total: 为False时不统计总数
+        """
+        keyword = (keyword or '').strip()
+        use_index = bool(keyword) and not force_like and self.can_use_index(keyword)
+        mode = 'fulltext' if use_index else 'like'
+
+        def apply_time_range(query):
+            if start_dt:
+                query = query.filter(Log.timestamp >= start_dt)
+            if end_dt:
+                query = query.filter(Log.timestamp <= end_dt)
+            return query
+
+        if not use_index:
+            query = db.session.query(Log, db.literal(None).label('score'))
+            if keyword:
+                search_pattern = f'%{keyword}%'
+                query = query.filter(
+                    or_(
+                        Log.action.like(search_pattern),
+                        Log.details.like(search_pattern),
+                        Log.operator.like(search_pattern),
+                        Log.module.like(search_pattern)
+                    )
+                )
+            query = apply_time_range(query)
+            count_query = query
+            columns = (Log.timestamp, Log.id)
+            sort = 'time'
+        else:
+            # 没有时间条件时直接在索引上计数，不必回表
+            ids = self._fulltext_query(keyword, scored=False)
+            if start_dt or end_dt:
+                count_query = apply_time_range(db.session.query(Log.id).join(ids, Log.id == ids.c.log_id))
+            else:
+                count_query = db.session.query(ids.c.log_id)
+
+            matches = self._fulltext_query(keyword, scored=(sort == 'relevance'))
+            query = apply_time_range(
+                db.session.query(Log, matches.c.score).join(matches, Log.id == matches.c.log_id)
+            )
+            if sort == 'relevance':
+                columns = (matches.c.score, Log.timestamp, Log.id)
+            else:
+                columns = (Log.timestamp, Log.id)
+
+        # 没有任何条件时等同于日志列表，可按表统计信息估算
+        estimate = None
+        if not keyword and not start_dt and not end_dt:
+            estimate = lambda: estimate_table_rows(Log)
+        total, total_exact = list_totals.resolve(
+            ('logs.search', mode, keyword, start_dt, end_dt), count_query.count, estimate, include_total
+        )
+
+        rows, next_cursor = self._paginate(query, columns, sort, page, per_page, cursor)
+        return SearchPage(rows, total, total_exact, mode, next_cursor)
+
+    @staticmethod
+    def _paginate(query, columns, sort, page, per_page, cursor):
+        def sort_key(row):
+            log, score = row
+            return (score, log.timestamp, log.id) if len(columns) == 3 else (log.timestamp, log.id)
+
+        rows, next_cursor = keyset_paginate(
+            query, columns, per_page, cursor, offset=(max(page, 1) - 1) * per_page,
+            sort=sort, key=sort_key
+        )
+        return [(row[0], row[1]) for row in rows], next_cursor
+
+    def stats(self) -> Dict:
+        return {'dialect': self._dialect(), 'indexed': self._ready.get(str(db.engine.url))}
+
+
+# 全局日志检索实例
+log_search = LogSearchIndex()
@@ -0,0 +1,373 @@
+"""
+时间分区与数据保留
+
+environment_data 和 logs 在 MySQL 上按 timestamp 做 RANGE 分区（默认每月一个分区），
+带时间条件的查询只扫描相关分区；过期数据按整分区 DROP，不再逐行 DELETE。
+后台任务定期预建未来的分区并删除超过保留期的分区，多进程部署时通过租约只由一个进程执行。
+
+不支持分区的数据库（SQLite 测试 / 边缘部署）按主键分批删除过期数据。
+
+environment_data 删除后，分钟/小时/日聚合表中同一时间范围的数据一并删除，
+统计接口（读聚合表）与历史、导出接口（读原始表）覆盖的时间范围保持一致。
+保留截止时间向下取整到日边界，聚合表按整桶删除不会与原始数据错位。
+"""
+
+import logging
+import re
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, select, text
+
+from app import db
+from app.models.environment import EnvironmentData
+from app.services.environment_rollup import TIERS
+from app.models.log import Log
+from app.services.lease import ensure_lease_held
+
+logger = logging.getLogger(__name__)
+
+
+# 参与分区和数据保留的表
+PARTITIONED_TABLES = {
+    'environment_data': EnvironmentData,
+    'logs': Log,
+}
+
+# 首个分区保存最早边界之前的全部数据，末尾分区接收尚未预建分区的数据
+FIRST_PARTITION = 'p_start'
+LAST_PARTITION = 'pmax'
+
+PURGE_BATCH_SIZE = 5000
+
+_PARTITION_NAME = re.compile(r'^p(\d{4})(\d{2})(\d{2})?$')
+
+
+class PartitionManager:
+    """分区维护与数据保留"""
+
+    def __init__(self):
+        self.granularity = 'month'
+        self.precreate = 3
+        self.retention: Dict[str, Optional[int]] = {}
+        self.job = None
+        self._stats = {'created': 0, 'dropped': 0, 'purged_rows': 0, 'purged_rollups': 0}
+
+    def init_app(self, app):
+        """读取分区配置，并按配置启动定期维护任务"""
+        self.granularity = app.config.get('PARTITION_GRANULARITY', 'month')
+        if self.granularity not in ('month', 'day'):
+            raise ValueError('PARTITION_GRANULARITY 只能是 month 或 day')
+        self.precreate = app.config.get('PARTITION_PRECREATE', 3)
+        self.retention = dict(app.config.get('DATA_RETENTION_DAYS', {}))
+
+        if app.config.get('PARTITION_MAINTENANCE_ENABLED', True):
+            from app.services.lease import LeasedJob
+            self.job = LeasedJob(
+                'partition_maintenance',
+                self.maintain,
+                app.config.get('PARTITION_MAINTENANCE_INTERVAL', 6 * 3600)
+            )
+            self.job.start(app)
+
+    # ------------------------------------------------------------------
+    # 分区边界
+    # ------------------------------------------------------------------
+
+    def period_start(self, dt: datetime) -> datetime:
+        if self.granularity == 'day':
+            return datetime(dt.year, dt.month, dt.day)
+        return datetime(dt.year, dt.month, 1)
+
+    def next_period(self, start: datetime) -> datetime:
+        if self.granularity == 'day':
+            return start + timedelta(days=1)
+        if start.month == 12:
+            return datetime(start.year + 1, 1, 1)
+        return datetime(start.year, start.month + 1, 1)
+
+    def partition_name(self, start: datetime) -> str:
+        if self.granularity == 'day':
+            return start.strftime('p%Y%m%d')
+        return start.strftime('p%Y%m')
+
+    @staticmethod
+    def partition_lower_bound(name: str) -> Optional[datetime]:
+        """由分区名推算分区下界（含），首个分区和末尾分区返回None"""
+        match = _PARTITION_NAME.match(name)
+        if not match:
+            return None
+        year, month, day = match.group(1), match.group(2), match.group(3)
+        return datetime(int(year), int(month), int(day or 1))
+
+    @classmethod
+    def partition_upper_bound(cls, name: str) -> Optional[datetime]:
+        """
+        由分区名推算分区上界（不含），末尾分区返回None
+
+        分区名记录分区所在周期的起点（p202610 / p20261018），与创建时的粒度配置无关。
+        """
+        start = cls.partition_lower_bound(name)
+        if start is None:
+            return None
+        if _PARTITION_NAME.match(name).group(3):
+            return start + timedelta(days=1)
+        if start.month == 12:
+            return datetime(start.year + 1, 1, 1)
+        return datetime(start.year, start.month + 1, 1)
+
+    def _partition_clause(self, name: str, upper: Optional[datetime]) -> str:
+        if upper is None:
+            return f'PARTITION {name} VALUES LESS THAN MAXVALUE'
+        return f"PARTITION {name} VALUES LESS THAN (TO_DAYS('{upper:%Y-%m-%d}'))"
+
+    def _planned_partitions(self, since: datetime, now: datetime) -> List[Tuple[str, datetime]]:
+        """从 since 所在周期到当前周期之后 precreate 个周期的分区列表"""
+        partitions = []
+        start = self.period_start(since)
+        last = self.period_start(now)
+        for _ in range(self.precreate):
+            last = self.next_period(last)
+        while start <= last:
+            partitions.append((self.partition_name(start), self.next_period(start)))
+            start = self.next_period(start)
+        return partitions
+
+    # ------------------------------------------------------------------
+    # MySQL 分区操作
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def supported() -> bool:
+        return db.engine.dialect.name == 'mysql'
+
+    def list_partitions(self, table: str) -> List[str]:
+        """按分区顺序返回分区名，未分区时返回空列表"""
+        rows = db.session.execute(text(
+            'SELECT PARTITION_NAME FROM information_schema.PARTITIONS '
+            'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL '
+            'ORDER BY PARTITION_ORDINAL_POSITION'
+        ), {'table': table}).all()
+        return [row[0] for row in rows]
+
+    def partition_table(self, table: str, now: Optional[datetime] = None) -> bool:
+        """
+        将未分区的表转换为按 timestamp 分区（仅在初始化或维护窗口中执行）
+
+        分区键必须包含在主键中，主键改为 (id, timestamp)。转换需要重建整张表，
+        数据量大时耗时较长，因此不由后台任务自动执行。返回是否执行了转换。
+        """
+        if not self.supported() or self.list_partitions(table):
+            return False
+
+        now = now or datetime.now()
+        model = PARTITIONED_TABLES[table]
+        earliest = db.session.query(db.func.min(model.timestamp)).scalar() or now
+        planned = self._planned_partitions(earliest, now)
+
+        clauses = [self._partition_clause(FIRST_PARTITION, self.period_start(earliest))]
+        clauses += [self._partition_clause(name, upper) for name, upper in planned]
+        clauses.append(self._partition_clause(LAST_PARTITION, None))
+
+        db.session.execute(text(
+            f'ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY (id, timestamp) '
+            f'PARTITION BY RANGE (TO_DAYS(timestamp)) ({", ".join(clauses)})'
+        ))
+        db.session.commit()
+        self._stats['created'] += len(planned)
+        logger.info('表 %s 已转换为分区表，共 %d 个分区', table, len(clauses))
+        return True
+
+    def ensure_future_partitions(self, table: str, now: Optional[datetime] = None) -> int:
+        """
+        从末尾分区中拆分出未来的分区，保证当前周期之后至少有 precreate 个分区
+
+        末尾分区正常情况下为空，拆分只修改元数据。返回新建的分区数。
+        """
+        partitions = self.list_partitions(table)
+        if not partitions or partitions[-1] != LAST_PARTITION:
+            return 0
+
+        now = now or datetime.now()
+        bounds = [self.partition_upper_bound(name) for name in partitions[:-1]]
+        bounds = [bound for bound in bounds if bound is not None]
+        last_bound = max(bounds) if bounds else None
+
+        # 与已有边界之间的空档并入第一个新分区
+        since = now if last_bound is None else max(last_bound, self.period_start(now))
+        planned = [
+            (name, upper) for name, upper in self._planned_partitions(since, now)
+            if last_bound is None or upper > last_bound
+        ]
+        if not planned:
+            return 0
+
+        clauses = [self._partition_clause(name, upper) for name, upper in planned]
+        clauses.append(self._partition_clause(LAST_PARTITION, None))
+        # DDL 隐式提交，不经过提交前的租约检查
+        ensure_lease_held()
+        db.session.execute(text(
+            f'ALTER TABLE {table} REORGANIZE PARTITION {LAST_PARTITION} INTO ({", ".join(clauses)})'
+        ))
+        db.session.commit()
+        self._stats['created'] += len(planned)
+        logger.info('表 %s 新建分区: %s', table, ', '.join(name for name, _ in planned))
+        return len(planned)
+
+    def expired_partitions(self, partitions: List[str], cutoff: datetime) -> Tuple[List[str], Optional[datetime]]:
+        """
+        上界不晚于 cutoff 的分区（分区内全部数据都已过期）
+
+        返回:
+            (过期分区名, 删除后剩余数据的起始时间)，没有过期分区时起始时间为None
+        """
+        named = [name for name in partitions if name not in (FIRST_PARTITION, LAST_PARTITION)]
+        expired = []
+        boundary = None
+
+        # 首个分区的上界即第一个命名分区的下界，单独判断，不受后续分区是否过期影响
+        if partitions and partitions[0] == FIRST_PARTITION and named:
+            lower = self.partition_lower_bound(named[0])
+            if lower is not None and lower <= cutoff:
+                expired.append(FIRST_PARTITION)
+                boundary = lower
+
+        for name in named:
+            upper = self.partition_upper_bound(name)
+            if upper is None or upper > cutoff:
+                break
+            expired.append(name)
+            boundary = upper
+        return expired, boundary
+
+    def drop_partitions(self, table: str, names: List[str]) -> List[str]:
+        """删除指定分区，返回删除的分区名"""
+        if not names:
+            return []
+        ensure_lease_held()
+        db.session.execute(text(f'ALTER TABLE {table} DROP PARTITION {", ".join(names)}'))
+        db.session.commit()
+        self._stats['dropped'] += len(names)
+        logger.info('表 %s 删除过期分区: %s', table, ', '.join(names))
+        return names
+
+    def drop_expired_partitions(self, table: str, cutoff: datetime) -> List[str]:
+        """删除上界不晚于 cutoff 的分区，返回删除的分区名"""
+        expired, _ = self.expired_partitions(self.list_partitions(table), cutoff)
+        return self.drop_partitions(table, expired)
+
+    # ------------------------------------------------------------------
+    # 不支持分区时的数据保留
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _delete_before(model, column, cutoff: datetime, batch_size: int) -> int:
+        """按主键分批删除 column 早于 cutoff 的数据，每批单独提交，避免长事务"""
+        removed = 0
+        while True:
+            ids = db.session.execute(
+                select(model.id).where(column < cutoff).limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+            db.session.execute(delete(model).where(model.id.in_(ids)))
+            db.session.commit()
+            removed += len(ids)
+            if len(ids) < batch_size:
+                break
+        return removed
+
+    def purge_rows(self, model, cutoff: datetime, batch_size: int = PURGE_BATCH_SIZE) -> int:
+        """按主键分批删除 cutoff 之前的数据"""
+        removed = self._delete_before(model, model.timestamp, cutoff, batch_size)
+        self._stats['purged_rows'] += removed
+        return removed
+
+    def purge_rollups(self, boundary: datetime, batch_size: int = PURGE_BATCH_SIZE) -> int:
+        """删除 boundary 之前的各级聚合数据（boundary 为日边界，聚合桶整桶删除）"""
+        removed = 0
+        for model, _ in TIERS.values():
+            removed += self._delete_before(model, model.bucket_start, boundary, batch_size)
+        self._stats['purged_rollups'] += removed
+        return removed
+
+    # ------------------------------------------------------------------
+    # 定期维护
+    # ------------------------------------------------------------------
+
+    def maintain(self, now: Optional[datetime] = None) -> Dict[str, Dict]:
+        """预建未来分区并清理过期数据，返回各表的处理结果"""
+        from app.services.list_totals import list_totals
+        from app.services.log_search import log_search
+        from app.services.stat_counters import stat_counters
+
+        now = now or datetime.now()
+        partitioned = self.supported()
+        result = {}
+        for table, model in PARTITIONED_TABLES.items():
+            summary = {'created': 0, 'dropped': [], 'purged': 0, 'rollups': 0}
+            days = self.retention.get(table)
+            cutoff = (now - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0) if days else None
+            boundary = None
+
+            if partitioned and self.list_partitions(table):
+                summary['created'] = self.ensure_future_partitions(table, now)
+                if cutoff is not None:
+                    expired, boundary = self.expired_partitions(self.list_partitions(table), cutoff)
+                    summary['dropped'] = self.drop_partitions(table, expired)
+                    if boundary is None:
+                        # 本轮没有过期分区时仍按剩余数据的起点清理，补上此前中断的聚合清理
+                        first = self.list_partitions(table)[0]
+                        boundary = self.partition_lower_bound(first)
+            elif cutoff is not None:
+                if partitioned:
+                    logger.warning('表 %s 尚未分区，过期数据改为分批删除', table)
+                summary['purged'] = self.purge_rows(model, cutoff)
+                boundary = cutoff
+
+            if model is EnvironmentData and boundary is not None:
+                summary['rollups'] = self.purge_rollups(boundary)
+            result[table] = summary
+
+        # 整分区删除不经过 ORM 和触发器，需要同步依赖这些数据的计数器和索引
+        env = result['environment_data']
+        if env['dropped'] or env['purged']:
+            stat_counters.reconcile({'monitoring'})
+        if result['logs']['dropped']:
+            log_search.prune_orphans()
+        if any(summary['dropped'] or summary['purged'] or summary['rollups'] for summary in result.values()):
+            list_totals.clear()
+        return result
+
+    def setup(self, now: Optional[datetime] = None):
+        """初始化时调用：转换未分区的表并预建分区"""
+        if not self.supported():
+            return
+        for table in PARTITIONED_TABLES:
+            if not self.partition_table(table, now):
+                self.ensure_future_partitions(table, now)
+
+    def stats(self) -> Dict:
+        """获取分区与保留状态"""
+        tables = {}
+        for table in PARTITIONED_TABLES:
+            partitions = self.list_partitions(table) if self.supported() else []
+            tables[table] = {
+                'retentionDays': self.retention.get(table),
+                'partitions': partitions
+            }
+        return {
+            'partitioned': self.supported(),
+            'granularity': self.granularity,
+            'precreate': self.precreate,
+            'tables': tables,
+            'created': self._stats['created'],
+            'dropped': self._stats['dropped'],
+            'purgedRows': self._stats['purged_rows'],
+            'purgedRollups': self._stats['purged_rollups'],
+            'maintenanceJob': self.job.stats() if self.job else None
+        }
+
+
+# 全局分区管理实例
+partition_manager = PartitionManager()
@@ -0,0 +1,320 @@
+"""
+统计计数器服务
+
+总览统计所需的各项总数（设备按状态、投喂次数、告警按处理状态、监测样本数）
+保存在 stat_counters 表中，由写入方在同一事务中增量维护：
+- ORM 写入通过会话 after_flush 事件自动计算增量；
+- Core 批量写入（环境数据批量入库、设备批量上传投喂记录）显式调用 increment。
+
+数据库级联删除、手工修改数据等无法感知的变更由定期校准任务修正；
+计数器行缺失（首次部署、新出现的设备状态）时校准任务提前执行，读取接口不做全表计数。
+
+每次上报都会累加的计数器（监测样本数、投喂记录数）拆分为多行，
+每个数据库连接固定累加其中随机分配的一行，并发写入不再争用同一行的行锁，读取时按名称求和。
+"""
+
+import logging
+import random
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable
+
+from sqlalchemy import event, func, inspect, update
+
+from app import db
+from app.models.alert import Alert
+from app.models.device import Device
+from app.models.environment import EnvironmentData
+from app.models.feeding import FeedingHistory
+from app.models.stat_counter import StatCounter
+
+logger = logging.getLogger(__name__)
+
+
+# 计数器分组：名称前缀 -> 分组名，校准按分组进行
+COUNTER_GROUPS = {
+    'devices.': 'devices',
+    'feedings.': 'feedings',
+    'alerts.': 'alerts',
+    'monitoring.': 'monitoring'
+}
+
+# 总览统计依赖的固定计数器（设备状态计数器按实际状态动态生成）
+REQUIRED_COUNTERS = ('feedings.total', 'alerts.resolved', 'alerts.unresolved', 'monitoring.total')
+
+# 按分片存储的计数器：第0个分片沿用计数器名称，其余分片名为 <名称>#<序号>
+SHARDED_COUNTERS = ('feedings.total', 'monitoring.total')
+SHARD_SEPARATOR = '#'
+
+
+def device_counter(status) -> str:
+    return f'devices.status.{status}'
+
+
+def alert_counter(resolved) -> str:
+    return 'alerts.resolved' if resolved else 'alerts.unresolved'
+
+
+def shard_name(name: str, shard: int) -> str:
+    return name if shard == 0 else f'{name}{SHARD_SEPARATOR}{shard}'
+
+
+def base_name(row_name: str) -> str:
+    """计数器行名对应的计数器名称"""
+    return row_name.split(SHARD_SEPARATOR, 1)[0]
+
+
+def counter_group(name: str) -> str:
+    for prefix, group in COUNTER_GROUPS.items():
+        if name.startswith(prefix):
+            return group
+    raise ValueError(f'未知计数器: {name}')
+
+
+def _attribute_change(obj, attr: str):
+    """返回属性在本次 flush 中的 (旧值, 新值)，未修改时返回None"""
+    history = inspect(obj).attrs[attr].history
+    if not history.has_changes():
+        return None
+    old = history.deleted[0] if history.deleted else None
+    new = history.added[0] if history.added else None
+    return old, new
+
+
+def _committed_value(obj, attr: str):
+    """已删除对象的原值（删除前若有未提交修改，取修改前的值）"""
+    history = inspect(obj).attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(obj, attr)
+
+
+def collect_deltas(session) -> Dict[str, int]:
+    """根据会话中待写入的变更计算计数器增量"""
+    deltas = defaultdict(int)
+
+    for obj in session.new:
+        if isinstance(obj, Device):
+            deltas[device_counter(obj.status)] += 1
+        elif isinstance(obj, FeedingHistory):
+            deltas['feedings.total'] += 1
+        elif isinstance(obj, Alert):
+            deltas[alert_counter(obj.resolved)] += 1
+        elif isinstance(obj, EnvironmentData):
+            deltas['monitoring.total'] += 1
+
+    for obj in session.deleted:
+        if isinstance(obj, Device):
+            deltas[device_counter(_committed_value(obj, 'status'))] -= 1
+        elif isinstance(obj, FeedingHistory):
+            deltas['feedings.total'] -= 1
+        elif isinstance(obj, Alert):
+            deltas[alert_counter(_committed_value(obj, 'resolved'))] -= 1
+        elif isinstance(obj, EnvironmentData):
+            deltas['monitoring.total'] -= 1
+
+    for obj in session.dirty:
+        if isinstance(obj, Device):
+            change = _attribute_change(obj, 'status')
+            if change and change[0] != change[1]:
+                deltas[device_counter(change[0])] -= 1
+                deltas[device_counter(change[1])] += 1
+        elif isinstance(obj, Alert):
+            change = _attribute_change(obj, 'resolved')
+            if change and bool(change[0]) != bool(change[1]):
+                deltas[alert_counter(change[0])] -= 1
+                deltas[alert_counter(change[1])] += 1
+
+    return {name: delta for name, delta in deltas.items() if delta}
+
+
+class StatCounterService:
+    """统计计数器服务"""
+
+    def __init__(self):
+        self.job = None
+        self.shards = 1
+        # 增量更新时发现计数器行不存在的分组，由校准任务尽快补建
+        self._pending_groups = set()
+
+    def init_app(self, app):
+        """注册会话事件，并按配置启动定期校准任务"""
+        self.shards = max(1, app.config.get('STAT_COUNTER_SHARDS', 16))
+        if not event.contains(db.session, 'after_flush', self._after_flush):
+            event.listen(db.session, 'after_flush', self._after_flush)
+
+        if app.config.get('STAT_COUNTER_RECONCILE_ENABLED', True):
+            from app.services.lease import LeasedJob
+            self.job = LeasedJob(
+                'stat_counters_reconcile',
+                self.reconcile,
+                app.config.get('STAT_COUNTER_RECONCILE_INTERVAL', 3600),
+                due=self.needs_reconcile
+            )
+            self.job.start(app)
+
+    def _after_flush(self, session, flush_context):
+        deltas = collect_deltas(session)
+        if deltas:
+            self.increment(deltas, connection=session.connection())
+
+    def shard_count(self, name: str) -> int:
+        return self.shards if name in SHARDED_COUNTERS else 1
+
+    def increment(self, deltas: Dict[str, int], connection=None):
+        """
+        在当前事务中累加计数器
+
+        Core 批量写入的调用方需在提交前调用；分片计数器累加到连接对应的分片（各连接随机分配）。
+        计数器行尚不存在时跳过，并标记该分组待校准（避免在未初始化的计数器上累加出错误的基数）。
+        """
+        connection = connection or db.session.connection()
+        # 同一连接固定使用一个分片：一个事务内多次累加不会锁住同一计数器的多个分片而互相死锁
+        shard = connection.info.setdefault('stat_counter_shard', random.randrange(1 << 16))
+        now = datetime.now()
+        for name, delta in deltas.items():
+            if not delta:
+                continue
+            row_name = shard_name(name, shard % self.shard_count(name))
+            result = connection.execute(
+                update(StatCounter)
+                .where(StatCounter.name == row_name)
+                .values(value=StatCounter.value + delta, updated_at=now)
+            )
+            if result.rowcount == 0:
+                self._pending_groups.add(counter_group(name))
+
+    def _count_groups(self, groups: Iterable[str]) -> Dict[str, int]:
+        """按分组统计实际行数"""
+        counts = {}
+        groups = set(groups)
+        if 'devices' in groups:
+            for status, count in db.session.query(Device.status, func.count(Device.id)).group_by(Device.status):
+                counts[device_counter(status)] = count
+        if 'feedings' in groups:
+            counts['feedings.total'] = db.session.query(func.count(FeedingHistory.id)).scalar()
+        if 'alerts' in groups:
+            counts['alerts.resolved'] = 0
+            counts['alerts.unresolved'] = 0
+            for resolved, count in db.session.query(Alert.resolved, func.count(Alert.id)).group_by(Alert.resolved):
+                counts[alert_counter(resolved)] = count
+        if 'monitoring' in groups:
+            counts['monitoring.total'] = db.session.query(func.count(EnvironmentData.id)).scalar()
+        return counts
+
+    def _seed(self, names: Iterable[str]):
+        """补建计数器行（初始值0），只忽略其他进程同时补建造成的主键冲突"""
+        rows = [{'name': name, 'value': 0, 'updated_at': datetime.now()} for name in names]
+        if not rows:
+            return
+        table = StatCounter.__table__
+        dialect = db.session.get_bind().dialect.name
+        if dialect == 'mysql':
+            from sqlalchemy.dialects.mysql import insert as mysql_insert
+            statement = mysql_insert(table).on_duplicate_key_update(name=table.c.name)
+        else:
+            if dialect == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            statement = dialect_insert(table).on_conflict_do_nothing(index_elements=['name'])
+        db.session.execute(statement, rows)
+
+    def _adjust(self, row_name: str, delta: int, now: datetime):
+        db.session.execute(
+            update(StatCounter)
+            .where(StatCounter.name == row_name)
+            .values(value=StatCounter.value + delta, updated_at=now)
+        )
+
+    def reconcile(self, groups: Iterable[str] = None) -> Dict[str, int]:
+        """
+        按实际行数校准计数器并提交，返回各计数器的修正量
+
+        修正量以相对更新（value = value + 修正量）写回，统计期间其他事务提交的累加不会被覆盖；
+        MySQL 可重复读隔离级别下计数与读取计数器使用同一快照，修正量是准确的。
+        """
+        groups = set(groups or COUNTER_GROUPS.values())
+        actual = self._count_groups(groups)
+        existing = defaultdict(dict)
+        for row_name, value in db.session.query(StatCounter.name, StatCounter.value):
+            if counter_group(row_name) in groups:
+                existing[base_name(row_name)][row_name] = value
+
+        drift = {}
+        missing = []
+        corrections = []  # (计数器行, 修正量)
+        for name, value in actual.items():
+            rows = existing.pop(name, {})
+            # 缺少的分片补建，差额计入第0个分片
+            missing += [
+                shard_name(name, shard) for shard in range(self.shard_count(name))
+                if shard_name(name, shard) not in rows
+            ]
+            diff = value - sum(rows.values())
+            if diff:
+                corrections.append((name, diff))
+                if rows:
+                    drift[name] = diff
+        # 已不存在的设备状态等，计数归零
+        for name, rows in existing.items():
+            total = sum(rows.values())
+            if total != 0:
+                drift[name] = -total
+            corrections += [(row_name, -value) for row_name, value in rows.items() if value]
+
+        now = datetime.now()
+        self._seed(missing)
+        for row_name, delta in corrections:
+            self._adjust(row_name, delta, now)
+        db.session.commit()
+        self._pending_groups -= groups
+
+        if drift:
+            logger.info('统计计数器已校准: %s', drift)
+        return drift
+
+    def needs_reconcile(self) -> bool:
+        """是否有计数器行缺失，需要在下一个周期之前校准（校准任务每轮检查）"""
+        if self._pending_groups:
+            return True
+        present = {row_name for row_name, in db.session.query(StatCounter.name)}
+        statuses = [status for status, in db.session.query(Device.status).distinct()]
+        expected = [device_counter(status) for status in statuses] + [
+            shard_name(name, shard) for name in REQUIRED_COUNTERS for shard in range(self.shard_count(name))
+        ]
+        return any(name not in present for name in expected)
+
+    def snapshot(self) -> Dict[str, int]:
+        """
+        读取全部计数器（分片计数器求和），缺失的计数器不在结果中
+
+        不在读取时做全表计数：计数器行缺失时由校准任务补建，
+        未启用校准任务（测试、单进程调试）时才在读取时校准。
+        """
+        counters = self._read()
+        if self.job is None:
+            missing = {counter_group(name) for name in REQUIRED_COUNTERS if name not in counters}
+            pending = missing | self._pending_groups
+            if pending:
+                self.reconcile(pending)
+                counters = self._read()
+        return counters
+
+    @staticmethod
+    def _read() -> Dict[str, int]:
+        counters = defaultdict(int)
+        for row_name, value in db.session.query(StatCounter.name, StatCounter.value):
+            counters[base_name(row_name)] += value
+        return dict(counters)
+
+    def stats(self) -> Dict:
+        return {
+            'shards': self.shards,
+            'pendingGroups': sorted(self._pending_groups),
+            'reconcileJob': self.job.stats() if self.job else None
+        }
+
+
+# 全局计数器服务实例
+stat_counters = StatCounterService()
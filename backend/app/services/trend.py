@@ -0,0 +1,61 @@
+"""
+累计趋势计算
+
+趋势图的每个点是“截至该时间点的累计数量”。只需按时间排序取出一次创建时间，
+再对每个时间桶边界二分查找，即可在一次查询内得到任意周期、任意桶宽的趋势。
+"""
+
+import re
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence, Tuple
+
+
+# 预定义周期：(桶数, 桶宽, 标签格式)
+PERIODS = {
+    '7d': (7, timedelta(days=1), '%m-%d'),
+    '30d': (6, timedelta(days=5), '%m-%d'),
+    '3m': (6, timedelta(days=15), '%m-%d'),
+    '1y': (12, timedelta(days=30), '%Y-%m')
+}
+
+# 自定义桶数上限
+MAX_BUCKETS = 366
+
+_WIDTH_PATTERN = re.compile(r'^(\d+)([mhdw])$')
+_WIDTH_UNITS = {'m': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks'}
+
+
+def parse_bucket_width(value: str) -> Optional[timedelta]:
+    """解析桶宽，如 30m、6h、2d、1w，格式无效时返回None"""
+    match = _WIDTH_PATTERN.match((value or '').strip().lower())
+    if not match or int(match.group(1)) <= 0:
+        return None
+    return timedelta(**{_WIDTH_UNITS[match.group(2)]: int(match.group(1))})
+
+
+def label_format(width: timedelta) -> str:
+    """根据桶宽选择标签格式"""
+    if width >= timedelta(days=28):
+        return '%Y-%m'
+    if width >= timedelta(days=1):
+        return '%m-%d'
+    return '%m-%d %H:%M'
+
+
+def bucket_boundaries(end: datetime, count: int, width: timedelta) -> List[datetime]:
+    """从 end 往前每隔 width 取一个时间点，共 count 个，按时间升序"""
+    return [end - width * (count - 1 - i) for i in range(count)]
+
+
+def cumulative_counts(sorted_times: Sequence[datetime], boundaries: Sequence[datetime]) -> List[int]:
+    """统计每个边界时间点之前（含）的记录数，sorted_times 必须已升序排列"""
+    return [bisect_right(sorted_times, boundary) for boundary in boundaries]
+
+
+def cumulative_trend(sorted_times: Sequence[datetime], end: datetime, count: int,
+                     width: timedelta, fmt: Optional[str] = None) -> Tuple[List[str], List[int]]:
+    """生成累计趋势的 (标签列表, 计数列表)"""
+    boundaries = bucket_boundaries(end, count, width)
+    fmt = fmt or label_format(width)
+    return [b.strftime(fmt) for b in boundaries], cumulative_counts(sorted_times, boundaries)
@@ -0,0 +1,39 @@
+"""
+条件请求（ETag / If-None-Match）
+
+读多写少的接口用响应内容的摘要生成强 ETag，摘要随缓存内容计算一次。
+客户端带上一次的 ETag 轮询时，内容未变化直接返回 304，不序列化响应数据。
+按内容而不是修改次数生成，配置行删除后重建、从备份恢复时也不会误判为未变化。
+"""
+
+import hashlib
+import json
+from typing import Any, Callable
+
+from flask import Response, request
+
+
+def content_digest(data: Any) -> str:
+    """内容摘要（键排序后的 JSON 的 SHA-1 前16位）"""
+    encoded = json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha1(encoded.encode('utf-8')).hexdigest()[:16]
+
+
+def make_etag(*parts) -> str:
+    """由资源标识和内容摘要生成 ETag（不含引号），如 device-config:feeder-001:3f2a9c0d1e4b5a67"""
+    return ':'.join(str(part) for part in parts)
+
+
+def conditional_response(etag: str, build: Callable[[], Response]) -> Response:
+    """
+    按 If-None-Match 返回 304 或调用 build 生成完整响应
+
+    响应都带上 ETag 和 Cache-Control: no-cache（客户端可以缓存，但每次使用前须重新验证）。
+    """
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = build()
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
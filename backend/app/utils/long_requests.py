@@ -0,0 +1,80 @@
+"""
+长连接名额
+
+实时推送（SSE）等长连接会长时间占用一个请求处理线程。
+同步工作模式（gunicorn 默认的 sync worker）每个进程同一时间只处理一个请求，
+挂起一个长连接就会阻塞该进程的所有其他接口，因此这类请求先按当前服务器的并发能力申请名额：
+- gevent 等协程工作模式：长连接不占线程，不额外限制；
+- 多线程工作模式（gthread、开发服务器）：配置了 WORKER_THREADS 时，
+  最多占用 WORKER_THREADS - WORKER_RESERVED_THREADS 个线程，其余线程留给普通接口；
+- 单线程同步工作模式：不允许挂起长连接。
+"""
+
+import threading
+from typing import Dict, Optional
+
+from flask import request
+
+
+def _cooperative() -> bool:
+    """是否运行在 gevent 协程模式（threading 已被 monkey patch）"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+class LongRequestSlots:
+    """进程内长连接名额"""
+
+    def __init__(self):
+        self.worker_threads = 0
+        self.reserved_threads = 8
+        self._held = 0
+        self._lock = threading.Lock()
+        self._stats = {'granted': 0, 'refused': 0}
+
+    def init_app(self, app):
+        self.worker_threads = app.config.get('WORKER_THREADS', 0)
+        self.reserved_threads = app.config.get('WORKER_RESERVED_THREADS', 8)
+
+    def capacity(self, environ: Optional[Dict] = None) -> Optional[int]:
+        """当前请求所在进程可同时挂起的长连接数，None 表示不限制"""
+        if _cooperative():
+            return None
+        environ = environ if environ is not None else request.environ
+        if not environ.get('wsgi.multithread'):
+            return 0
+        if self.worker_threads:
+            return max(0, self.worker_threads - self.reserved_threads)
+        return None
+
+    def acquire(self) -> bool:
+        """申请一个名额，不支持长连接或名额已满时返回False"""
+        capacity = self.capacity()
+        with self._lock:
+            if capacity is not None and self._held >= capacity:
+                self._stats['refused'] += 1
+                return False
+            self._held += 1
+            self._stats['granted'] += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._held -= 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'held': self._held,
+                'workerThreads': self.worker_threads or None,
+                'reservedThreads': self.reserved_threads,
+                'granted': self._stats['granted'],
+                'refused': self._stats['refused']
+            }
+
+
+# 全局长连接名额
+long_requests = LongRequestSlots()
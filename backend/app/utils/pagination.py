@@ -0,0 +1,110 @@
+"""
+游标（keyset）分页
+
+列表接口按 (时间, id) 倒序排列，翻页时以上一页最后一行的排序键作为游标，
+用 WHERE (时间, id) < (游标) 代替 OFFSET 定位，任意深度翻页都只扫描一页的数据。
+游标对客户端是不透明的字符串，客户端只需原样回传响应中的 next_cursor。
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from flask import current_app
+from sqlalchemy import and_, or_
+from sqlalchemy.types import DateTime
+
+from app.utils.validators import ValidationError
+
+
+def encode_cursor(values: Sequence[Any], sort: str = 'time') -> str:
+    """把排序键编码为游标"""
+    payload = {
+        's': sort,
+        'k': [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    }
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, columns: Sequence, sort: str = 'time') -> List[Any]:
+    """
+    解析游标，按排序列的类型还原排序键
+
+    游标格式错误、与排序列数量不符或来自其他排序方式时抛出 ValidationError。
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        keys = payload['k']
+        if payload.get('s') != sort or len(keys) != len(columns):
+            raise ValueError
+        values = []
+        for column, value in zip(columns, keys):
+            if isinstance(column.type, DateTime):
+                value = datetime.fromisoformat(value)
+            elif not isinstance(value, (int, float)) or isinstance(value, bool):
+                raise ValueError
+            values.append(value)
+        return values
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise ValidationError('cursor 无效或与当前排序方式不匹配', 'cursor')
+
+
+def keyset_condition(columns: Sequence, values: Sequence):
+    """
+    倒序排列下“位于游标之后”的条件：(c1, c2, ...) < (v1, v2, ...)
+
+    展开为 c1 <= v1 AND (c1 < v1 OR (c1 = v1 AND c2 < v2) OR ...)，
+    首列的冗余上界让数据库可以直接在索引上做范围扫描。
+    """
+    branches = []
+    for i, column in enumerate(columns):
+        equals = [columns[j] == values[j] for j in range(i)]
+        branches.append(and_(*equals, column < values[i]))
+    return and_(columns[0] <= values[0], or_(*branches))
+
+
+def clamp_limit(limit: Optional[int], default: int) -> int:
+    """限制单页条数在 1 ~ PAGINATION_MAX_LIMIT 之间"""
+    max_limit = current_app.config.get('PAGINATION_MAX_LIMIT', 1000)
+    if limit is None:
+        limit = default
+    return max(1, min(limit, max_limit))
+
+
+def keyset_paginate(query, columns: Sequence, limit: int, cursor: Optional[str] = None,
+                    offset: int = 0, sort: str = 'time',
+                    key: Optional[Callable[[Any], Tuple]] = None) -> Tuple[List[Any], Optional[str]]:
+    """
+    按 columns 倒序分页
+
+    参数:
+        query: 已应用过滤条件的查询
+        columns: 排序列，最后一列须唯一（通常为主键 id）
+        limit: 单页条数
+        cursor: 上一页返回的 next_cursor；为空时从第一页开始
+        offset: 未提供游标时的偏移量（兼容原有 page/offset 参数）
+        sort: 排序方式标识，写入游标防止不同排序方式的游标混用
+        key: 从结果行取出排序键，默认按列名读取模型属性
+
+    返回:
+        (本页数据, 下一页游标)，没有更多数据时游标为None
+    """
+    if cursor:
+        query = query.filter(keyset_condition(columns, decode_cursor(cursor, columns, sort)))
+    query = query.order_by(*[column.desc() for column in columns])
+    if offset and not cursor:
+        query = query.offset(offset)
+
+    # 多取一行判断是否还有下一页
+    rows = query.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        values = key(last) if key else tuple(getattr(last, column.key) for column in columns)
+        next_cursor = encode_cursor(values, sort)
+    return rows, next_cursor
@@ -0,0 +1,68 @@
+"""
+工作单元
+
+修改接口在 with unit_of_work() 块内完成业务数据修改，并通过 audit_log 暂存审计日志，
+块结束时一次提交，业务数据与审计日志要么同时写入、要么同时回滚。
+每个请求的提交次数记录在响应头 X-DB-Commits 中，便于发现多次提交的回退。
+"""
+
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+from sqlalchemy import event
+
+from app import db
+from app.models.log import Log
+from app.utils.decorators import get_current_username, get_client_ip
+
+
+@contextmanager
+def unit_of_work():
+    """
+    请求内的工作单元
+
+    with 块正常结束时提交一次；块内抛出异常时回滚并继续抛出，由调用方返回错误响应。
+    """
+    try:
+        yield db.session
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def audit_log(module: str, action: str, details: str,
+              level: str = 'INFO', operator: str = None) -> Log:
+    """在当前事务中暂存一条审计日志，随工作单元一起提交"""
+    log = Log(
+        level=level,
+        module=module,
+        operator=operator or get_current_username() or 'system',
+        action=action,
+        details=details,
+        ip=get_client_ip() if has_request_context() else '127.0.0.1'
+    )
+    db.session.add(log)
+    return log
+
+
+def _count_commit(session):
+    if has_request_context():
+        g.db_commits = g.get('db_commits', 0) + 1
+
+
+def _reset_commit_count():
+    g.db_commits = 0
+
+
+def _add_commit_header(response):
+    response.headers['X-DB-Commits'] = str(g.get('db_commits', 0))
+    return response
+
+
+def init_unit_of_work(app):
+    """注册提交计数（会话 after_commit 事件）和响应头"""
+    if not event.contains(db.session, 'after_commit', _count_commit):
+        event.listen(db.session, 'after_commit', _count_commit)
+    app.before_request(_reset_commit_count)
+    app.after_request(_add_commit_header)
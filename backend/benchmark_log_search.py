@@ -0,0 +1,104 @@
+"""
+日志检索性能对比脚本
+
+在测试配置（内存 SQLite）下生成一批日志，分别用 LIKE 全表扫描和全文索引检索同样的关键词，
+输出两种方式的平均耗时和命中数。
+使用方法: python benchmark_log_search.py [--rows 200000] [--repeat 20]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import insert
+
+from app import create_app, db
+from app.models import Log
+from app.services.list_totals import list_totals
+from app.services.log_search import log_search
+
+
+MODULES = ['认证', '投喂管理', '环境监测', '设备管理', '告警管理']
+ACTIONS = ['用户登录', '执行投喂', '阈值警告', '设备上线', '设备故障', '更新配置', '处理告警']
+KEYWORDS = ['feeder-003', '通信中断', '溶解氧过低', 'operator-42']
+
+
+def generate_logs(rows: int, batch_size: int = 5000):
+    """批量生成测试日志"""
+    now = datetime.now()
+    for start in range(0, rows, batch_size):
+        batch = []
+        for i in range(start, min(start + batch_size, rows)):
+            device = f'feeder-{random.randint(1, 200):03d}'
+            detail = random.choice([
+                f'设备 {device} 执行自动投喂 {random.randint(30, 60)}kg',
+                f'设备 {device} 通信中断，请检查网络',
+                f'水温 {random.uniform(18, 30):.1f}°C，溶解氧过低',
+                f'设备 {device} 已上线',
+            ])
+            batch.append({
+                'level': random.choice(['INFO', 'INFO', 'WARNING', 'ERROR']),
+                'module': random.choice(MODULES),
+                'action': random.choice(ACTIONS),
+                'details': detail,
+                'operator': f'operator-{random.randint(1, 100)}',
+                'ip': '127.0.0.1',
+                'timestamp': now - timedelta(seconds=i * 30),
+                'created_at': now
+            })
+        db.session.execute(insert(Log), batch)
+    db.session.commit()
+
+
+def measure(keyword: str, repeat: int, sort: str = 'relevance', force_like: bool = False):
+    elapsed = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = log_search.search(keyword, per_page=50, sort=sort, force_like=force_like)
+        elapsed.append(time.perf_counter() - started)
+        # 总数缓存会掩盖计数开销，每次查询后清空
+        list_totals.clear()
+    return sum(elapsed) / len(elapsed) * 1000, result.total, result.mode
+
+
+def main():
+    parser = argparse.ArgumentParser(description='日志检索性能对比')
+    parser.add_argument('--rows', type=int, default=200000, help='生成的日志条数')
+    parser.add_argument('--repeat', type=int, default=20, help='每个关键词的查询次数')
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    app.config['SQLALCHEMY_ECHO'] = False
+
+    with app.app_context():
+        db.engine.echo = False
+        db.create_all()
+        log_search.ensure_index()
+
+        print(f'生成 {args.rows} 条日志...')
+        started = time.perf_counter()
+        generate_logs(args.rows)
+        print(f'写入耗时（含索引维护）: {time.perf_counter() - started:.2f}s\n')
+
+        # 索引(相关度) 为默认排序，索引(时间) 为 sort=time，与 LIKE 的排序方式相同
+        print(f'{"关键词":<14}{"命中数":>8}{"LIKE(ms)":>10}{"索引-相关度(ms)":>16}{"索引-时间(ms)":>14}')
+        for keyword in KEYWORDS:
+            like_ms, like_total, _ = measure(keyword, args.repeat, sort='time', force_like=True)
+            ranked_ms, index_total, mode = measure(keyword, args.repeat, sort='relevance')
+            recent_ms, _, _ = measure(keyword, args.repeat, sort='time')
+            if mode != 'fulltext':
+                print(f'{keyword:<14} 未使用全文索引，跳过')
+                continue
+            assert like_total == index_total, f'{keyword}: 命中数不一致 {like_total} != {index_total}'
+            print(f'{keyword:<14}{index_total:>8}{like_ms:>10.2f}{ranked_ms:>16.2f}{recent_ms:>14.2f}')
+
+
+if __name__ == '__main__':
+    main()
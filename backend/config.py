@@ -21,6 +21,118 @@ class Config:
     SESSION_COOKIE_SECURE = False  # 生产环境设置为True
     SESSION_COOKIE_SAMESITE = 'Lax'
     
+    # 环境数据批量上报单次最大条数
+    ENVIRONMENT_BATCH_MAX_SIZE = int(os.environ.get('ENVIRONMENT_BATCH_MAX_SIZE', 5000))
+    
+    # 降采样曲线单次最多返回的时间桶数，超出时自动改用更粗的桶宽度
+    ENVIRONMENT_SERIES_MAX_BUCKETS = int(os.environ.get('ENVIRONMENT_SERIES_MAX_BUCKETS', 2000))
+    
+    # 批量投喂量计算单次最大网箱数
+    FEEDING_BATCH_MAX_SIZE = int(os.environ.get('FEEDING_BATCH_MAX_SIZE', 10000))
+    
+    # 设备批量上传投喂记录：单次最大条数、每台设备在内存中保留的近期事件ID数（用于丢弃重传）
+    FEEDING_HISTORY_BATCH_MAX_SIZE = int(os.environ.get('FEEDING_HISTORY_BATCH_MAX_SIZE', 1000))
+    FEEDING_EVENT_RECENT_IDS = int(os.environ.get('FEEDING_EVENT_RECENT_IDS', 1000))
+    
+    # 投喂环境因子缓存配置
+    # 环境值先按量化步长取整再计算和匹配缓存（低于传感器精度），步长为0时按原始读数精确匹配
+    FEEDING_FACTOR_CACHE_SIZE = int(os.environ.get('FEEDING_FACTOR_CACHE_SIZE', 4096))
+    FEEDING_FACTOR_CACHE_TTL = 300.0
+    FEEDING_FACTOR_QUANTIZATION = {
+        'temperature': float(os.environ.get('FEEDING_QUANTIZE_TEMPERATURE', 0.1)),
+        'dissolved_oxygen': float(os.environ.get('FEEDING_QUANTIZE_DISSOLVED_OXYGEN', 0.1)),
+        'ph': float(os.environ.get('FEEDING_QUANTIZE_PH', 0.01)),
+    }
+    # 温度/溶解氧响应曲线使用预计算查找表（0.01步长线性插值）
+    FEEDING_FACTOR_LUT_ENABLED = True
+    
+    # 投喂计划调度配置（多进程部署时通过 service_leases 表选出唯一执行者）
+    FEEDING_SCHEDULER_ENABLED = os.environ.get('FEEDING_SCHEDULER_ENABLED', 'true').lower() == 'true'
+    FEEDING_SCHEDULER_LEASE_TTL = 30.0
+    FEEDING_SCHEDULER_SYNC_INTERVAL = 30.0
+    FEEDING_SCHEDULER_GRACE_PERIOD = 300.0
+    
+    # 统计计数器定期校准（秒）
+    STAT_COUNTER_RECONCILE_ENABLED = True
+    STAT_COUNTER_RECONCILE_INTERVAL = int(os.environ.get('STAT_COUNTER_RECONCILE_INTERVAL', 3600))
+    # 每次上报都会累加的计数器（监测样本数、投喂记录数）拆分的行数，减少并发写入的行锁等待
+    STAT_COUNTER_SHARDS = int(os.environ.get('STAT_COUNTER_SHARDS', 16))
+    
+    # 设备心跳：超过 DEVICE_HEARTBEAT_TIMEOUT 秒没有心跳的设备由清扫任务置为离线
+    DEVICE_HEARTBEAT_TIMEOUT = int(os.environ.get('DEVICE_HEARTBEAT_TIMEOUT', 90))
+    DEVICE_HEARTBEAT_INTERVAL = int(os.environ.get('DEVICE_HEARTBEAT_INTERVAL', 30))  # 设备上报心跳的最大间隔（秒）
+    DEVICE_HEARTBEAT_MAX_BATCH = 5000  # 单次心跳请求最多设备数
+    DEVICE_HEARTBEAT_UNKNOWN_TTL = 60  # 不存在的设备ID缓存时间（秒）
+    DEVICE_LIVENESS_SWEEP_ENABLED = True
+    DEVICE_LIVENESS_SWEEP_INTERVAL = 10  # 秒
+    
+    # 设备指令队列：设备长轮询拉取指令，下发后 COMMAND_ACK_TIMEOUT 秒未回执则重发，
+    # 超过有效期或重试次数用尽由清扫任务标记为过期
+    COMMAND_TTL = int(os.environ.get('COMMAND_TTL', 300))  # 指令有效期（秒）
+    COMMAND_ACK_TIMEOUT = 30  # 秒
+    COMMAND_MAX_ATTEMPTS = 3
+    COMMAND_LONG_POLL_TIMEOUT = 25  # 长轮询最长挂起时间（秒），应小于反向代理的读超时
+    COMMAND_RECHECK_INTERVAL = 5  # 挂起期间复查数据库的间隔（秒），用于取到其他进程入队的指令
+    COMMAND_FETCH_LIMIT = 20  # 单次最多下发指令数
+    COMMAND_MAX_WAITERS = 500  # 单个进程同时挂起的长轮询请求上限，另受 WORKER_THREADS 长连接名额限制
+    COMMAND_SWEEP_ENABLED = True
+    COMMAND_SWEEP_INTERVAL = 30  # 秒
+    
+    # 时间分区与数据保留（MySQL 按 timestamp 分区，过期数据整分区删除；其他数据库分批删除）
+    PARTITION_MAINTENANCE_ENABLED = True
+    PARTITION_MAINTENANCE_INTERVAL = 6 * 3600  # 秒
+    PARTITION_GRANULARITY = 'month'  # month / day
+    PARTITION_PRECREATE = 3  # 当前周期之后预建的分区数
+    # 各表保留天数，None 表示永久保留
+    DATA_RETENTION_DAYS = {
+        'environment_data': int(os.environ.get('ENVIRONMENT_DATA_RETENTION_DAYS', 365)),
+        'logs': int(os.environ.get('LOG_RETENTION_DAYS', 180)),
+    }
+    
+    # 环境数据写缓冲配置（单条上报先入队，后台线程批量落库）
+    INGEST_BUFFER_ENABLED = True
+    INGEST_QUEUE_MAXSIZE = int(os.environ.get('INGEST_QUEUE_MAXSIZE', 10000))
+    INGEST_FLUSH_BATCH_SIZE = 500
+    INGEST_FLUSH_INTERVAL = 1.0  # 秒
+    INGEST_FLUSH_MAX_RETRIES = 3
+    
+    # 列表接口单页最大条数（游标分页与 page/offset 分页共用）
+    PAGINATION_MAX_LIMIT = 1000
+    
+    # 列表总数：精确总数按过滤条件缓存（秒）；可估算且估算值超过阈值时返回估算值
+    LIST_TOTAL_CACHE_TTL = 10.0
+    LIST_TOTAL_CACHE_SIZE = 1024
+    LIST_TOTAL_EXACT_THRESHOLD = int(os.environ.get('LIST_TOTAL_EXACT_THRESHOLD', 100000))
+    
+    # 流式导出每批从数据库读取的行数（决定导出时的内存占用）
+    EXPORT_BATCH_SIZE = 5000
+    
+    # 最新读数缓存有效期（秒），多进程部署时为跨进程可见的最大延迟
+    LATEST_CACHE_TTL = 5.0
+    
+    # 配置缓存版本轮询间隔（秒），其他进程修改的配置最多延迟该时间可见
+    CONFIG_VERSION_POLL_INTERVAL = 1.0
+    
+    # 环境告警引擎：越限持续 ALERT_MIN_DURATION 秒才告警，回到阈值内侧回差范围才自动解除
+    ALERT_ENGINE_ENABLED = True
+    ALERT_STATE_REFRESH_INTERVAL = 30.0  # 设备位置与告警状态刷新周期（秒），阈值按配置版本刷新
+    ALERT_MIN_DURATION = int(os.environ.get('ALERT_MIN_DURATION', 60))
+    ALERT_HYSTERESIS = {'temperature': 0.5, 'dissolved_oxygen': 0.3, 'ph': 0.1}
+    
+    # 实时事件推送配置
+    EVENT_STREAM_MAX_SUBSCRIBERS = 200
+    EVENT_STREAM_QUEUE_SIZE = 100  # 单个连接的待发送事件上限
+    # 多进程部署时经 stream_events 表把事件转发给其他工作进程的订阅者
+    EVENT_STREAM_RELAY_ENABLED = True
+    EVENT_STREAM_POLL_INTERVAL = 1.0  # 中转线程读取其他进程事件的间隔（秒）
+    EVENT_STREAM_LISTENER_TTL = 10.0  # 监听登记有效期（秒），进程异常退出后超时不再接收转发
+    EVENT_STREAM_RETENTION = 60.0  # 中转事件保留时间（秒）
+    
+    # 工作进程并发：长连接（实时推送、指令长轮询）最多占用 WORKER_THREADS - WORKER_RESERVED_THREADS 个线程，
+    # 其余线程留给普通接口；WORKER_THREADS 为0表示不按线程数限制（gevent 协程模式或未知线程数）
+    WORKER_THREADS = int(os.environ.get('WORKER_THREADS', 0))
+    WORKER_RESERVED_THREADS = int(os.environ.get('WORKER_RESERVED_THREADS', 8))
+    
     # CORS配置
     CORS_ORIGINS = ['http://localhost:5173', 'http://127.0.0.1:5173', 'http://localhost:3000']
 
@@ -41,6 +153,13 @@ class TestingConfig(Config):
     """测试环境配置"""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    INGEST_BUFFER_ENABLED = False
+    FEEDING_SCHEDULER_ENABLED = False
+    STAT_COUNTER_RECONCILE_ENABLED = False
+    PARTITION_MAINTENANCE_ENABLED = False
+    DEVICE_LIVENESS_SWEEP_ENABLED = False
+    COMMAND_SWEEP_ENABLED = False
+    EVENT_STREAM_RELAY_ENABLED = False
 
 
 config = {
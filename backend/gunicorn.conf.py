@@ -0,0 +1,22 @@
+"""
+Gunicorn 生产部署配置
+
+实时推送（SSE）等长连接会长时间占用请求，必须使用多线程（gthread）或协程（gevent）工作模式，
+默认的 sync 工作模式下每个长连接会独占一个工作进程。
+线程数同时通过 WORKER_THREADS 传给应用，用于限制长连接最多占用的线程数。
+
+启动: gunicorn -c gunicorn.conf.py run:app
+"""
+
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('WORKER_THREADS', 32))
+
+# 长连接期间工作进程仍定期上报心跳，超时时间只影响卡死的进程
+timeout = 60
+graceful_timeout = 30
+
+raw_env = [f'WORKER_THREADS={threads if worker_class == "gthread" else 0}']
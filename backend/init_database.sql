@@ -20,14 +20,96 @@ CREATE TABLE IF NOT EXISTS users (
 
 -- 创建环境数据表
 CREATE TABLE IF NOT EXISTS environment_data (
-    id INT PRIMARY KEY AUTO_INCREMENT,
+    id INT NOT NULL AUTO_INCREMENT,
+    device_id VARCHAR(50) NULL,
+    pond_id INT NULL,
     timestamp DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
     temperature FLOAT NOT NULL,
     dissolved_oxygen FLOAT NOT NULL,
     ph FLOAT NOT NULL,
     water_flow FLOAT NOT NULL,
     created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    INDEX idx_environment_data_timestamp (timestamp)
+    PRIMARY KEY (id, timestamp),
+    INDEX idx_environment_data_timestamp (timestamp),
+    INDEX idx_environment_data_device_timestamp (device_id, timestamp),
+    INDEX idx_environment_data_pond_timestamp (pond_id, timestamp)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+-- 按月分区，后台维护任务从 pmax 中拆分出当前及未来的月份分区，过期分区整体删除
+PARTITION BY RANGE (TO_DAYS(timestamp)) (
+    PARTITION p_start VALUES LESS THAN (TO_DAYS('2024-01-01')),
+    PARTITION pmax VALUES LESS THAN MAXVALUE
+);
+
+-- 创建环境数据分钟聚合表
+CREATE TABLE IF NOT EXISTS environment_rollup_minute (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    device_id VARCHAR(50) NOT NULL DEFAULT '',
+    pond_id INT NOT NULL DEFAULT 0,
+    bucket_start DATETIME NOT NULL,
+    sample_count INT NOT NULL DEFAULT 0,
+    temperature_sum FLOAT NOT NULL DEFAULT 0,
+    temperature_min FLOAT NOT NULL,
+    temperature_max FLOAT NOT NULL,
+    dissolved_oxygen_sum FLOAT NOT NULL DEFAULT 0,
+    dissolved_oxygen_min FLOAT NOT NULL,
+    dissolved_oxygen_max FLOAT NOT NULL,
+    ph_sum FLOAT NOT NULL DEFAULT 0,
+    ph_min FLOAT NOT NULL,
+    ph_max FLOAT NOT NULL,
+    water_flow_sum FLOAT NOT NULL DEFAULT 0,
+    water_flow_min FLOAT NOT NULL,
+    water_flow_max FLOAT NOT NULL,
+    UNIQUE KEY uq_environment_rollup_minute_key (device_id, pond_id, bucket_start),
+    INDEX ix_environment_rollup_minute_bucket_start (bucket_start),
+    INDEX idx_environment_rollup_minute_pond (pond_id, bucket_start)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- 创建环境数据小时聚合表
+CREATE TABLE IF NOT EXISTS environment_rollup_hour (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    device_id VARCHAR(50) NOT NULL DEFAULT '',
+    pond_id INT NOT NULL DEFAULT 0,
+    bucket_start DATETIME NOT NULL,
+    sample_count INT NOT NULL DEFAULT 0,
+    temperature_sum FLOAT NOT NULL DEFAULT 0,
+    temperature_min FLOAT NOT NULL,
+    temperature_max FLOAT NOT NULL,
+    dissolved_oxygen_sum FLOAT NOT NULL DEFAULT 0,
+    dissolved_oxygen_min FLOAT NOT NULL,
+    dissolved_oxygen_max FLOAT NOT NULL,
+    ph_sum FLOAT NOT NULL DEFAULT 0,
+    ph_min FLOAT NOT NULL,
+    ph_max FLOAT NOT NULL,
+    water_flow_sum FLOAT NOT NULL DEFAULT 0,
+    water_flow_min FLOAT NOT NULL,
+    water_flow_max FLOAT NOT NULL,
+    UNIQUE KEY uq_environment_rollup_hour_key (device_id, pond_id, bucket_start),
+    INDEX ix_environment_rollup_hour_bucket_start (bucket_start),
+    INDEX idx_environment_rollup_hour_pond (pond_id, bucket_start)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- 创建环境数据日聚合表
+CREATE TABLE IF NOT EXISTS environment_rollup_day (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    device_id VARCHAR(50) NOT NULL DEFAULT '',
+    pond_id INT NOT NULL DEFAULT 0,
+    bucket_start DATETIME NOT NULL,
+    sample_count INT NOT NULL DEFAULT 0,
+    temperature_sum FLOAT NOT NULL DEFAULT 0,
+    temperature_min FLOAT NOT NULL,
+    temperature_max FLOAT NOT NULL,
+    dissolved_oxygen_sum FLOAT NOT NULL DEFAULT 0,
+    dissolved_oxygen_min FLOAT NOT NULL,
+    dissolved_oxygen_max FLOAT NOT NULL,
+    ph_sum FLOAT NOT NULL DEFAULT 0,
+    ph_min FLOAT NOT NULL,
+    ph_max FLOAT NOT NULL,
+    water_flow_sum FLOAT NOT NULL DEFAULT 0,
+    water_flow_min FLOAT NOT NULL,
+    water_flow_max FLOAT NOT NULL,
+    UNIQUE KEY uq_environment_rollup_day_key (device_id, pond_id, bucket_start),
+    INDEX ix_environment_rollup_day_bucket_start (bucket_start),
+    INDEX idx_environment_rollup_day_pond (pond_id, bucket_start)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- 创建环境告警阈值表
@@ -39,6 +121,7 @@ CREATE TABLE IF NOT EXISTS environment_thresholds (
     dissolved_oxygen_max FLOAT NOT NULL DEFAULT 8.0,
     ph_min FLOAT NOT NULL DEFAULT 7.0,
     ph_max FLOAT NOT NULL DEFAULT 8.0,
+    revision INT NOT NULL DEFAULT 1,
     updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
@@ -50,11 +133,13 @@ CREATE TABLE IF NOT EXISTS devices (
     status VARCHAR(20) NOT NULL DEFAULT 'offline',
     active BOOLEAN NOT NULL DEFAULT TRUE,
     location VARCHAR(100) NOT NULL,
+    last_seen DATETIME NULL,
     created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     INDEX idx_devices_type (type),
     INDEX idx_devices_status (status),
-    INDEX idx_devices_location (location)
+    INDEX idx_devices_location (location),
+    INDEX idx_devices_status_last_seen (status, last_seen)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- 创建设备配置表
@@ -62,6 +147,7 @@ CREATE TABLE IF NOT EXISTS device_configs (
     id INT PRIMARY KEY AUTO_INCREMENT,
     device_id VARCHAR(50) NOT NULL,
     config JSON NOT NULL,
+    revision INT NOT NULL DEFAULT 1,
     created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (device_id) REFERENCES devices(id) ON DELETE CASCADE,
@@ -78,6 +164,7 @@ CREATE TABLE IF NOT EXISTS device_linkage_config (
     temp_threshold FLOAT NOT NULL DEFAULT 25.0,
     oxygen_threshold FLOAT NOT NULL DEFAULT 6.0,
     ph_threshold FLOAT NOT NULL DEFAULT 7.5,
+    revision INT NOT NULL DEFAULT 1,
     updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
@@ -89,6 +176,7 @@ CREATE TABLE IF NOT EXISTS feeding_plans (
     time TIME NOT NULL,
     amount FLOAT NOT NULL,
     status VARCHAR(20) NOT NULL DEFAULT 'active',
+    last_fired_at DATETIME NULL,
     created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (device_id) REFERENCES devices(id) ON DELETE CASCADE,
@@ -104,10 +192,33 @@ CREATE TABLE IF NOT EXISTS feeding_history (
     time DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
     type VARCHAR(20) NOT NULL,
     operator VARCHAR(50) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'done',
+    event_id VARCHAR(64) NULL,
     created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (device_id) REFERENCES devices(id) ON DELETE CASCADE,
     INDEX idx_feeding_history_device_id (device_id),
-    INDEX idx_feeding_history_time (time)
+    INDEX idx_feeding_history_time (time),
+    UNIQUE KEY uq_feeding_history_device_event (device_id, event_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- 创建设备指令表（按设备排队下发，设备长轮询拉取、批量回执）
+CREATE TABLE IF NOT EXISTS device_commands (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    device_id VARCHAR(50) NOT NULL,
+    command VARCHAR(50) NOT NULL,
+    payload JSON NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    history_id INT NULL,
+    result VARCHAR(255) NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    sent_at DATETIME NULL,
+    expires_at DATETIME NOT NULL,
+    completed_at DATETIME NULL,
+    FOREIGN KEY (device_id) REFERENCES devices(id) ON DELETE CASCADE,
+    FOREIGN KEY (history_id) REFERENCES feeding_history(id) ON DELETE SET NULL,
+    INDEX idx_device_commands_device_status (device_id, status, id),
+    INDEX idx_device_commands_status_expires (status, expires_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- 创建告警表
@@ -121,10 +232,16 @@ CREATE TABLE IF NOT EXISTS alerts (
     resolved BOOLEAN NOT NULL DEFAULT FALSE,
     resolved_at DATETIME NULL,
     resolved_by VARCHAR(50) NULL,
+    device_id VARCHAR(50) NULL,
+    pond_id INT NULL,
+    metric VARCHAR(30) NULL,
+    open_key VARCHAR(120) NULL,
     created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
     INDEX idx_alerts_level (level),
     INDEX idx_alerts_resolved (resolved),
-    INDEX idx_alerts_time (time)
+    INDEX idx_alerts_time (time),
+    INDEX idx_alerts_source_metric (device_id, pond_id, metric, resolved),
+    UNIQUE KEY uq_alerts_open_key (open_key)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- 创建告警通知设置表
@@ -141,7 +258,7 @@ CREATE TABLE IF NOT EXISTS alert_notification_settings (
 
 -- 创建系统日志表
 CREATE TABLE IF NOT EXISTS logs (
-    id INT PRIMARY KEY AUTO_INCREMENT,
+    id INT NOT NULL AUTO_INCREMENT,
     timestamp DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
     level VARCHAR(20) NOT NULL,
     module VARCHAR(50) NOT NULL,
@@ -150,9 +267,73 @@ CREATE TABLE IF NOT EXISTS logs (
     details TEXT NOT NULL,
     ip VARCHAR(50) NOT NULL,
     created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, timestamp),
     INDEX idx_logs_timestamp (timestamp),
     INDEX idx_logs_level (level),
     INDEX idx_logs_module (module)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+PARTITION BY RANGE (TO_DAYS(timestamp)) (
+    PARTITION p_start VALUES LESS THAN (TO_DAYS('2024-01-01')),
+    PARTITION pmax VALUES LESS THAN MAXVALUE
+);
+
+-- 创建日志全文检索表（logs 的文本列经 ngram 分词建立全文索引，由触发器同步）
+CREATE TABLE IF NOT EXISTS logs_search (
+    log_id INT PRIMARY KEY,
+    content TEXT NOT NULL,
+    FULLTEXT INDEX ft_logs_search_content (content) WITH PARSER ngram
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TRIGGER logs_search_insert AFTER INSERT ON logs FOR EACH ROW
+    INSERT INTO logs_search (log_id, content)
+    VALUES (NEW.id, CONCAT_WS(' ', NEW.action, NEW.details, NEW.operator, NEW.module));
+
+CREATE TRIGGER logs_search_update AFTER UPDATE ON logs FOR EACH ROW
+    UPDATE logs_search SET content = CONCAT_WS(' ', NEW.action, NEW.details, NEW.operator, NEW.module)
+    WHERE log_id = NEW.id;
+
+CREATE TRIGGER logs_search_delete AFTER DELETE ON logs FOR EACH ROW
+    DELETE FROM logs_search WHERE log_id = OLD.id;
+
+-- 创建统计计数器表（总览统计读取，写入方增量维护）
+CREATE TABLE IF NOT EXISTS stat_counters (
+    name VARCHAR(100) PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0,
+    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- 创建配置版本表（配置修改时递增，各进程据此使本地配置缓存失效）
+CREATE TABLE IF NOT EXISTS config_versions (
+    name VARCHAR(50) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- 创建服务租约表（多进程部署时选出后台任务的唯一执行者）
+CREATE TABLE IF NOT EXISTS service_leases (
+    name VARCHAR(50) PRIMARY KEY,
+    owner VARCHAR(100) NOT NULL,
+    expires_at DATETIME NOT NULL,
+    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- 创建实时事件中转表（多进程部署时把事件转发给其他工作进程的订阅者，短期保留）
+CREATE TABLE IF NOT EXISTS stream_events (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    origin VARCHAR(100) NOT NULL,
+    type VARCHAR(20) NOT NULL,
+    device_id VARCHAR(50),
+    pond_id INT,
+    payload JSON NOT NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX ix_stream_events_created_at (created_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- 创建实时事件监听进程表（有订阅者的进程定期续期）
+CREATE TABLE IF NOT EXISTS stream_listeners (
+    owner VARCHAR(100) PRIMARY KEY,
+    expires_at DATETIME NOT NULL,
+    INDEX ix_stream_listeners_expires_at (expires_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- 插入默认环境阈值
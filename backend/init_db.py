@@ -17,6 +17,10 @@ from app.models import (
     Device, DeviceConfig, DeviceLinkageConfig,
     FeedingPlan, FeedingHistory, Alert, Log, Pond
 )
+from app.services.environment_rollup import rebuild_rollups
+from app.services.log_search import log_search
+from app.services.partitions import partition_manager
+from app.services.stat_counters import stat_counters
 from datetime import datetime, timedelta, time
 import random
 
@@ -28,6 +32,10 @@ def init_database():
     with app.app_context():
         print("开始创建数据库表...")
         db.create_all()
+        # 日志全文索引不在模型元数据中，单独创建
+        log_search.ensure_index()
+        # MySQL 上将环境数据表和日志表转换为按时间分区
+        partition_manager.setup()
         print("数据库表创建完成！")
         
         # 检查是否已有数据（检查设备数据）
@@ -198,6 +206,13 @@ def init_database():
             db.session.add(log)
         
         db.session.commit()
+        
+        # 根据示例环境数据生成聚合表
+        rebuild_rollups()
+        
+        # 按初始数据校准统计计数器
+        stat_counters.reconcile()
+        
         print("初始数据插入完成！")
         print("\n测试账户信息:")
         print("  用户名: admin  密码: admin123")